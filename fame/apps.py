@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FameConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "fame"
+
+    def ready(self):
+        # register the signal handlers:
+        from fame import signals  # noqa: F401
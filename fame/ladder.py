@@ -0,0 +1,76 @@
+import copy
+from bisect import bisect_left, bisect_right
+
+# in-memory fame ladder: all fame levels sorted by their numeric value, loaded once until invalidated.
+# The next lower/higher level of a level is found by bisection without querying the database. The save and delete
+# signals of FameLevels drop the ladder (see fame.signals). Levels created without signals (bulk_create, by other
+# processes) are not known to the ladder, it is reloaded once when a level is missing.
+
+_ladder = None
+
+
+class FameLadder:
+    """All fame levels sorted by numeric value."""
+
+    def __init__(self, levels):
+        self.levels = sorted(levels, key=lambda level: level.numeric_value)
+        self.numeric_values = [level.numeric_value for level in self.levels]
+        self.by_id = {level.id: level for level in self.levels}
+        self.by_name = {level.name.lower(): level for level in self.levels}
+
+    def next_lower(self, numeric_value: int):
+        """The level with the highest numeric value below the given one, None if there is none."""
+        index = bisect_left(self.numeric_values, numeric_value)
+        return self.levels[index - 1] if index > 0 else None
+
+    def next_higher(self, numeric_value: int):
+        """The level with the lowest numeric value above the given one, None if there is none."""
+        index = bisect_right(self.numeric_values, numeric_value)
+        return self.levels[index] if index < len(self.levels) else None
+
+
+def invalidate(*args, **kwargs):
+    """Drop the ladder, it is reloaded on the next use."""
+    global _ladder
+    _ladder = None
+
+
+def get_ladder() -> FameLadder:
+    global _ladder
+    from fame.models import FameLevels
+
+    if _ladder is None:
+        _ladder = FameLadder(FameLevels.objects.all())
+    return _ladder
+
+
+def _copy(level):
+    # hand out copies, callers may modify the level:
+    return None if level is None else copy.copy(level)
+
+
+def _containing(mapping: str, key) -> FameLadder:
+    # the ladder, reloaded if the key is missing in the given mapping of it:
+    if key not in getattr(get_ladder(), mapping):
+        invalidate()
+    return get_ladder()
+
+
+def get(level_id: int):
+    """Return the fame level with the given id, None if there is none."""
+    return _copy(_containing("by_id", level_id).by_id.get(level_id))
+
+
+def get_by_name(name: str):
+    """Return the fame level with the given name (case-insensitive), None if there is none."""
+    return _copy(_containing("by_name", name.lower()).by_name.get(name.lower()))
+
+
+def next_lower(level):
+    """Return the next lower fame level of the given one, None if it is the lowest."""
+    return _copy(_containing("by_id", level.id).next_lower(level.numeric_value))
+
+
+def next_higher(level):
+    """Return the next higher fame level of the given one, None if it is the highest."""
+    return _copy(_containing("by_id", level.id).next_higher(level.numeric_value))
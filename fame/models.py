@@ -4,6 +4,8 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.functional import cached_property
 
+from fame import ladder
+
 
 rnd.seed(42)
 
@@ -40,6 +42,16 @@ class FameUsers(AbstractUser):
     def username(self):
         return self.email
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored join date, saves that keep it do not affect the data derived from it
+        # (see socialnetwork.signals):
+        loaded = dict(zip(field_names, values))
+        if "date_joined" in loaded:
+            instance._loaded_date_joined = loaded["date_joined"]
+        return instance
+
     class Meta:
         db_table = "fame_users"
 
@@ -51,11 +63,7 @@ class FameLevels(models.Model):
     numeric_value = models.IntegerField(null=False)
 
     def get_next_lower_fame_level(self):
-        next_lower_fame = (
-            FameLevels.objects.filter(numeric_value__lt=self.numeric_value)
-            .order_by("-numeric_value")
-            .first()
-        )
+        next_lower_fame = ladder.next_lower(self)
         if next_lower_fame:
             return next_lower_fame
         else:
@@ -64,11 +72,7 @@ class FameLevels(models.Model):
             )
 
     def get_next_higher_fame_level(self):
-        next_higher_fame = (
-            FameLevels.objects.filter(numeric_value__gt=self.numeric_value)
-            .order_by("numeric_value")
-            .first()
-        )
+        next_higher_fame = ladder.next_higher(self)
         if next_higher_fame:
             return next_higher_fame
         else:
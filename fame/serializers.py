@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from fame.models import ExpertiseAreas, FameUsers, Fame
+from socialnetwork import instrumentation, taxonomy
 
 
 class FameUsersSerializer(serializers.ModelSerializer):
@@ -10,6 +11,10 @@ class FameUsersSerializer(serializers.ModelSerializer):
         model = FameUsers
         fields = ["email", "fame"]
 
+    @instrumentation.timed("serializer")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_fame(self, fame_user: FameUsers):
         ret = {}
         return ret
@@ -22,11 +27,24 @@ class ExpertiseAreasSerializer(serializers.ModelSerializer):
         model = ExpertiseAreas
         fields = ["label", "parent_expertise_area"]
 
+    @staticmethod
+    def setup_eager_loading(expertise_areas):
+        """Prefetch the ancestors of all expertise areas of a queryset with a single query."""
+        return expertise_areas.prefetch_related(taxonomy.prefetch_ancestors())
+
+    @instrumentation.timed("serializer")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_parent_expertise_area(self, expertise_area: ExpertiseAreas):
-        if expertise_area.parent_expertise_area is None:
+        if expertise_area.parent_expertise_area_id is None:
             return None
-        # recursion up to the root expertise area:
-        return ExpertiseAreasSerializer(expertise_area.parent_expertise_area).data
+        # nest the chain of ancestors up to the root expertise area, it is read from the closure table in one query
+        # (or prefetched):
+        parent = None
+        for ancestor in reversed(taxonomy.ancestor_chain(expertise_area)):
+            parent = {"label": ancestor.label, "parent_expertise_area": parent}
+        return parent
 
 
 class FameSerializer(serializers.ModelSerializer):
@@ -38,8 +56,57 @@ class FameSerializer(serializers.ModelSerializer):
         model = Fame
         fields = ["user", "expertise_area", "score"]
 
+    @staticmethod
+    def setup_eager_loading(fame):
+        """Load everything the serializer needs for a queryset of fame in a constant number of queries."""
+        return fame.select_related("expertise_area", "fame_level").prefetch_related(
+            taxonomy.prefetch_ancestors("expertise_area__ancestor_paths")
+        )
+
+    @instrumentation.timed("serializer")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_score(self, fame: Fame):
         return {
             "name": fame.fame_level.name,
             "numeric": fame.fame_level.numeric_value,
         }
+
+
+@instrumentation.timed("serializer")
+def serialize_fame(fame) -> list:
+    """Fast path of FameSerializer for read-only endpoints: serialize a queryset of fame from .values() rows with two
+    queries, the fame with expertise areas and fame levels and the ancestors of the expertise areas. The data is the
+    same as the one of FameSerializer."""
+    rows = list(
+        fame.values(
+            "user_id",
+            "expertise_area_id",
+            "expertise_area__label",
+            "expertise_area__parent_expertise_area_id",
+            "fame_level__name",
+            "fame_level__numeric_value",
+        )
+    )
+    # nested chain of ancestors per expertise area, see ExpertiseAreasSerializer.get_parent_expertise_area:
+    parents = {}
+    for area_id, labels in taxonomy.ancestor_labels({row["expertise_area_id"] for row in rows}).items():
+        parent = None
+        for label in reversed(labels):
+            parent = {"label": label, "parent_expertise_area": parent}
+        parents[area_id] = parent
+
+    return [
+        {
+            "user": row["user_id"],
+            "expertise_area": {
+                "label": row["expertise_area__label"],
+                "parent_expertise_area": None
+                if row["expertise_area__parent_expertise_area_id"] is None
+                else parents.get(row["expertise_area_id"]),
+            },
+            "score": {"name": row["fame_level__name"], "numeric": row["fame_level__numeric_value"]},
+        }
+        for row in rows
+    ]
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from fame import ladder
+from fame.models import FameLevels
+
+
+# get_next_lower/higher_fame_level work on a snapshot of the fame levels, drop it whenever one of them changes:
+@receiver(post_save, sender=FameLevels, dispatch_uid="fame_ladder_fame_levels_saved")
+@receiver(post_delete, sender=FameLevels, dispatch_uid="fame_ladder_fame_levels_deleted")
+def invalidate_fame_ladder(sender, **kwargs):
+    ladder.invalidate()
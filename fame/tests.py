@@ -1,9 +1,13 @@
 from django.test import TestCase
 from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.utils import json
 
+from fame import ladder
 from fame.models import ExpertiseAreas, Fame, FameLevels
+from fame.serializers import FameSerializer, serialize_fame
 from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
+from socialnetwork.renderers import FastJSONRenderer
 
 
 # Create your tests here.
@@ -74,3 +78,73 @@ class ModelTests(TestCase):
             fl = FameLevels.objects.get(
                 name="Dangerous Bullshitter"
             ).get_next_lower_fame_level()
+
+    def test_fame_ladder(self):
+        self.addCleanup(ladder.invalidate)
+        newbie = FameLevels.objects.get(name="Newbie")
+        newbie.get_next_higher_fame_level()
+        # the ladder is loaded once:
+        with self.assertNumQueries(0):
+            self.assertEqual(newbie.get_next_higher_fame_level().name, "Knowledgeable")
+            self.assertEqual(ladder.get_by_name("super pro").name, "Super Pro")
+        # reloaded once if a level is missing:
+        with self.assertNumQueries(1):
+            self.assertIsNone(ladder.get_by_name("unknown"))
+
+        # and reloaded after changes:
+        level = FameLevels.objects.create(name="Almost Knowledgeable", numeric_value=newbie.numeric_value + 1)
+        self.assertEqual(newbie.get_next_higher_fame_level(), level)
+        self.assertEqual(level.get_next_lower_fame_level(), newbie)
+        level.delete()
+        self.assertEqual(newbie.get_next_higher_fame_level().name, "Knowledgeable")
+
+    def _level_without_signals(self, numeric_value: int) -> FameLevels:
+        # the ladder is loaded before, bulk_create sends no signals, like a level created by another process:
+        ladder.get_ladder()
+        (level,) = FameLevels.objects.bulk_create([FameLevels(name="Almost Knowledgeable", numeric_value=numeric_value)])
+        return level
+
+    def test_fame_ladder_levels_without_signals(self):
+        self.addCleanup(ladder.invalidate)
+        newbie = FameLevels.objects.get(name="Newbie")
+        level = self._level_without_signals(newbie.numeric_value + 1)
+        self.assertEqual(ladder.get(level.id), level)
+        level.delete()
+        level = self._level_without_signals(newbie.numeric_value + 1)
+        self.assertEqual(ladder.get_by_name("ALMOST KNOWLEDGEABLE"), level)
+        level.delete()
+        level = self._level_without_signals(newbie.numeric_value + 1)
+        self.assertEqual(level.get_next_lower_fame_level(), newbie)
+        self.assertEqual(newbie.get_next_higher_fame_level(), level)
+
+
+class StreamingTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_streamed_users_equal_regular_response(self):
+        self.client.login(email="a@b.de", password="test")
+        expected = self.client.get(reverse("fame:fame_users")).content
+        response = self.client.get(reverse("fame:fame_users") + "?stream=1")
+        self.assertTrue(response.streaming)
+        self.assertEqual(b"".join(response.streaming_content), expected)
+
+
+class FastSerializationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_fame_same_bytes(self):
+        child = ExpertiseAreas.objects.create(label="Child", parent_expertise_area=ExpertiseAreas.objects.get(id=1))
+        Fame.objects.create(user_id=1, expertise_area=child, fame_level=FameLevels.objects.first())
+        fame = Fame.objects.all()
+        expected = JSONRenderer().render(FameSerializer(FameSerializer.setup_eager_loading(fame), many=True).data)
+        self.assertEqual(FastJSONRenderer().render(serialize_fame(fame)), expected)
+        with self.assertNumQueries(2):
+            serialize_fame(fame)
+
+    def test_endpoint_same_bytes(self):
+        self.client.login(email="a@b.de", password="test")
+        fame = Fame.objects.filter(user__email="a@b.de")
+        self.assertEqual(
+            self.client.get(reverse("fame:fame_fulllist")).content,
+            JSONRenderer().render(FameSerializer(fame, many=True).data),
+        )
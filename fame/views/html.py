@@ -4,7 +4,6 @@ from django.views.decorators.http import require_http_methods
 
 from fame.serializers import FameSerializer
 from socialnetwork import api
-from socialnetwork.api import _get_social_network_user
 from socialnetwork.models import SocialNetworkUsers
 
 
@@ -15,7 +14,7 @@ def fame_list(request):
     userid = request.GET.get("userid", None)
     user = None
     if userid is None:
-        user = _get_social_network_user(request.user)
+        user = request.social_network_user
     else:
         try:
             user = SocialNetworkUsers.objects.get(id=userid)
@@ -24,7 +23,7 @@ def fame_list(request):
 
     user, fame = api.fame(user)
     context = {
-        "fame": FameSerializer(fame, many=True).data,
+        "fame": FameSerializer(FameSerializer.setup_eager_loading(fame), many=True).data,
         "user": user if user else "",
     }
     return render(request, "fame.html", context=context)
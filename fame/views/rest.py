@@ -1,4 +1,5 @@
 from rest_framework import permissions, status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
@@ -6,10 +7,10 @@ from fame.models import FameUsers, ExpertiseAreas
 from fame.serializers import (
     FameUsersSerializer,
     ExpertiseAreasSerializer,
-    FameSerializer,
+    serialize_fame,
 )
-from socialnetwork import api
-from socialnetwork.api import _get_social_network_user
+from socialnetwork import api, streaming
+from socialnetwork.renderers import FastJSONRenderer
 
 
 class ExpertiseAreasApiView(APIView):
@@ -17,7 +18,7 @@ class ExpertiseAreasApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        posts = ExpertiseAreas.objects.all()
+        posts = ExpertiseAreasSerializer.setup_eager_loading(ExpertiseAreas.objects.all())
         serializer = ExpertiseAreasSerializer(posts, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -40,7 +41,14 @@ class FameUsersApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
+        """
+        List all users. With the query parameter stream=1, the list is streamed, see socialnetwork.streaming.
+        """
         posts = FameUsers.objects.all()
+        if streaming.wants_stream(request):
+            return streaming.streaming_response(
+                request, streaming.json_array(posts, lambda chunk: FameUsersSerializer(chunk, many=True).data)
+            )
         serializer = FameUsersSerializer(posts, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -51,12 +59,13 @@ class FameUsersApiView(APIView):
 class FameListApiView(APIView):
     # add permission to check if user is authenticated
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     # 1. List all
     def get(self, request, *args, **kwargs):
-        user, _fame = api.fame(_get_social_network_user(request.user))
-        serializer = FameSerializer(_fame, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        user, _fame = api.fame(request.social_network_user)
+        # read-only, use the fast path of FameSerializer
+        return Response(serialize_fame(_fame), status=status.HTTP_200_OK)
 
     def post(self, request, *args, **kwargs):
         raise NotImplementedError()
@@ -1,52 +1,30 @@
 from faker import Faker
+import multiprocessing
 import random as rnd
 import time
+from datetime import timedelta
 
-from fame.models import Fame, FameLevels
-from socialnetwork import api
-from socialnetwork.models import TruthRatings, SocialNetworkUsers, Posts, ExpertiseAreas
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
 
+from fame.models import Fame, FameLevels, FameUsers
+from socialnetwork import api, leaderboard, post_stats, similarity, similarity_table
+from socialnetwork.magic_AI import classify_many, preload
+from socialnetwork.models import (
+    TruthRatings,
+    SocialNetworkUsers,
+    Posts,
+    ExpertiseAreas,
+    PostExpertiseAreasAndRatings,
+    UserRatings,
+)
 
-def create_fake_data():
-    # make fake data generation deterministic:
-    rnd.seed(42)
-    fake = Faker()
-    fake.seed_instance(420)
-
-    # Create users:
-    for _ in range(20):
-        time.sleep(0.001)
-        first_name = fake.first_name()
-        last_name = fake.last_name()
-        email = f"{first_name.lower()}.{last_name.lower()}@example.com"
-
-        user = SocialNetworkUsers.objects.create(
-            email=email,
-            first_name=first_name,
-            last_name=last_name,
-        )
-        user.set_password("test")
-        user.save()
-
-    user = SocialNetworkUsers.objects.create(
-        email="a@b.de",
-        first_name="Tom",
-        last_name="Petersson",
-    )
-    user.set_password("test")
-    user.save()
-
-    users = SocialNetworkUsers.objects.all().order_by('id')
-
-    # create followers:
-    for user in users:
-        # create followers for this user:
-        sample = rnd.sample(
-            list(users.exclude(id=user.id)), 7
-        )
-        for u in sample:
-            user.follows.add(u)
 
+def _create_reference_data():
+    """Create the taxonomy of expertise areas, the truth ratings and the fame levels."""
     # Create expertise areas:
     ExpertiseAreas.objects.create(label="Computer Science")
     ExpertiseAreas.objects.create(label="Sports")
@@ -127,6 +105,49 @@ def create_fake_data():
     FameLevels.objects.create(name="Serious Bullshitter", numeric_value=-300)
     FameLevels.objects.create(name="Dangerous Bullshitter", numeric_value=-1000)
 
+
+def create_fake_data():
+    # make fake data generation deterministic:
+    rnd.seed(42)
+    fake = Faker()
+    fake.seed_instance(420)
+
+    # Create users:
+    for _ in range(20):
+        time.sleep(0.001)
+        first_name = fake.first_name()
+        last_name = fake.last_name()
+        email = f"{first_name.lower()}.{last_name.lower()}@example.com"
+
+        user = SocialNetworkUsers.objects.create(
+            email=email,
+            first_name=first_name,
+            last_name=last_name,
+        )
+        user.set_password("test")
+        user.save()
+
+    user = SocialNetworkUsers.objects.create(
+        email="a@b.de",
+        first_name="Tom",
+        last_name="Petersson",
+    )
+    user.set_password("test")
+    user.save()
+
+    users = SocialNetworkUsers.objects.all().order_by('id')
+
+    # create followers:
+    for user in users:
+        # create followers for this user:
+        sample = rnd.sample(
+            list(users.exclude(id=user.id)), 7
+        )
+        for u in sample:
+            user.follows.add(u)
+
+    _create_reference_data()
+
     expertise_areas = ExpertiseAreas.objects.all().order_by('id')
 
     # Create fame:
@@ -183,3 +204,264 @@ def create_fake_data():
                     "score": rnd.randint(0, 15),
                 },
             )
+
+
+# scaled mode for load testing (create_fake_data --users N --posts M --followers K):
+# all rows are written with bulk_create in batches instead of one create() per row, random choices are pre-sampled as
+# numpy arrays of ids from a seeded generator, so that the same arguments on the same database always produce the
+# same data. The contents of the posts (the expensive part) are generated and classified in batches that can be
+# spread over a pool of processes, each batch is seeded with its index so the result does not depend on the number
+# of processes. Derived data the bulk writes bypass (engagement counters, bullshitters leaderboard, similar users) is
+# rebuilt at the end, the search index is kept in sync by its triggers.
+
+BATCH_SIZE = 5000
+# number of distinct first and last names the users are drawn from:
+NAME_POOL_SIZE = 1000
+# number of expertise areas with fame per user and of ratings per post:
+FAME_PER_USER = 15
+RATINGS_PER_POST = 3
+
+
+def _noop_progress(stage: str, done: int, total: int):
+    pass
+
+
+def _insert_social_network_users(user_ids):
+    # bulk_create does not support multi-table inheritance, the child rows of the FameUsers are inserted directly
+    meta = SocialNetworkUsers._meta
+    quote_name = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s, %s) VALUES (%%s, %%s)" % (
+        quote_name(meta.db_table),
+        quote_name(meta.pk.column),
+        quote_name(meta.get_field("is_banned").column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(user_id, False) for user_id in user_ids])
+
+
+def _distinct_offsets(rng, count: int, size: int, k: int):
+    """Sample count rows of k distinct offsets in [1, size - 1]: added to an index modulo size they give k distinct
+    other indices in [0, size)."""
+    if k == 0:
+        return np.empty((count, 0), dtype=np.int64)
+    gaps = rng.integers(1, (size - 1) // k + 1, size=(count, k))
+    return np.cumsum(gaps, axis=1)
+
+
+def _generate_posts(task):
+    """Generate the contents of a batch of posts and classify them, returns (content, [(expertise area id, truth
+    rating id), ...], contains bullshit) per post. Runs in the worker processes."""
+    batch, size, seed = task
+    fake = Faker()
+    fake.seed_instance(seed + batch)
+    contents = [fake.text().strip() for _ in range(size)]
+    return [
+        (
+            content,
+            [
+                (epa["expertise_area"].id, epa["truth_rating"].id if epa["truth_rating"] else None)
+                for epa in _expertise_areas
+            ],
+            Posts._contains_bullshit(_expertise_areas),
+        )
+        for content, _expertise_areas in zip(contents, classify_many(contents))
+    ]
+
+
+def create_scaled_fake_data(
+    users: int,
+    posts: int,
+    followers: int = 7,
+    seed: int = 42,
+    processes: int = 1,
+    batch_size: int = BATCH_SIZE,
+    progress=None,
+) -> dict:
+    """Add users users following followers other (new) users each, posts posts and their ratings to the database.
+    The users are named user<id>@example.com with the password "test". The expertise areas, truth ratings and fame
+    levels of create_fake_data are created if there are none. progress is called with (stage, done, total) after every
+    batch. Returns the number of created rows per table."""
+    if not connection.features.can_return_rows_from_bulk_insert:
+        raise ValueError("The scaled mode needs a database that returns the ids of bulk inserted rows")
+    if posts and not users:
+        raise ValueError("The posts need at least one generated user as author")
+    progress = progress or _noop_progress
+    rng = np.random.default_rng(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+    counts = {}
+
+    if not ExpertiseAreas.objects.exists():
+        _create_reference_data()
+    area_ids = np.array(ExpertiseAreas.objects.order_by("id").values_list("id", flat=True))
+    levels = list(FameLevels.objects.filter(numeric_value__gte=-50).order_by("id").values_list("id", "numeric_value"))
+    level_ids = np.array([level_id for level_id, _ in levels])
+    level_values = np.array([value for _, value in levels])
+
+    # users:
+    first_names = np.array([fake.first_name() for _ in range(NAME_POOL_SIZE)])
+    last_names = np.array([fake.last_name() for _ in range(NAME_POOL_SIZE)])
+    password = make_password("test")
+    now = timezone.now()
+    first_id = (FameUsers.objects.aggregate(Max("id"))["id__max"] or 0) + 1
+    user_ids = np.empty(users, dtype=np.int64)
+    for start in range(0, users, batch_size):
+        size = min(batch_size, users - start)
+        firsts = first_names[rng.integers(0, NAME_POOL_SIZE, size)]
+        lasts = last_names[rng.integers(0, NAME_POOL_SIZE, size)]
+        batch = [
+            FameUsers(
+                email=f"user{first_id + start + i}@example.com",
+                first_name=firsts[i],
+                last_name=lasts[i],
+                password=password,
+                date_joined=now - timedelta(seconds=start + i),
+            )
+            for i in range(size)
+        ]
+        with transaction.atomic():
+            FameUsers.objects.bulk_create(batch)
+            _insert_social_network_users([user.id for user in batch])
+        user_ids[start : start + size] = [user.id for user in batch]
+        progress("users", start + size, users)
+    counts["users"] = users
+
+    # follows, each user follows followers distinct other users:
+    followers = max(min(followers, users - 1), 0)
+    follows = SocialNetworkUsers.follows.through
+    counts["follows"] = 0
+    for start in range(0, users if followers else 0, batch_size):
+        size = min(batch_size, users - start)
+        rows = np.arange(start, start + size)
+        followed = user_ids[(rows[:, None] + _distinct_offsets(rng, size, users, followers)) % users]
+        follows.objects.bulk_create(
+            [
+                follows(from_socialnetworkusers_id=user_id, to_socialnetworkusers_id=other_id)
+                for user_id, others in zip(user_ids[rows].tolist(), followed.tolist())
+                for other_id in others
+            ],
+            batch_size=batch_size,
+        )
+        counts["follows"] += size * followers
+        progress("follows", start + size, users)
+
+    # fame in FAME_PER_USER random expertise areas, members of the communities of 80% of the areas with fame >= 100:
+    per_user = min(FAME_PER_USER, len(area_ids))
+    communities = SocialNetworkUsers.communities.through
+    counts["fame"] = counts["communities"] = 0
+    for start in range(0, users, batch_size):
+        size = min(batch_size, users - start)
+        areas = area_ids[np.argsort(rng.random((size, len(area_ids))), axis=1)[:, :per_user]]
+        level_indices = rng.integers(0, len(level_ids), (size, per_user))
+        joins = (level_values[level_indices] >= 100) & (rng.random((size, per_user)) < 0.8)
+        batch_user_ids = np.repeat(user_ids[start : start + size], per_user)
+        with transaction.atomic():
+            Fame.objects.bulk_create(
+                [
+                    Fame(user_id=user_id, expertise_area_id=area_id, fame_level_id=level_id)
+                    for user_id, area_id, level_id in zip(
+                        batch_user_ids.tolist(), areas.ravel().tolist(), level_ids[level_indices].ravel().tolist()
+                    )
+                ],
+                batch_size=batch_size,
+            )
+            communities.objects.bulk_create(
+                [
+                    communities(socialnetworkusers_id=user_id, expertiseareas_id=area_id)
+                    for user_id, area_id in zip(batch_user_ids[joins.ravel()].tolist(), areas[joins].tolist())
+                ],
+                batch_size=batch_size,
+            )
+        counts["fame"] += size * per_user
+        counts["communities"] += int(joins.sum())
+        progress("fame", start + size, users)
+
+    # posts: every post cites an earlier post, every sixth one replies to an earlier post:
+    tasks = [(batch, min(batch_size, posts - start), seed) for batch, start in enumerate(range(0, posts, batch_size))]
+    post_ids = np.array(Posts.objects.order_by("id").values_list("id", flat=True), dtype=np.int64)
+    first_post = len(post_ids)
+    post_ids = np.concatenate([post_ids, np.empty(posts, dtype=np.int64)])
+    raters = max(min(RATINGS_PER_POST, users - 1), 0)
+    counts["posts"] = counts["ratings"] = 0
+    if processes == 1 or len(tasks) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        batches = map(_generate_posts, tasks)
+        pool = None
+    else:
+        # the snapshot of the classifier is loaded before the processes are forked, so that they never touch the
+        # database:
+        preload()
+        pool = multiprocessing.get_context("fork").Pool(processes)
+        batches = pool.imap(_generate_posts, tasks)
+    try:
+        for generated in batches:
+            size = len(generated)
+            known = first_post + counts["posts"]
+            authors = user_ids[rng.integers(0, users, size)]
+            if known:
+                cites = post_ids[rng.integers(0, known, size)]
+                replies = np.where(rng.integers(0, 6, size) == 0, post_ids[rng.integers(0, known, size)], 0)
+            else:
+                cites = replies = np.zeros(size, dtype=np.int64)
+            batch = [
+                Posts(
+                    content=content,
+                    author_id=author_id,
+                    cites_id=cite_id or None,
+                    replies_to_id=reply_id or None,
+                    published=not contains_bullshit,
+                )
+                for (content, _, contains_bullshit), author_id, cite_id, reply_id in zip(
+                    generated, authors.tolist(), cites.tolist(), replies.tolist()
+                )
+            ]
+            rater_indices = (rng.integers(0, users, size)[:, None] + _distinct_offsets(rng, size, users, raters)) % users
+            with transaction.atomic():
+                Posts.objects.bulk_create(batch)
+                PostExpertiseAreasAndRatings.objects.bulk_create(
+                    [
+                        PostExpertiseAreasAndRatings(
+                            post_id=post.id,
+                            expertise_area_id=area_id,
+                            truth_rating_id=truth_rating_id,
+                            post_submitted=post.submitted,
+                        )
+                        for post, (_, classification, _) in zip(batch, generated)
+                        for area_id, truth_rating_id in classification
+                    ],
+                    batch_size=batch_size,
+                )
+                UserRatings.objects.bulk_create(
+                    [
+                        UserRatings(
+                            post_id=post.id,
+                            user_id=user_id,
+                            type=UserRatings.RATING_TYPES[rating_type][0],
+                            score=score,
+                        )
+                        for post, user_indices, types, scores in zip(
+                            batch,
+                            rater_indices.tolist(),
+                            rng.integers(0, len(UserRatings.RATING_TYPES), (size, raters)).tolist(),
+                            rng.integers(0, 16, (size, raters)).tolist(),
+                        )
+                        for user_id, rating_type, score in zip(user_ids[user_indices].tolist(), types, scores)
+                    ],
+                    batch_size=batch_size,
+                )
+            post_ids[known : known + size] = [post.id for post in batch]
+            counts["posts"] += size
+            counts["ratings"] += size * raters
+            progress("posts", counts["posts"], posts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # derived data:
+    progress("derived data", 0, 1)
+    post_stats.recompute()
+    leaderboard.refresh(Fame.objects.filter(user_id__gte=first_id))
+    similarity.invalidate()
+    similarity_table.mark_stale()
+    progress("derived data", 1, 1)
+    return counts
@@ -0,0 +1,299 @@
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import unquote, unquote_to_bytes, urlencode, urlsplit
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model, login
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import Resolver404, resolve
+
+# offline replay of a request log against the in-process WSGI or ASGI application (see the replay command):
+# the log is a JSONL file with one request per line, {"method": ..., "path": ..., "user": ..., "body": ...}. Every user
+# of the log is logged in once before the replay, the requests carry the session and CSRF cookies of their user, so
+# the whole middleware stack (sessions, CSRF, authentication) runs as in production. The requests are sent by a pool
+# of concurrency workers, at most rate requests per second: request i is scheduled at i / rate seconds after the start
+# and its latency is measured from that point, so that time spent waiting for a free worker is included (an overloaded
+# application shows up as growing latencies instead of a lower request rate). The results are aggregated per endpoint,
+# i.e. per method and URL pattern.
+
+# upper bounds of the buckets of the latency histograms in milliseconds:
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+PERCENTILES = (50, 95, 99)
+
+
+class Entry:
+    """A request of the log."""
+
+    __slots__ = ("method", "path", "query_string", "user", "body", "content_type", "endpoint")
+
+    def __init__(self, method: str, path: str, user: str = None, body=None, content_type: str = "application/json"):
+        self.method = method.upper()
+        url = urlsplit(path)
+        self.path = url.path
+        self.query_string = url.query
+        self.user = user
+        self.content_type = content_type
+        if body is None:
+            self.body = b""
+        elif isinstance(body, str):
+            self.body = body.encode()
+        elif content_type == "application/x-www-form-urlencoded":
+            self.body = urlencode(body, doseq=True).encode()
+        else:
+            self.body = json.dumps(body).encode()
+        try:
+            self.endpoint = f"{self.method} /{resolve(self.path).route}"
+        except Resolver404:
+            self.endpoint = f"{self.method} (unresolved)"
+
+
+def read_log(lines) -> list:
+    """Parse the lines of a JSONL request log, blank lines are skipped. Raises a ValueError for invalid lines."""
+    entries = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            entries.append(
+                Entry(
+                    record.get("method", "GET"),
+                    record["path"],
+                    record.get("user"),
+                    record.get("body"),
+                    record.get("content_type", "application/json"),
+                )
+            )
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid request in line {number}: {e!r}")
+    return entries
+
+
+class Credentials:
+    """Session and CSRF cookies of a logged in (or anonymous) user."""
+
+    __slots__ = ("cookie", "csrf_token")
+
+    def __init__(self, user=None):
+        request = HttpRequest()
+        request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+        if user is not None:
+            login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+            request.session.save()
+        self.csrf_token = get_token(request)
+        cookies = {settings.CSRF_COOKIE_NAME: request.META["CSRF_COOKIE"]}
+        if user is not None:
+            cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+        self.cookie = "; ".join(f"{name}={value}" for name, value in cookies.items())
+
+
+def log_in(entries: list) -> dict:
+    """Log in all users of the entries, returns their credentials by email (None for anonymous requests)."""
+    emails = {entry.user for entry in entries if entry.user is not None}
+    users = {user.email: user for user in get_user_model().objects.filter(email__in=emails)}
+    unknown = emails - set(users)
+    if unknown:
+        raise ValueError(f"Unknown users: {', '.join(sorted(unknown))}")
+    credentials = {email: Credentials(user) for email, user in users.items()}
+    credentials[None] = Credentials()
+    return credentials
+
+
+def _csrf_header() -> str:
+    # e.g. HTTP_X_CSRFTOKEN -> x-csrftoken
+    return settings.CSRF_HEADER_NAME.removeprefix("HTTP_").replace("_", "-").lower()
+
+
+def _wsgi_call(application, entry: Entry, credentials: Credentials, host: str) -> int:
+    environ = {
+        "REQUEST_METHOD": entry.method,
+        "PATH_INFO": unquote_to_bytes(entry.path).decode("iso-8859-1"),
+        "QUERY_STRING": entry.query_string,
+        "SCRIPT_NAME": "",
+        "SERVER_NAME": host,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": host,
+        "HTTP_COOKIE": credentials.cookie,
+        settings.CSRF_HEADER_NAME: credentials.csrf_token,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(entry.body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if entry.body:
+        environ["CONTENT_TYPE"] = entry.content_type
+        environ["CONTENT_LENGTH"] = str(len(entry.body))
+    status = []
+    response = application(environ, lambda status_line, headers, exc_info=None: status.append(status_line))
+    try:
+        # consume the whole response, e.g. of streaming responses:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+    return int(status[0].split(" ", 1)[0])
+
+
+async def _asgi_call(application, entry: Entry, credentials: Credentials, host: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": entry.method,
+        "scheme": "http",
+        "path": unquote(entry.path),
+        "raw_path": entry.path.encode(),
+        "query_string": entry.query_string.encode(),
+        "root_path": "",
+        "headers": [
+            (b"host", host.encode()),
+            (b"cookie", credentials.cookie.encode()),
+            (_csrf_header().encode(), credentials.csrf_token.encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": (host, 80),
+    }
+    if entry.body:
+        scope["headers"] += [
+            (b"content-type", entry.content_type.encode()),
+            (b"content-length", str(len(entry.body)).encode()),
+        ]
+    status = []
+    sent = asyncio.Event()
+    messages = [{"type": "http.request", "body": entry.body, "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # the client only disconnects once the whole response was sent:
+        await sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            sent.set()
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Result:
+    """Outcome of a replayed request: the status code (None if the application raised) and the latency in seconds."""
+
+    __slots__ = ("endpoint", "status", "latency")
+
+    def __init__(self, endpoint: str, status: int, latency: float):
+        self.endpoint = endpoint
+        self.status = status
+        self.latency = latency
+
+
+def _schedule(count: int, rate: float):
+    # start times relative to the start of the replay, None for as fast as possible
+    return [None] * count if not rate else [i / rate for i in range(count)]
+
+
+def replay_wsgi(
+    application, entries: list, credentials: dict, concurrency: int = 1, rate: float = None, host: str = "localhost"
+) -> list:
+    """Replay the entries against a WSGI application with concurrency threads, returns one Result per entry."""
+    schedule = _schedule(len(entries), rate)
+    start = time.perf_counter()
+
+    def call(index: int) -> Result:
+        entry = entries[index]
+        if schedule[index] is not None:
+            time.sleep(max(0.0, start + schedule[index] - time.perf_counter()))
+            sent = start + schedule[index]
+        else:
+            sent = time.perf_counter()
+        try:
+            status = _wsgi_call(application, entry, credentials[entry.user], host)
+        except Exception:
+            status = None
+        return Result(entry.endpoint, status, time.perf_counter() - sent)
+
+    if concurrency == 1:
+        # in the calling thread, e.g. to share the connection of a test case:
+        return [call(index) for index in range(len(entries))]
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(call, range(len(entries))))
+
+
+def replay_asgi(
+    application, entries: list, credentials: dict, concurrency: int = 1, rate: float = None, host: str = "localhost"
+) -> list:
+    """Replay the entries against an ASGI application with at most concurrency requests in flight, returns one Result
+    per entry."""
+    schedule = _schedule(len(entries), rate)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(index: int) -> Result:
+            entry = entries[index]
+            if schedule[index] is not None:
+                await asyncio.sleep(max(0.0, start + schedule[index] - loop.time()))
+                sent = start + schedule[index]
+            async with semaphore:
+                if schedule[index] is None:
+                    sent = loop.time()
+                try:
+                    status = await _asgi_call(application, entry, credentials[entry.user], host)
+                except Exception:
+                    status = None
+            return Result(entry.endpoint, status, loop.time() - sent)
+
+        return await asyncio.gather(*(call(index) for index in range(len(entries))))
+
+    # unlike asyncio.run, the thread-sensitive (synchronous) parts of the application run in the calling thread:
+    return async_to_sync(run)()
+
+
+def summarize(results: list, duration: float) -> dict:
+    """Aggregate the results per endpoint: number of requests, throughput in requests per second over the duration of
+    the replay, status codes, errors (server errors and exceptions), latency percentiles and histogram in
+    milliseconds. The histogram maps the upper bound of every bucket to the number of requests in it."""
+    endpoints = {}
+    for result in results:
+        endpoints.setdefault(result.endpoint, []).append(result)
+    summary = {}
+    for endpoint, endpoint_results in sorted(endpoints.items()):
+        latencies = np.array([result.latency * 1000 for result in endpoint_results])
+        statuses = {}
+        for result in endpoint_results:
+            key = "exception" if result.status is None else str(result.status)
+            statuses[key] = statuses.get(key, 0) + 1
+        counts = np.bincount(np.searchsorted(BUCKETS_MS, latencies), minlength=len(BUCKETS_MS) + 1)
+        summary[endpoint] = {
+            "requests": len(endpoint_results),
+            "throughput_rps": round(len(endpoint_results) / duration, 3) if duration > 0 else None,
+            "statuses": statuses,
+            "errors": sum(1 for result in endpoint_results if result.status is None or result.status >= 500),
+            **{
+                f"p{percentile}_ms": round(float(latency), 3)
+                for percentile, latency in zip(PERCENTILES, np.percentile(latencies, PERCENTILES))
+            },
+            "histogram_ms": {
+                str(bound): int(count) for bound, count in zip([*BUCKETS_MS, "+Inf"], counts.tolist()) if count
+            },
+        }
+    return summary
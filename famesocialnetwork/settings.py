@@ -44,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "socialnetwork.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "socialnetwork.middleware.ProfilingMiddleware",
+    "socialnetwork.middleware.SocialNetworkUserMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -65,7 +68,8 @@ REST_FRAMEWORK = {
 MASTER_BASE_DIR = _pathlib.Path(__file__).parent
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # the Django template backend, measuring the template time of socialnetwork.instrumentation
+        "BACKEND": "socialnetwork.instrumentation.TimedDjangoTemplates",
         "DIRS": [MASTER_BASE_DIR.joinpath("templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -88,6 +92,21 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # take the write lock at the start of a transaction and wait for it instead of failing immediately when
+        # concurrent writers (e.g. the moderation workers) upgrade a read to a write
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+    }
+}
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# holds derived per-user data, e.g. the follows and communities of socialnetwork.follow_graph. The local memory cache is
+# not shared between processes, deployments with several worker processes should configure a shared backend instead
+# (e.g. django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
 
@@ -141,3 +160,45 @@ STATICFILES_DIRS = [BASE_DIR / "assets"]
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "fame.FameUsers"
+
+# Moderate submitted posts in the background instead of within the request,
+# requires running the workers: python manage.py run_moderation_workers
+SOCIALNETWORK_ASYNC_MODERATION = False
+
+# Log queries taking at least this many milliseconds with their parameters, call site and query plan to
+# SOCIALNETWORK_SLOW_QUERY_LOG (None disables the log), summarize the log with: python manage.py slow_queries
+SOCIALNETWORK_SLOW_QUERY_MS = 100
+SOCIALNETWORK_SLOW_QUERY_LOG = BASE_DIR / "slow_queries.log"
+
+# Bearer token of scrapers allowed to read /metrics without being logged in as staff, e.g. a Prometheus server
+# (authorization: {credentials: ...} in its scrape config). None allows staff users only
+SOCIALNETWORK_METRICS_TOKEN = None
+
+# Staff users can profile single requests with the X-Profile header or the profile query parameter ("cprofile" or
+# "sample"), the newest SOCIALNETWORK_PROFILE_KEEP profiles are stored here and listed at /profiles/ (None disables it)
+SOCIALNETWORK_PROFILE_DIR = BASE_DIR / "profiles"
+SOCIALNETWORK_PROFILE_KEEP = 50
+# interval of the stack samples of requests profiled in "sample" mode
+SOCIALNETWORK_PROFILE_INTERVAL_MS = 1
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "slow_queries": {
+            "class": "logging.handlers.RotatingFileHandler",
+            "filename": SOCIALNETWORK_SLOW_QUERY_LOG,
+            "maxBytes": 10 * 1024 * 1024,
+            "backupCount": 5,
+            # the file is only created once the first slow query is logged
+            "delay": True,
+            "formatter": "message",
+        },
+    },
+    "loggers": {
+        "socialnetwork.slow_queries": {"handlers": ["slow_queries"], "level": "WARNING", "propagate": False},
+    },
+}
@@ -1,16 +1,34 @@
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from io import StringIO
+from unittest.mock import PropertyMock, patch
+from urllib.parse import urlsplit
+
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 from django.db.models import F
 import random as rnd
 
+import fame.urls
+import socialnetwork.urls
 from socialnetwork import api
 
 # make tests deterministic:
 rnd.seed(42)
 
 from fame.models import Fame, ExpertiseAreas, FameLevels
-from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
+from famesocialnetwork.fakedata import create_scaled_fake_data
+from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users, user_mapping
 from socialnetwork.models import (
+    BullshitterEntries,
     Posts,
+    PostStats,
     SocialNetworkUsers,
     TruthRatings,
     UserRatings,
@@ -553,3 +571,290 @@ class StudentTasksTests(TestCase):
                              0.4375, 0.4375, 0.4375, 0.4375, 0.375, 0.375, 0.3125]
         self.assertTrue(user_ids == true_user_ids)
         self.assertTrue(similarities == true_similarities)
+
+
+class ScaledFakeDataTests(TestCase):
+    """Tests for the scaled mode of create_fake_data (create_fake_data --users N --posts M --followers K)."""
+
+    fixtures = ["database_dump.json"]
+
+    def _create(self, **kwargs):
+        first_user = SocialNetworkUsers.objects.order_by("-id").first().id + 1
+        first_post = Posts.objects.order_by("-id").first().id + 1
+        stages = []
+        counts = create_scaled_fake_data(
+            users=30, posts=60, followers=5, batch_size=7, progress=lambda *args: stages.append(args), **kwargs
+        )
+        return counts, stages, first_user, first_post
+
+    def test_counts_and_consistency(self):
+        counts, stages, first_user, first_post = self._create()
+        self.assertEqual(counts["users"], 30)
+        self.assertEqual(counts["posts"], 60)
+        self.assertEqual(counts["follows"], 30 * 5)
+        self.assertEqual(counts["ratings"], 60 * 3)
+        self.assertIn(("posts", 60, 60), stages)
+
+        users = SocialNetworkUsers.objects.filter(id__gte=first_user)
+        self.assertEqual(users.count(), 30)
+        self.assertTrue(self.client.login(email=f"user{first_user}@example.com", password="test"))
+        for user in users:
+            # distinct other generated users
+            followed = list(user.follows.values_list("id", flat=True))
+            self.assertEqual(len(set(followed)), 5)
+            self.assertNotIn(user.id, followed)
+            self.assertTrue(all(other_id >= first_user for other_id in followed))
+            self.assertEqual(Fame.objects.filter(user=user).count(), counts["fame"] // 30)
+
+        posts = Posts.objects.filter(id__gte=first_post)
+        self.assertEqual(posts.count(), 60)
+        self.assertFalse(posts.exclude(author_id__gte=first_user).exists())
+        self.assertFalse(posts.filter(cites__isnull=True).exists())
+        self.assertFalse(posts.filter(cites_id__gte=F("id")).exists())
+        for post in posts:
+            pears = PostExpertiseAreasAndRatings.objects.filter(post=post)
+            self.assertTrue(pears.exists())
+            self.assertFalse(pears.exclude(post_submitted=post.submitted).exists())
+            self.assertEqual(
+                post.published,
+                not any(pear.truth_rating and pear.truth_rating.numeric_value < 0 for pear in pears),
+            )
+            raters = list(UserRatings.objects.filter(post=post).values_list("user_id", flat=True))
+            self.assertEqual(len(set(raters)), 3)
+
+        # the derived data is in sync:
+        for stats in PostStats.objects.filter(post_id__gte=first_post):
+            likes = UserRatings.objects.filter(post_id=stats.post_id, type=UserRatings.LIKE)
+            self.assertEqual(stats.like_count, likes.count())
+            self.assertEqual(stats.citation_count, Posts.objects.filter(cites_id=stats.post_id).count())
+        self.assertEqual(PostStats.objects.filter(post_id__gte=first_post).count(), 60)
+        self.assertEqual(
+            BullshitterEntries.objects.filter(user_id__gte=first_user).count(),
+            Fame.objects.filter(user_id__gte=first_user, fame_level__numeric_value__lt=0).count(),
+        )
+
+    def test_deterministic(self):
+        _, _, first_user, first_post = self._create()
+        _, _, second_user, second_post = self._create()
+
+        def contents(start, end):
+            posts = Posts.objects.filter(id__gte=start, id__lt=end).order_by("id")
+            return list(posts.values_list("content", flat=True))
+
+        self.assertEqual(contents(first_post, second_post), contents(second_post, second_post + 60))
+        def names(users):
+            return list(users.order_by("id").values_list("first_name", "last_name"))
+
+        self.assertEqual(
+            names(SocialNetworkUsers.objects.filter(id__gte=first_user, id__lt=second_user)),
+            names(SocialNetworkUsers.objects.filter(id__gte=second_user)),
+        )
+
+    def test_processes(self):
+        _, _, _, first_post = self._create()
+        expected = list(Posts.objects.filter(id__gte=first_post).order_by("id").values_list("content", flat=True))
+        _, _, _, second_post = self._create(processes=2)
+        self.assertEqual(
+            list(Posts.objects.filter(id__gte=second_post).order_by("id").values_list("content", flat=True)), expected
+        )
+
+    def test_unsupported_database(self):
+        with patch.object(
+            type(connection.features), "can_return_rows_from_bulk_insert", new_callable=PropertyMock, return_value=False
+        ):
+            with self.assertRaises(ValueError):
+                create_scaled_fake_data(users=1, posts=1)
+            with self.assertRaises(CommandError):
+                call_command("create_fake_data", users=1, stdout=StringIO())
+        self.assertFalse(SocialNetworkUsers.objects.filter(email__startswith="user").exists())
+
+
+class ReplayTests(TestCase):
+    """Tests for the replay of request logs (replay command)."""
+
+    fixtures = ["database_dump.json"]
+
+    LOG = [
+        {"method": "GET", "path": "/sn/api/posts?limit=3", "user": "a@b.de"},
+        {"method": "GET", "path": "/sn/api/expertise_areas/1/posts", "user": "a@b.de"},
+        {"method": "GET", "path": "/sn/api/expertise_areas/2/posts", "user": "a@b.de"},
+        {"method": "POST", "path": "/sn/api/follow/bulk", "user": "a@b.de", "body": {"user_ids": [2, 3]}},
+        {"method": "GET", "path": "/sn/api/posts"},
+        {"method": "GET", "path": "/does/not/exist", "user": "a@b.de"},
+    ]
+
+    def setUp(self):
+        # like the test client, keep the connection of the test case open across the replayed requests:
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, "requests.jsonl")
+        self.report = os.path.join(directory.name, "report.json")
+        with open(self.log, "w") as file:
+            file.writelines(json.dumps(entry) + "\n" for entry in self.LOG)
+
+    def _replay(self, interface: str) -> dict:
+        call_command(
+            "replay", self.log, interface=interface, host="testserver", loops=2, json=self.report, stdout=StringIO()
+        )
+        with open(self.report) as file:
+            return json.load(file)["endpoints"]
+
+    def test_replay(self):
+        for interface in ("wsgi", "asgi"):
+            with self.subTest(interface=interface):
+                endpoints = self._replay(interface)
+                self.assertEqual(
+                    endpoints["GET /sn/api/expertise_areas/<int:expertise_area_id>/posts"]["statuses"], {"200": 4}
+                )
+                self.assertEqual(endpoints["GET /sn/api/posts"]["statuses"], {"200": 2, "403": 2})
+                # CSRF and session authentication passed:
+                self.assertEqual(endpoints["POST /sn/api/follow/bulk"]["statuses"], {"200": 2})
+                self.assertEqual(endpoints["GET (unresolved)"]["statuses"], {"404": 2})
+                for result in endpoints.values():
+                    self.assertEqual(result["errors"], 0)
+                    self.assertEqual(sum(result["histogram_ms"].values()), result["requests"])
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.assertEqual(user.follows.filter(id__in=[2, 3]).count(), 2)
+
+    def test_invalid_log(self):
+        with open(self.log, "a") as file:
+            file.write('{"method": "GET"}\n')
+        with self.assertRaises(CommandError):
+            call_command("replay", self.log, stdout=StringIO())
+        with open(self.log, "w") as file:
+            file.write('{"path": "/sn/api/posts", "user": "nobody@example.com"}\n')
+        with self.assertRaises(CommandError):
+            call_command("replay", self.log, stdout=StringIO())
+
+
+class QueryBudgetTests(TestCase):
+    """Maximum number of queries and database time per request of every endpoint of socialnetwork.urls and fame.urls,
+    at the scale of the fixture and after adding 100 followed users with 2000 posts. An endpoint issuing more queries
+    at the larger scale runs a query per row (N+1)."""
+
+    fixtures = ["database_dump.json"]
+
+    # (method, path, data, maximum number of queries) of the requests of the user a@b.de (id 21, made staff for the
+    # community members endpoint), data is sent form-encoded if it is a dict and as JSON if it is a string.
+    # Writes are undone by the next request or rolled back (see ROLLED_BACK), so that the requests can be repeated. The
+    # posts of the fixture have no counters (see socialnetwork.post_stats), the post endpoints need one more query for
+    # them at the smaller scale.
+    REQUESTS = [
+        ("GET", "/sn/api/posts", None, 10),
+        ("GET", "/sn/api/posts?limit=20", None, 10),
+        # a post without negative truth ratings, the user is neither lowered nor banned:
+        ("POST", "/sn/api/posts", {"text": "Budget post 0"}, 20),
+        # the feed of an area reads a page per area of its subtree, area 10 has no descendants:
+        ("GET", "/sn/api/expertise_areas/10/posts", None, 8),
+        ("GET", "/sn/api/expertise_areas/10/posts?limit=20", None, 8),
+        ("GET", "/sn/html/timeline", None, 10),
+        ("GET", "/sn/html/timeline?search=the", None, 9),
+        ("GET", "/sn/html/timeline?search=the&mode=fulltext", None, 9),
+        ("GET", "/sn/html/timeline?expertise_area=10", None, 12),
+        ("POST", "/sn/html/toggle_community_mode", {}, 5),
+        ("GET", "/sn/html/timeline", None, 10),
+        ("POST", "/sn/html/toggle_community_mode", {}, 5),
+        ("POST", "/sn/api/follow", {"user_id": 2}, 11),
+        ("POST", "/sn/api/unfollow", {"user_id": 2}, 9),
+        ("POST", "/sn/api/follow/bulk", '{"user_ids": [2, 3]}', 14),
+        ("POST", "/sn/api/unfollow/bulk", '{"user_ids": [2, 3]}', 12),
+        ("POST", "/sn/api/communities/10/members", '{"user_ids": [2, 3]}', 8),
+        ("DELETE", "/sn/api/communities/10/members", '{"user_ids": [2, 3]}', 8),
+        ("GET", "/sn/html/bullshitters/", None, 22),
+        ("GET", "/sn/html/bullshitters/?expertise_area=7", None, 4),
+        ("POST", "/sn/html/join_community", {"community_id": 14}, 8),
+        ("POST", "/sn/html/leave_community", {"community_id": 14}, 8),
+        ("GET", "/sn/html/similar_users/", None, 8),
+        ("GET", "/fame/api/expertise_areas", None, 4),
+        ("POST", "/fame/api/expertise_areas", {"label": "Budget area"}, 4),
+        ("GET", "/fame/api/users", None, 3),
+        ("GET", "/fame/api/fame", None, 8),
+        ("GET", "/fame/html/fame", None, 8),
+        ("GET", "/fame/html/fame?userid=2", None, 5),
+    ]
+    # writes that no other request undoes, run in a transaction that is rolled back:
+    ROLLED_BACK = {("POST", "/sn/api/posts"), ("POST", "/fame/api/expertise_areas")}
+    # (view, method) of the endpoints without a budget and why:
+    EXEMPT = {
+        ("fame:fame_users", "POST"): "always raises PermissionError",
+        ("fame:fame_fulllist", "POST"): "always raises NotImplementedError",
+    }
+    # maximum database time of a request in seconds, generous to not depend on the speed of the machine:
+    DB_TIME_BUDGET = 0.5
+
+    def setUp(self):
+        SocialNetworkUsers.objects.filter(email=user_mapping["P"]).update(is_staff=True)
+        self.client.login(email=user_mapping["P"], password="test")
+
+    def _request(self, method: str, path: str, data, capture: bool = False):
+        """Send a request, returns the response and the captured queries (None unless capture is set)."""
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) if capture else nullcontext() as queries:
+                if data is None:
+                    response = self.client.generic(method, path)
+                elif isinstance(data, dict):
+                    response = self.client.post(path, data)
+                else:
+                    response = self.client.generic(method, path, data, content_type="application/json")
+            if (method, urlsplit(path).path) in self.ROLLED_BACK:
+                transaction.set_rollback(True)
+        return response, queries
+
+    def _measure(self) -> list:
+        """Send all requests twice and return the number of queries and the database time of the second round, i.e.
+        with warm caches and materialized timelines."""
+        for method, path, data, _ in self.REQUESTS:
+            self._request(method, path, data)
+        measured = []
+        for method, path, data, budget in self.REQUESTS:
+            response, queries = self._request(method, path, data, capture=True)
+            self.assertLess(response.status_code, 400, f"{method} {path}")
+            measured.append((len(queries), sum(float(query["time"]) for query in queries)))
+        return measured
+
+    def test_budgets(self):
+        small = self._measure()
+
+        first_id = SocialNetworkUsers.objects.order_by("-id").first().id + 1
+        create_scaled_fake_data(users=100, posts=2000, followers=5)
+        api.follow_many(SocialNetworkUsers.objects.get(email=user_mapping["P"]), list(range(first_id, first_id + 100)))
+        large = self._measure()
+
+        for (method, path, _, budget), (small_queries, small_time), (large_queries, large_time) in zip(
+            self.REQUESTS, small, large
+        ):
+            with self.subTest(f"{method} {path}"):
+                self.assertLessEqual(small_queries, budget)
+                self.assertLessEqual(large_queries, budget)
+                # constant in the size of the data:
+                self.assertLessEqual(large_queries, small_queries)
+                self.assertLess(small_time, self.DB_TIME_BUDGET)
+                self.assertLess(large_time, self.DB_TIME_BUDGET)
+
+    def _methods(self, namespace: str, pattern) -> set:
+        """The HTTP methods the view of a url pattern implements, besides OPTIONS and HEAD."""
+        view_class = getattr(pattern.callback, "view_class", None)
+        if view_class is not None:
+            methods = {method for method in view_class.http_method_names if hasattr(view_class, method)}
+        else:
+            # the function views are wrapped by require_http_methods, which lists the allowed methods:
+            response = self.client.generic("TRACE", reverse(f"{namespace}:{pattern.name}"))
+            self.assertEqual(response.status_code, 405, pattern.name)
+            methods = {method.strip().lower() for method in response["Allow"].split(",")}
+        return {method.upper() for method in methods - {"options", "head"}}
+
+    def test_all_endpoints_covered(self):
+        endpoints = {
+            (f"{namespace}:{pattern.name}", method)
+            for namespace, urls in (("sn", socialnetwork.urls), ("fame", fame.urls))
+            for pattern in urls.urlpatterns
+            for method in self._methods(namespace, pattern)
+        }
+        covered = {(resolve(urlsplit(path).path).view_name, method) for method, path, _, _ in self.REQUESTS}
+        self.assertEqual(endpoints - covered - self.EXEMPT.keys(), set())
+        # no stale exemptions:
+        self.assertEqual(self.EXEMPT.keys() - endpoints, set())
@@ -19,6 +19,8 @@ from django.contrib import admin
 from django.urls import path, include
 
 from famesocialnetwork.views.html import home, MyLogoutView, MyLoginView
+from socialnetwork.views.metrics import metrics
+from socialnetwork.views.profiles import profile, profiles
 
 urlpatterns = [
     path(
@@ -38,6 +40,9 @@ urlpatterns = [
     ),
     path("home/", home, name="home"),
     path("admin/", admin.site.urls),
+    path("metrics", metrics, name="metrics"),
+    path("profiles/", profiles, name="profiles"),
+    path("profiles/<str:profile_id>.<str:suffix>", profile, name="profile"),
     path("fame/", include("fame.urls", namespace="fame")),  # reroute to fame app
     path(
         "sn/", include("socialnetwork.urls", namespace="sn")
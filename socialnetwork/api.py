@@ -1,8 +1,13 @@
-from collections import defaultdict
-from django.db.models import Q, Exists, OuterRef, When, IntegerField, FloatField, Count, ExpressionWrapper, Case, Value, F, Prefetch
+import heapq
 
-from fame.models import Fame, FameLevels, FameUsers, ExpertiseAreas
-from socialnetwork.models import Posts, SocialNetworkUsers
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, F, Prefetch
+
+from fame import ladder
+from fame.models import Fame, ExpertiseAreas
+from socialnetwork import follow_graph, home_timeline, leaderboard, moderation, pagination, search_index, similarity, similarity_table, taxonomy
+from socialnetwork.models import PostExpertiseAreasAndRatings, Posts, SocialNetworkUsers
 
 
 # general methods independent of html and REST views
@@ -18,8 +23,35 @@ def _get_social_network_user(user) -> SocialNetworkUsers:
     return user
 
 
-def timeline(user: SocialNetworkUsers, start: int = 0, end: int = None, published=True, community_mode=False):
-    """Get the timeline of the user. Assumes that the user is authenticated."""
+def _get_request_user(user) -> SocialNetworkUsers:
+    """Given a FameUser, gets the social network user together with the user-scoped data most views need, loaded in
+    bulk: the communities are prefetched, followed_ids is the set of the ids of the followed users and fame_profile
+    maps the ids of the expertise areas in the fame profile to the Fame entries (with expertise area and fame level).
+    Resolved once per request as request.social_network_user, see socialnetwork.middleware."""
+    try:
+        user = SocialNetworkUsers.objects.prefetch_related(
+            "communities",
+            Prefetch("fame_set", queryset=Fame.objects.select_related("expertise_area", "fame_level"), to_attr="fame_list"),
+        ).get(id=user.id)
+    except SocialNetworkUsers.DoesNotExist:
+        raise PermissionError("User does not exist")
+    user.followed_ids = follow_graph.followed_ids(user.id)
+    user.fame_profile = {fame.expertise_area_id: fame for fame in user.fame_list}
+    return user
+
+
+def timeline(
+    user: SocialNetworkUsers,
+    start: int = 0,
+    end: int = None,
+    published=True,
+    community_mode=False,
+    cursor: str = None,
+    limit: int = None,
+):
+    """Get the timeline of the user. Assumes that the user is authenticated.
+    If cursor or limit are given, keyset pagination is used instead of start and end: the result contains at most limit
+    posts following the post the cursor points to, see socialnetwork.pagination."""
 
         # T4
         # in community mode, posts of communities are displayed if ALL of the following criteria are met:
@@ -42,45 +74,143 @@ def timeline(user: SocialNetworkUsers, start: int = 0, end: int = None, publishe
             Q(published=published) | Q(author=user) # requirement 4
         ).distinct().order_by("-submitted")
 
+    elif published is True:
+        # in standard mode, posts of followed users are displayed,
+        # read them from the materialized home timeline which is filled on write:
+        posts = home_timeline.posts(
+            user, after=pagination.decode_post_cursor(cursor) if cursor is not None else None
+        )
+        if cursor is not None or limit is not None:
+            # already ordered and filtered on the sort key of the timeline entries
+            return posts[:limit]
+
     else:
-        # in standard mode, posts of followed users are displayed
+        # fallback for non-standard filters: compute the timeline from the posts of followed users
         _follows = user.follows.all()
         posts = Posts.objects.filter(
             (Q(author__in=_follows) & Q(published=published)) | Q(author=user)
         ).order_by("-submitted")
+    if cursor is not None or limit is not None:
+        return pagination.paginate_posts(posts, cursor, limit)
     if end is None:
         return posts[start:]
     else:
         return posts[start:end+1]
 
 
-def search(keyword: str, start: int = 0, end: int = None, published=True):
-    """Search for all posts in the system containing the keyword. Assumes that all posts are public"""
-    posts = Posts.objects.filter(
-        Q(content__icontains=keyword)
-        | Q(author__email__icontains=keyword)
-        | Q(author__first_name__icontains=keyword)
-        | Q(author__last_name__icontains=keyword),
-        published=published,
-    ).order_by("-submitted")
+SEARCH_MODES = ("substring", "fulltext", "ranked")
+
+
+def search(
+    keyword: str,
+    start: int = 0,
+    end: int = None,
+    published=True,
+    cursor: str = None,
+    limit: int = None,
+    mode: str = "substring",
+):
+    """Search for all posts in the system containing the keyword. Assumes that all posts are public.
+    If cursor or limit are given, keyset pagination is used instead of start and end.
+    The mode determines how posts are matched:
+    - substring: the keyword is contained in the content or the email, first or last name of the author
+    - fulltext: every word of the keyword starts a word of the content or the author, uses the full-text index
+    - ranked: as fulltext, but the best matches come first instead of the most recent posts, hence ranked search
+      results cannot be paginated with a cursor
+    fulltext and ranked fall back to substring if the full-text index is not available."""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}")
+    if mode != "substring" and not search_index.is_available():
+        mode = "substring"
+
+    posts = Posts.objects.filter(published=published)
+    if mode == "ranked":
+        if cursor is not None:
+            raise ValueError("Ranked search results cannot be paginated with a cursor")
+        posts = search_index.rank_matching(posts, keyword)
+        if limit is not None:
+            return posts[start:start + limit]
+    else:
+        if mode == "fulltext":
+            posts = search_index.filter_matching(posts, keyword)
+        else:
+            posts = posts.filter(
+                Q(content__icontains=keyword)
+                | Q(author__email__icontains=keyword)
+                | Q(author__first_name__icontains=keyword)
+                | Q(author__last_name__icontains=keyword),
+            )
+        posts = posts.order_by("-submitted")
+        if cursor is not None or limit is not None:
+            return pagination.paginate_posts(posts, cursor, limit)
     if end is None:
         return posts[start:]
     else:
         return posts[start:end+1]
 
 
-def follows(user: SocialNetworkUsers, start: int = 0, end: int = None):
-    """Get the users followed by this user. Assumes that the user is authenticated."""
+def _feed_page(area_id: int, cursor: str, limit: int):
+    """The (post_submitted, post_id) of the published posts of a single expertise area after the cursor, most recent
+    first, at most limit. A range scan of the (expertise_area, post_submitted, post) index that stops after limit rows."""
+    classified = PostExpertiseAreasAndRatings.objects.filter(expertise_area_id=area_id, post__published=True)
+    if cursor is not None:
+        classified = classified.filter(
+            pagination.posts_after(
+                *pagination.decode_post_cursor(cursor), submitted_field="post_submitted", id_field="post_id"
+            )
+        )
+    return classified.order_by("-post_submitted", "-post_id").values_list("post_submitted", "post_id")[:limit]
+
+
+def expertise_area_feed(expertise_area: ExpertiseAreas, cursor: str = None, limit: int = None):
+    """Get the published posts classified into the expertise area or any of its descendant areas, most recent first.
+    If cursor or limit are given, keyset pagination is used, see socialnetwork.pagination."""
+    # the areas of the subtree are looked up in the closure table
+    if limit is None:
+        classified = PostExpertiseAreasAndRatings.objects.filter(
+            expertise_area__in=taxonomy.descendants(expertise_area), post__published=True
+        )
+        if cursor is not None:
+            classified = classified.filter(
+                pagination.posts_after(
+                    *pagination.decode_post_cursor(cursor), submitted_field="post_submitted", id_field="post_id"
+                )
+            )
+        return Posts.objects.filter(id__in=classified.values("post_id")).order_by("-submitted", "-id")
+    # ordering the posts of all areas of the subtree in the database sorts all of them before the limit applies, so
+    # the pages of the single areas are read from the index and merged here. A post classified into several areas of
+    # the subtree is contained once per area, the copies are merged next to each other:
+    pages = [
+        list(_feed_page(area_id, cursor, limit))
+        for area_id in taxonomy.descendants(expertise_area).values_list("id", flat=True)
+    ]
+    post_ids = []
+    for _submitted, post_id in heapq.merge(*pages, reverse=True):
+        if len(post_ids) == limit:
+            break
+        if not post_ids or post_ids[-1] != post_id:
+            post_ids.append(post_id)
+    return Posts.objects.filter(id__in=post_ids).order_by("-submitted", "-id")
+
+
+def follows(user: SocialNetworkUsers, start: int = 0, end: int = None, cursor: str = None, limit: int = None):
+    """Get the users followed by this user. Assumes that the user is authenticated.
+    If cursor or limit are given, keyset pagination on the user id is used instead of start and end."""
     _follows = user.follows.all()
+    if cursor is not None or limit is not None:
+        return pagination.paginate_users(_follows, cursor, limit)
     if end is None:
         return _follows[start:]
     else:
         return _follows[start:end+1]
 
 
-def followers(user: SocialNetworkUsers, start: int = 0, end: int = None):
-    """Get the followers of this user. Assumes that the user is authenticated."""
+def followers(user: SocialNetworkUsers, start: int = 0, end: int = None, cursor: str = None, limit: int = None):
+    """Get the followers of this user. Assumes that the user is authenticated.
+    If cursor or limit are given, keyset pagination on the user id is used instead of start and end."""
     _followers = user.followed_by.all()
+    if cursor is not None or limit is not None:
+        return pagination.paginate_users(_followers, cursor, limit)
     if end is None:
         return _followers[start:]
     else:
@@ -89,43 +219,116 @@ def followers(user: SocialNetworkUsers, start: int = 0, end: int = None):
 
 def follow(user: SocialNetworkUsers, user_to_follow: SocialNetworkUsers):
     """Follow a user. Assumes that the user is authenticated. If user already follows the user, signal that."""
-    if user_to_follow in user.follows.all():
+    # a single idempotent insert, see socialnetwork.follow_graph
+    if not follow_graph.follow(user.id, user_to_follow.id):
         return {"followed": False}
-    user.follows.add(user_to_follow)
-    user.save()
+    if hasattr(user, "followed_ids"):
+        user.followed_ids.add(user_to_follow.id)
+    home_timeline.backfill(user, user_to_follow)
     return {"followed": True}
 
 
 def unfollow(user: SocialNetworkUsers, user_to_unfollow: SocialNetworkUsers):
     """Unfollow a user. Assumes that the user is authenticated. If user does not follow the user anyway, signal that."""
-    if user_to_unfollow not in user.follows.all():
+    # a single idempotent delete, see socialnetwork.follow_graph
+    if not follow_graph.unfollow(user.id, user_to_unfollow.id):
         return {"unfollowed": False}
-    user.follows.remove(user_to_unfollow)
-    user.save()
+    if hasattr(user, "followed_ids"):
+        user.followed_ids.discard(user_to_unfollow.id)
+    home_timeline.evict(user, user_to_unfollow)
     return {"unfollowed": True}
 
 
+def _bulk_outcomes(ids: list, known_ids: set, changed_ids: set, outcomes: tuple) -> dict:
+    # maps each of the given ids to its outcome: (changed, unchanged, not found)
+    changed, unchanged, not_found = outcomes
+    return {
+        item_id: changed if item_id in changed_ids else unchanged if item_id in known_ids else not_found
+        for item_id in dict.fromkeys(ids)
+    }
+
+
+@transaction.atomic
+def follow_many(user: SocialNetworkUsers, user_ids: list) -> dict:
+    """Follow several users at once, in a single transaction and with a constant number of queries. Assumes that the
+    user is authenticated. Returns a dict mapping each given user id to its outcome: "followed", "already_followed" or
+    "not_found"."""
+    known_ids = set(SocialNetworkUsers.objects.filter(id__in=user_ids).values_list("id", flat=True))
+    pairs = [(user.id, other_id) for other_id in user_ids if other_id in known_ids]
+    followed = [other_id for _, other_id in follow_graph.insert_many(follow_graph.FOLLOWS, pairs)]
+    if hasattr(user, "followed_ids"):
+        user.followed_ids.update(followed)
+    home_timeline.backfill_many(user, followed)
+    return _bulk_outcomes(user_ids, known_ids, set(followed), ("followed", "already_followed", "not_found"))
+
+
+@transaction.atomic
+def unfollow_many(user: SocialNetworkUsers, user_ids: list) -> dict:
+    """Unfollow several users at once, see follow_many. The outcomes are "unfollowed", "not_followed" or
+    "not_found"."""
+    known_ids = set(SocialNetworkUsers.objects.filter(id__in=user_ids).values_list("id", flat=True))
+    pairs = [(user.id, other_id) for other_id in user_ids if other_id in known_ids]
+    unfollowed = [other_id for _, other_id in follow_graph.delete_many(follow_graph.FOLLOWS, pairs)]
+    if hasattr(user, "followed_ids"):
+        user.followed_ids.difference_update(unfollowed)
+    home_timeline.evict_many(user, unfollowed)
+    return _bulk_outcomes(user_ids, known_ids, set(unfollowed), ("unfollowed", "not_followed", "not_found"))
+
+
 def submit_post(
     user: SocialNetworkUsers,
     content: str,
     cites: Posts = None,
     replies_to: Posts = None,
+    asynchronous: bool = None,
 ):
     """Submit a post for publication. Assumes that the user is authenticated.
     returns a tuple of three elements:
     1. a dictionary with the keys "published" and "id" (the id of the post)
     2. a list of dictionaries containing the expertise areas and their truth ratings
     3. a boolean indicating whether the user was banned and logged out and should be redirected to the login page
+
+    In asynchronous mode (default: settings.SOCIALNETWORK_ASYNC_MODERATION), the post is only stored as pending and
+    moderated later by the workers of socialnetwork.moderation. The dictionary then contains "pending": True, the list
+    of expertise areas is empty and the user is never redirected.
     """
+    if asynchronous is None:
+        asynchronous = getattr(settings, "SOCIALNETWORK_ASYNC_MODERATION", False)
+
+    # create post  instance, in asynchronous mode together with its job (a post is never stored without it):
+    with transaction.atomic():
+        post = Posts.objects.create(
+            content=content,
+            author=user,
+            cites=cites,
+            replies_to=replies_to,
+        )
+        if asynchronous:
+            moderation.enqueue(post)
+
+    if asynchronous:
+        home_timeline.fan_out(post)
+        return {"published": post.published, "id": post.id, "pending": True}, [], False
+
+    _expertise_areas, redirect_to_logout = moderate_post(user, post)
+    post.save()
+    home_timeline.fan_out(post)
 
-    # create post  instance:
-    post = Posts.objects.create(
-        content=content,
-        author=user,
-        cites=cites,
-        replies_to=replies_to,
+    return (
+        {"published": post.published, "id": post.id},
+        _expertise_areas,
+        redirect_to_logout,
     )
 
+
+def moderate_post(user: SocialNetworkUsers, post: Posts):
+    """Classify a stored post, decide whether it is published and adjust the fame profile of its author.
+    Sets post.published but does not save the post.
+    returns a tuple of two elements:
+    1. a list of dictionaries containing the expertise areas and their truth ratings
+    2. a boolean indicating whether the user was banned and logged out and should be redirected to the login page
+    """
+
     # classify the content into expertise areas:
     # only publish the post if none of the expertise areas contains bullshit:
     _at_least_one_expertise_area_contains_bullshit, _expertise_areas = (
@@ -170,7 +373,8 @@ def submit_post(
         area = negative_area_info["expertise_area"]
         try:
             fame_entry = Fame.objects.get(user=user, expertise_area=area)
-            current_level = fame_entry.fame_level
+            # the fame levels are looked up in the in-memory fame ladder, see fame.ladder
+            current_level = ladder.get(fame_entry.fame_level_id)
             # T2a:if lower level exist, lower the fame level
             try:
                 lower_level = current_level.get_next_lower_fame_level()
@@ -182,11 +386,12 @@ def submit_post(
                 user.is_banned = True
                 user.save()
                 Posts.objects.filter(author=user).update(published=False)
+                home_timeline.evict_author(user)
                 redirect_to_logout = True
                     
         # T2b: if the expertise area is not in the user fame profile, add an entry "Confuser"
         except Fame.DoesNotExist:
-            confuser_level = FameLevels.objects.filter(name__iexact="Confuser").first()
+            confuser_level = ladder.get_by_name("Confuser")
             if confuser_level:
                 Fame.objects.create(
                     user=user,
@@ -200,7 +405,7 @@ def submit_post(
     # Get user's current communities
     user_communities = user.communities.all()
     # Find the "Super Pro" fame level
-    super_pro_level = FameLevels.objects.filter(name__iexact="Super Pro").first()
+    super_pro_level = ladder.get_by_name("Super Pro")
     
     if super_pro_level:
         for expertise_area_dict in _expertise_areas:
@@ -213,21 +418,17 @@ def submit_post(
                 ).first()
                 
                 if fame_profile: # if level is lower than Super Pro, remove from community
-                    if fame_profile.fame_level.numeric_value < super_pro_level.numeric_value:
+                    if ladder.get(fame_profile.fame_level_id).numeric_value < super_pro_level.numeric_value:
                         user.communities.remove(expertise_area)
                     
                          
                         
     user.save()
-    post.save()
 
-    return (
-        {"published": post.published, "id": post.id},
-        _expertise_areas,
-        redirect_to_logout,
-    )
+    return _expertise_areas, redirect_to_logout
 
 
+@transaction.atomic
 def rate_post(
     user: SocialNetworkUsers, post: Posts, rating_type: str, rating_score: int
 ):
@@ -235,7 +436,7 @@ def rate_post(
     update that rating score."""
     user_rating = None
     try:
-        user_rating = user.userratings_set.get(post=post, rating_type=rating_type)
+        user_rating = user.userratings_set.get(post=post, type=rating_type)
     except user.userratings_set.model.DoesNotExist:
         pass
 
@@ -244,164 +445,109 @@ def rate_post(
             "User is the author of the post. You cannot rate your own post."
         )
 
+    # the counters of the post are updated along with the rating, see socialnetwork.post_stats
     if user_rating is not None:
         # update the existing rating:
-        user_rating.rating_score = rating_score
+        user_rating.score = rating_score
         user_rating.save()
         return {"rated": True, "type": "update"}
     else:
         # create a new rating:
-        user.userratings_set.add(
-            post,
-            through_defaults={"rating_type": rating_type, "rating_score": rating_score},
-        )
-        user.save()
+        user.userratings_set.create(post=post, type=rating_type, score=rating_score)
         return {"rated": True, "type": "new"}
 
 
 def fame(user: SocialNetworkUsers):
     """Get the fame of a user. Assumes that the user is authenticated."""
-    try:
-        user = SocialNetworkUsers.objects.get(id=user.id)
-    except SocialNetworkUsers.DoesNotExist:
-        raise ValueError("User does not exist")
+    if not isinstance(user, SocialNetworkUsers):
+        try:
+            user = SocialNetworkUsers.objects.get(id=user.id)
+        except SocialNetworkUsers.DoesNotExist:
+            raise ValueError("User does not exist")
 
     return user, Fame.objects.filter(user=user)
 
 
-def bullshitters():
+def bullshitters(limit: int = None):
     """Return a Python dictionary mapping each existing expertise area in the fame profiles to a list of the users
     having negative fame for that expertise area. Each list should contain Python dictionaries as entries with keys
     ``user'' (for the user) and ``fame_level_numeric'' (for the corresponding fame value), and should be ranked, i.e.,
     users with the lowest fame are shown first, in case there is a tie, within that tie sort by date_joined
     (most recent first). Note that expertise areas with no expert may be omitted.
+    If limit is given, only the limit lowest ranked users are returned per expertise area.
     """
-    # we initialize the resulting dictionary
+    # the ranking is read from the materialized leaderboard, see socialnetwork.leaderboard
 
-    result = {}
-
-    # collect all  fame instances with negative fame numeric value 
-    
-    negative_fame_entries = Fame.objects.filter(
-        fame_level__numeric_value__lt=0
-    ).select_related("user", "expertise_area", "fame_level")
-
-    # loop over the instances and construct the unsorted result dictionary.
-
-    for fame_entry in negative_fame_entries:
-        expertise_area = fame_entry.expertise_area  
-        user = fame_entry.user
-        numeric_fame_value = fame_entry.fame_level.numeric_value
-
-        # we put an empty list as a placeholder to begin constructing the result,as expertise areas as keys
-        
-        if expertise_area not in result:
-            result[expertise_area] = []
-
-        # we append a dictionary instance with the relavant data to the list corresponding to the key (the current expertise area we are dealing with)
-
-        result[expertise_area].append({
-            "user": user,
-            "fame_level_numeric": numeric_fame_value,
-            "date_joined": user.date_joined,  # not part of the result format but it's used for breaking ties. will be removed later
-        })
-
-    # we sort by fame value (ascending), then by date_joined (descending)
-    for ea in result:
-        result[ea].sort(key=lambda entry: (
-            entry["fame_level_numeric"],
-            -entry["date_joined"].timestamp()
-        ))
-        for entry in result[ea]:
-            del entry["date_joined"]  #we remove the helper key
+    return {
+        expertise_area: [_bullshitter(entry) for entry in entries]
+        for expertise_area, entries in leaderboard.top(limit).items()
+    }
 
-    return result
 
+def bullshitters_in(expertise_area: ExpertiseAreas, cursor: str = None, limit: int = None):
+    """Return the ranked users having negative fame for the expertise area in the format of bullshitters together with
+    the cursor of the next page (None on the last page), see socialnetwork.pagination."""
+    entries = list(leaderboard.page(expertise_area, cursor, limit))
+    return (
+        [_bullshitter(entry) for entry in entries],
+        pagination.next_cursor(entries, limit, cursor_for=pagination.bullshitter_cursor),
+    )
 
 
+def _bullshitter(entry) -> dict:
+    return {"user": entry.user, "fame_level_numeric": entry.numeric_value}
 
 
 def join_community(user: SocialNetworkUsers, community: ExpertiseAreas):
     """Join a specified community. Note that this method does not check whether the user is eligible for joining the
-    community.
+    community. Returns whether the user joined, i.e. False if he/she already was a member.
     """
-
-    if community not in user.communities.all():
-        user.communities.add(community)
-        user.save()
-
+    return follow_graph.join(user.id, community.id)
 
 
 def leave_community(user: SocialNetworkUsers, community: ExpertiseAreas):
-    """Leave a specified community."""
-
-    if community in user.communities.all():
-        user.communities.remove(community)
-        user.save()
+    """Leave a specified community. Returns whether the user left, i.e. False if he/she was not a member."""
+    return follow_graph.leave(user.id, community.id)
 
 
-def similar_users(user: SocialNetworkUsers):
-    
-    """Compute the similarity of user with all other users. The method returns a QuerySet of FameUsers annotated
-    with an additional field 'similarity'. Sort the result in descending order according to 'similarity', in case
-    there is a tie, within that tie sort by date_joined (most recent first)"""
-
-    # we collect the user i's expertise areas  and fame level
+@transaction.atomic
+def add_community_members(community: ExpertiseAreas, user_ids: list) -> dict:
+    """Let several users join a community at once, in a single transaction and with a constant number of queries.
+    Like join_community, this method does not check whether the users are eligible for joining the community.
+    Returns a dict mapping each given user id to its outcome: "joined", "already_member" or "not_found"."""
+    known_ids = set(SocialNetworkUsers.objects.filter(id__in=user_ids).values_list("id", flat=True))
+    pairs = [(user_id, community.id) for user_id in user_ids if user_id in known_ids]
+    joined = {user_id for user_id, _ in follow_graph.insert_many(follow_graph.COMMUNITIES, pairs)}
+    return _bulk_outcomes(user_ids, known_ids, joined, ("joined", "already_member", "not_found"))
 
-    user_fame_entries = Fame.objects.filter(user=user).select_related("expertise_area", "fame_level")
-    
-    # construct a dictionary (mapping) with the expertise area's  id as a key and the fame level as the value
 
-    user_fame_map = {
-        entry.expertise_area.id: entry.fame_level.numeric_value
-        for entry in user_fame_entries
-    }
-    
-    # if the map is empty (user i in question have no expertise areas) then just return an empty query set
+@transaction.atomic
+def remove_community_members(community: ExpertiseAreas, user_ids: list) -> dict:
+    """Remove several users from a community at once, see add_community_members. The outcomes are "left",
+    "not_member" or "not_found"."""
+    known_ids = set(SocialNetworkUsers.objects.filter(id__in=user_ids).values_list("id", flat=True))
+    pairs = [(user_id, community.id) for user_id in user_ids if user_id in known_ids]
+    left = {user_id for user_id, _ in follow_graph.delete_many(follow_graph.COMMUNITIES, pairs)}
+    return _bulk_outcomes(user_ids, known_ids, left, ("left", "not_member", "not_found"))
 
-    if not user_fame_map:
-        return FameUsers.objects.none()
-    
-    # construct a set of the expertise areas id's of user i
 
-    Ei = set(user_fame_map.keys())
-    
-    # collect all other users who have fame in any of the user's expertise areas
-    other_users = FameUsers.objects.exclude(id=user.id).prefetch_related(
-        Prefetch('fame_set', 
-                queryset=Fame.objects.filter(expertise_area__in=Ei).select_related('fame_level', 'expertise_area'),
-                to_attr='relevant_fame')
-    )
-    
-    # then we calculate the similarity for each user from the formula given in the task description
-
-    users_with_similarity = []
-    for uj in other_users:
-        agreement_count = 0
-        for fame in uj.relevant_fame:
-            fame_ui = user_fame_map[fame.expertise_area.id]
-            fame_uj = fame.fame_level.numeric_value
-            if abs(fame_ui - fame_uj) <= 100:
-                agreement_count += 1
-        
-        if agreement_count > 0:
-            similarity = agreement_count / len(Ei)
-            users_with_similarity.append((uj, similarity))
+def similar_users(user: SocialNetworkUsers, limit: int = None):
     
-    # sort by similarity descending, then by date_joined descending
-    users_with_similarity.sort(key=lambda x: (-x[1], -x[0].date_joined.timestamp()))
-    
-    # we create a list of user IDs in the correct order
-    user_ids = [u[0].id for u in users_with_similarity]
-    
-    # then return a QuerySet with annotated similarity, ordered correctly
-    return FameUsers.objects.filter(id__in=user_ids).annotate(
-        similarity=Case(
-            *[When(id=uid, then=Value(sim)) for uid, sim in 
-              zip(user_ids, [u[1] for u in users_with_similarity])],
-            output_field=FloatField()
-        )
-    ).order_by('-similarity', '-date_joined')
+    """Compute the similarity of user with all other users. The method returns a QuerySet of FameUsers annotated
+    with an additional field 'similarity'. Sort the result in descending order according to 'similarity', in case
+    there is a tie, within that tie sort by date_joined (most recent first)
+    If limit is given, only the limit most similar users are returned."""
+
+    # the similarity of user i with user j is the share of the expertise areas of user i in which user j has a fame
+    # level that differs by at most 100 from the one of user i. It is computed for all users at once on an in-memory
+    # user x expertise area matrix of fame levels, see socialnetwork.similarity. The most similar users of every user
+    # are stored and read back from the table of socialnetwork.similarity_table as long as they are up to date
+
+    users = similarity_table.lookup(user.id, limit)
+    if users is None:
+        # more users requested than stored
+        users = similarity.annotate_similarities(similarity.similarities(user.id, limit))
+    return users
 
 
 
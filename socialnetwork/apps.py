@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "socialnetwork"
+
+    def ready(self):
+        # register the signal handlers:
+        from socialnetwork import signals  # noqa: F401
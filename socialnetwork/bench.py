@@ -0,0 +1,163 @@
+import json
+import time
+
+import numpy as np
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from faker import Faker
+
+from fame.models import Fame
+from fame.serializers import FameSerializer, serialize_fame
+from socialnetwork import api
+from socialnetwork.models import Posts, SocialNetworkUsers
+from socialnetwork.serializers import PostsSerializer, serialize_posts
+
+# benchmark harness of the hot paths of socialnetwork.api (see the bench command):
+# every case is a function called with the index of the iteration, it runs one call of the benchmarked path on a
+# user, post or keyword taken from a deterministic sample of the database and evaluates the result (querysets are
+# lazy). Each call is timed with perf_counter_ns and its queries are counted with CaptureQueriesContext, the report
+# holds the percentiles of the latencies and the query counts per case. Reports are plain JSON, compare() diffs a
+# report against a stored baseline.
+
+# number of posts per page of the paginated calls and of the serialized posts:
+PAGE_SIZE = 20
+# number of users, posts and keywords the calls cycle through:
+SAMPLE_SIZE = 50
+PERCENTILES = (50, 95, 99)
+
+
+class Sample:
+    """Deterministic sample of the users, posts and search keywords of the database."""
+
+    def __init__(self, seed: int = 42, size: int = SAMPLE_SIZE):
+        rng = np.random.default_rng(seed)
+        user_ids = np.array(
+            SocialNetworkUsers.objects.filter(is_banned=False).order_by("id").values_list("id", flat=True)
+        )
+        post_ids = np.array(Posts.objects.filter(published=True).order_by("id").values_list("id", flat=True))
+        if len(user_ids) < 2 or not len(post_ids):
+            raise ValueError("The database needs at least two users and one published post to run the benchmarks")
+        self.users = list(
+            SocialNetworkUsers.objects.in_bulk(rng.choice(user_ids, min(size, len(user_ids)), replace=False).tolist())
+            .values()
+        )
+        self.posts = list(
+            Posts.objects.in_bulk(rng.choice(post_ids, min(size, len(post_ids)), replace=False).tolist()).values()
+        )
+        # keywords are words of the sampled posts, so that the searches have results:
+        words = sorted(
+            {word.strip(".,").lower() for post in self.posts for word in post.content.split() if len(word) > 4}
+        )
+        self.keywords = rng.choice(words, min(size, len(words)), replace=False).tolist() if words else ["the"]
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.contents = [fake.text() for _ in range(size)]
+
+    def user(self, i: int) -> SocialNetworkUsers:
+        return self.users[i % len(self.users)]
+
+    def post(self, i: int) -> Posts:
+        return self.posts[i % len(self.posts)]
+
+    def keyword(self, i: int) -> str:
+        return self.keywords[i % len(self.keywords)]
+
+    def page(self, i: int):
+        """A page of published posts to serialize, a different one in every round."""
+        offset = i % SAMPLE_SIZE * PAGE_SIZE
+        return Posts.objects.filter(published=True).order_by("-submitted")[offset : offset + PAGE_SIZE]
+
+
+def cases(sample: Sample) -> dict:
+    """Return the benchmark cases on the given sample, by name."""
+
+    def rate_post(i):
+        post = sample.post(i)
+        # the sampled users are distinct, the next one is not the author if this one is:
+        user = sample.user(i) if sample.user(i).id != post.author_id else sample.user(i + 1)
+        api.rate_post(user, post, "L", i % 16)
+
+    def submit_post(i):
+        # the content is made unique, equal contents would be classified from the cache of the classifier:
+        api.submit_post(sample.user(i), f"{sample.contents[i % len(sample.contents)]} {i}")
+
+    return {
+        "timeline": lambda i: list(api.timeline(sample.user(i), limit=PAGE_SIZE)),
+        "timeline_community": lambda i: list(api.timeline(sample.user(i), community_mode=True, limit=PAGE_SIZE)),
+        "search_substring": lambda i: list(api.search(sample.keyword(i), limit=PAGE_SIZE)),
+        "search_fulltext": lambda i: list(api.search(sample.keyword(i), limit=PAGE_SIZE, mode="fulltext")),
+        "search_ranked": lambda i: list(api.search(sample.keyword(i), limit=PAGE_SIZE, mode="ranked")),
+        "bullshitters": lambda i: api.bullshitters(limit=PAGE_SIZE),
+        "similar_users": lambda i: list(api.similar_users(sample.user(i), limit=PAGE_SIZE)),
+        "serialize_posts": lambda i: PostsSerializer(
+            PostsSerializer.setup_eager_loading(sample.page(i)), many=True
+        ).data,
+        "serialize_posts_fast": lambda i: serialize_posts(sample.page(i)),
+        "serialize_fame": lambda i: FameSerializer(
+            FameSerializer.setup_eager_loading(Fame.objects.filter(user=sample.user(i))), many=True
+        ).data,
+        "serialize_fame_fast": lambda i: serialize_fame(Fame.objects.filter(user=sample.user(i))),
+        # writes last, they change what the reads see:
+        "rate_post": rate_post,
+        "submit_post": submit_post,
+    }
+
+
+def measure(case, iterations: int, warmup: int = 0) -> dict:
+    """Run a case warmup times untimed and iterations times timed, returns the percentiles of the latencies in
+    milliseconds and of the numbers of queries per call."""
+    for i in range(warmup):
+        case(i)
+    latencies = np.empty(iterations)
+    queries = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter_ns()
+            case(warmup + i)
+            latencies[i] = (time.perf_counter_ns() - start) / 1e6
+        queries[i] = len(context.captured_queries)
+    result = {"iterations": iterations, "mean_ms": round(float(latencies.mean()), 3)}
+    for percentile, latency in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        result[f"p{percentile}_ms"] = round(float(latency), 3)
+    result["queries_p50"] = int(np.percentile(queries, 50))
+    result["queries_max"] = int(queries.max())
+    return result
+
+
+def run(sample: Sample, iterations: int, warmup: int = 0, only=None, progress=None) -> dict:
+    """Measure all cases (the ones named in only if given), returns the results by name."""
+    results = {}
+    for name, case in cases(sample).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(case, iterations, warmup)
+        if progress is not None:
+            progress(name, results[name])
+    return results
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """Compare the results of a report with the ones of a baseline report. Returns the regressions as (case, metric,
+    baseline value, value) tuples: p95 latencies more than tolerance (relative) slower and any additional queries."""
+    regressions = []
+    for name, result in report["results"].items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append((name, "p95_ms", expected["p95_ms"], result["p95_ms"]))
+        for metric in ("queries_p50", "queries_max"):
+            if result[metric] > expected[metric]:
+                regressions.append((name, metric, expected[metric], result[metric]))
+    return regressions
+
+
+def load(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def dump(report: dict, path: str):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
@@ -0,0 +1,182 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+
+from socialnetwork.models import SocialNetworkUsers
+
+# cached adjacency of the social graph for membership checks:
+# the ids of the users a user follows and the ids of the communities he/she is a member of are kept as one set per
+# user in the Django cache. Writes do not rely on the cache, follow/join are a single INSERT that ignores existing
+# rows and unfollow/leave a single DELETE, the number of affected rows tells whether anything changed. Each write drops
+# the set of the user, changes through the related managers (e.g. the ban path of api.submit_post, the admin) drop the
+# sets of all affected users via m2m_changed (see socialnetwork.signals). The bulk variants insert_many/delete_many
+# write any number of pairs with a constant number of queries.
+# Sets loaded within a transaction are cached when it is committed, so that uncommitted (and possibly rolled back) rows
+# never end up in the cache.
+
+FOLLOWS = "follows"
+COMMUNITIES = "communities"
+# bounds the staleness of sets in caches that are not shared between processes (e.g. the default local memory cache):
+TIMEOUT = 60 * 60
+BATCH_SIZE = 500
+
+
+def _field(relation: str):
+    return SocialNetworkUsers._meta.get_field(relation)
+
+
+def _key(relation: str, user_id: int) -> str:
+    return f"socialnetwork:{relation}:{user_id}"
+
+
+def _ids(relation: str, user_id: int) -> set:
+    key = _key(relation, user_id)
+    ids = cache.get(key)
+    if ids is None:
+        field = _field(relation)
+        ids = set(
+            field.remote_field.through.objects.filter(**{field.m2m_column_name(): user_id}).values_list(
+                field.m2m_reverse_name(), flat=True
+            )
+        )
+        # a copy, callers may modify the returned set:
+        cached = set(ids)
+        transaction.on_commit(lambda: cache.set(key, cached, TIMEOUT))
+    return ids
+
+
+def invalidate(relation: str, user_ids):
+    """Drop the cached sets of the given users, again after the current transaction (if any) was committed."""
+    keys = [_key(relation, user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def _insert(relation: str, user_id: int, other_id: int) -> bool:
+    field = _field(relation)
+    quote_name = connection.ops.quote_name
+    sql = "%s %s (%s, %s) VALUES (%%s, %%s) %s" % (
+        connection.ops.insert_statement(on_conflict=OnConflict.IGNORE),
+        quote_name(field.m2m_db_table()),
+        quote_name(field.m2m_column_name()),
+        quote_name(field.m2m_reverse_name()),
+        connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, other_id])
+        inserted = cursor.rowcount > 0
+    if inserted:
+        invalidate(relation, [user_id])
+    return inserted
+
+
+def _delete(relation: str, user_id: int, other_id: int) -> bool:
+    field = _field(relation)
+    deleted, _ = field.remote_field.through.objects.filter(
+        **{field.m2m_column_name(): user_id, field.m2m_reverse_name(): other_id}
+    ).delete()
+    if deleted:
+        invalidate(relation, [user_id])
+    return deleted > 0
+
+
+def _through(relation: str):
+    field = _field(relation)
+    return field.remote_field.through, field.m2m_column_name(), field.m2m_reverse_name()
+
+
+def _existing(relation: str, pairs: list) -> dict:
+    # maps the given (user id, other id) pairs that exist to the ids of their rows
+    through, column, reverse_column = _through(relation)
+    rows = through.objects.filter(
+        **{f"{column}__in": {user_id for user_id, _ in pairs}, f"{reverse_column}__in": {other_id for _, other_id in pairs}}
+    ).values_list(column, reverse_column, "id")
+    wanted = set(pairs)
+    return {(user_id, other_id): row_id for user_id, other_id, row_id in rows if (user_id, other_id) in wanted}
+
+
+def insert_many(relation: str, pairs: list) -> list:
+    """Insert the given (user id, other id) pairs, pairs that already exist are skipped. Returns the inserted pairs.
+    Has to be called within a transaction for the returned pairs to be exact under concurrent writes."""
+    through, column, reverse_column = _through(relation)
+    existing = _existing(relation, pairs)
+    inserted = [pair for pair in dict.fromkeys(pairs) if pair not in existing]
+    through.objects.bulk_create(
+        [through(**{column: user_id, reverse_column: other_id}) for user_id, other_id in inserted],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    invalidate(relation, {user_id for user_id, _ in inserted})
+    return inserted
+
+
+def delete_many(relation: str, pairs: list) -> list:
+    """Delete the given (user id, other id) pairs, pairs that do not exist are skipped. Returns the deleted pairs.
+    Has to be called within a transaction, see insert_many."""
+    through, _, _ = _through(relation)
+    existing = _existing(relation, pairs)
+    through.objects.filter(id__in=existing.values()).delete()
+    invalidate(relation, {user_id for user_id, _ in existing})
+    return [pair for pair in dict.fromkeys(pairs) if pair in existing]
+
+
+def followed_ids(user_id: int) -> set:
+    """Return the ids of the users followed by the user."""
+    return _ids(FOLLOWS, user_id)
+
+
+def community_ids(user_id: int) -> set:
+    """Return the ids of the communities (expertise areas) the user is a member of."""
+    return _ids(COMMUNITIES, user_id)
+
+
+def follow(user_id: int, other_id: int) -> bool:
+    """Let the user follow the other user, returns False if he/she already did."""
+    return _insert(FOLLOWS, user_id, other_id)
+
+
+def unfollow(user_id: int, other_id: int) -> bool:
+    """Let the user unfollow the other user, returns False if he/she did not follow him/her."""
+    return _delete(FOLLOWS, user_id, other_id)
+
+
+def join(user_id: int, community_id: int) -> bool:
+    """Add the user to the community, returns False if he/she already was a member."""
+    return _insert(COMMUNITIES, user_id, community_id)
+
+
+def leave(user_id: int, community_id: int) -> bool:
+    """Remove the user from the community, returns False if he/she was not a member."""
+    return _delete(COMMUNITIES, user_id, community_id)
+
+
+def relation_changed(relation: str, instance, action: str, reverse: bool, pk_set):
+    """Drop the sets affected by an m2m_changed signal of the follows or communities relation."""
+    if not reverse:
+        # instance is the user
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate(relation, [instance.pk])
+    elif action == "pre_clear":
+        # instance is the followed user or the community, remember all users of the relation before they are removed
+        field = _field(relation)
+        instance._cleared_user_ids = list(
+            field.remote_field.through.objects.filter(**{field.m2m_reverse_name(): instance.pk}).values_list(
+                field.m2m_column_name(), flat=True
+            )
+        )
+    elif action == "post_clear":
+        invalidate(relation, instance.__dict__.pop("_cleared_user_ids", []))
+    elif action in ("post_add", "post_remove"):
+        invalidate(relation, pk_set)
+
+
+def deleted(relation: str, other_id: int):
+    """Drop the sets containing a user or community that is about to be deleted, the rows are removed by the cascade."""
+    field = _field(relation)
+    invalidate(
+        relation,
+        field.remote_field.through.objects.filter(**{field.m2m_reverse_name(): other_id}).values_list(
+            field.m2m_column_name(), flat=True
+        ),
+    )
@@ -0,0 +1,105 @@
+from django.db import transaction
+from django.db.models import Q
+
+from socialnetwork.pagination import posts_after
+from socialnetwork.models import HomeTimelineEntries, HomeTimelines, Posts, SocialNetworkUsers
+
+
+# fan-out-on-write store for the standard-mode timeline of api.timeline:
+# the timeline of a user consists of the published posts of the users he/she follows plus all of his/her own posts.
+# Instead of recomputing this on every request, the entries are written once when a post is published and read back
+# as a pre-sorted slice. A timeline is built lazily on its first read, afterwards it is kept up to date by
+# api.submit_post, api.follow, api.unfollow and the ban path of api.submit_post.
+
+BATCH_SIZE = 500
+
+
+def _entries_for(user_id: int, posts) -> list:
+    return [
+        HomeTimelineEntries(user_id=user_id, post_id=post_id, author_id=author_id, submitted=submitted)
+        for post_id, author_id, submitted in posts.values_list("id", "author_id", "submitted")
+    ]
+
+
+def is_materialized(user: SocialNetworkUsers) -> bool:
+    """Check whether the home timeline of the user has been built."""
+    return HomeTimelines.objects.filter(user=user).exists()
+
+
+@transaction.atomic
+def build(user: SocialNetworkUsers):
+    """(Re)build the home timeline of the user from scratch."""
+    HomeTimelineEntries.objects.filter(user=user).delete()
+    posts = Posts.objects.filter(
+        author__in=SocialNetworkUsers.objects.filter(followed_by=user), published=True
+    ) | Posts.objects.filter(author=user)
+    HomeTimelineEntries.objects.bulk_create(
+        _entries_for(user.id, posts), batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    HomeTimelines.objects.get_or_create(user=user)
+
+
+def posts(user: SocialNetworkUsers, after: tuple = None):
+    """Return the posts on the home timeline of the user, most recent first. Builds the timeline if necessary.
+    If after is given, only the posts after this (submitted, id) sort key are returned."""
+    if not is_materialized(user):
+        build(user)
+    condition = Q(home_timeline_entries__user=user)
+    if after is not None:
+        condition &= posts_after(
+            *after, submitted_field="home_timeline_entries__submitted", id_field="home_timeline_entries__post_id"
+        )
+    # the filter has to be a single call so that both conditions apply to the same entry:
+    return Posts.objects.filter(condition).order_by(
+        "-home_timeline_entries__submitted", "-home_timeline_entries__post_id"
+    )
+
+
+def fan_out(post: Posts):
+    """Write a post to the materialized timelines it belongs to: the timeline of its author and, if the post is
+    published, the timelines of all followers of the author."""
+    recipients = HomeTimelines.objects.filter(user=post.author_id)
+    if post.published:
+        recipients = recipients | HomeTimelines.objects.filter(user__follows=post.author_id)
+    HomeTimelineEntries.objects.bulk_create(
+        [
+            HomeTimelineEntries(
+                user_id=user_id, post_id=post.id, author_id=post.author_id, submitted=post.submitted
+            )
+            for user_id in recipients.values_list("user_id", flat=True).distinct()
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user: SocialNetworkUsers, followed: SocialNetworkUsers):
+    """Add the published posts of a newly followed user to the timeline of the user."""
+    backfill_many(user, [followed.id])
+
+
+def backfill_many(user: SocialNetworkUsers, followed_ids: list):
+    """Add the published posts of several newly followed users (given by their ids) to the timeline of the user."""
+    if not followed_ids or not is_materialized(user):
+        return
+    HomeTimelineEntries.objects.bulk_create(
+        _entries_for(user.id, Posts.objects.filter(author__in=followed_ids, published=True)),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def evict(user: SocialNetworkUsers, unfollowed: SocialNetworkUsers):
+    """Remove the posts of an unfollowed user from the timeline of the user."""
+    evict_many(user, [unfollowed.id])
+
+
+def evict_many(user: SocialNetworkUsers, unfollowed_ids: list):
+    """Remove the posts of several unfollowed users (given by their ids) from the timeline of the user."""
+    if unfollowed_ids:
+        HomeTimelineEntries.objects.filter(user=user, author__in=unfollowed_ids).delete()
+
+
+def evict_author(author: SocialNetworkUsers):
+    """Remove the posts of an author from all timelines except his/her own, e.g. after all posts were unpublished."""
+    HomeTimelineEntries.objects.filter(author=author).exclude(user=author).delete()
@@ -0,0 +1,196 @@
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+# per-request instrumentation (see socialnetwork.middleware.InstrumentationMiddleware):
+# while a request is handled, its Timings are the current ones of the context. The queries of all database connections
+# pass through Timings as execute wrapper (count and time), code serializing data (the serializers and the fast paths
+# of socialnetwork.serializers and fame.serializers, the JSON renderer) is wrapped in timed("serializer") and templates
+# are rendered by the TimedDjangoTemplates backend, i.e. in timed("template"). Nested blocks of the same stage are
+# counted once, the stages may overlap (e.g. queries issued while serializing count as db and serializer time).
+# The timings are sent back in the Server-Timing header and aggregated in process as histograms per URL name, which
+# metrics() renders in the Prometheus text format (served at /metrics). Note that the body of streaming responses is
+# produced after the middleware returned, only the time until then is measured for them.
+
+STAGES = ("db", "serializer", "template")
+# upper bounds of the histogram buckets, the defaults of the Prometheus client libraries for durations:
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = ContextVar("socialnetwork_timings", default=None)
+
+
+class Timings:
+    """Query count and time spent per stage (in seconds) of a request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.durations = dict.fromkeys(STAGES, 0.0)
+        # number of open blocks and start of the outermost one per stage:
+        self._depth = dict.fromkeys(STAGES, 0)
+        self._started = dict.fromkeys(STAGES, 0.0)
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute wrapper, see django.db.backends.base.base.BaseDatabaseWrapper.execute_wrapper
+        self.queries += 1
+        with self.timed("db"):
+            return execute(sql, params, many, context)
+
+    @contextmanager
+    def timed(self, stage: str):
+        if self._depth[stage] == 0:
+            self._started[stage] = time.perf_counter()
+        self._depth[stage] += 1
+        try:
+            yield
+        finally:
+            self._depth[stage] -= 1
+            if self._depth[stage] == 0:
+                self.durations[stage] += time.perf_counter() - self._started[stage]
+
+
+@contextmanager
+def timed(stage: str):
+    """Add the time spent in the block (or in the decorated function) to the stage of the current request, if any."""
+    timings = _current.get()
+    if timings is None:
+        yield
+    else:
+        with timings.timed(stage):
+            yield
+
+
+@contextmanager
+def measure():
+    """Measure the queries and stages of the block, yields its Timings."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            yield timings
+    finally:
+        _current.reset(token)
+
+
+def server_timing(duration: float, timings: Timings) -> str:
+    """Return the value of the Server-Timing header of a request taking duration seconds."""
+    metrics = [f'db;dur={timings.durations["db"] * 1000:.3f};desc="{timings.queries} queries"']
+    metrics += [f"{stage};dur={timings.durations[stage] * 1000:.3f}" for stage in STAGES[1:]]
+    metrics.append(f"total;dur={duration * 1000:.3f}")
+    return ", ".join(metrics)
+
+
+class TemplateWithTiming(Template):
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, measuring the time spent rendering templates (includes and extended templates are
+    part of the rendering of the template using them)."""
+
+    def from_string(self, template_code):
+        return TemplateWithTiming(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TemplateWithTiming(template.template, self)
+
+
+class Histogram:
+    """Prometheus histogram: the number of observations per bucket (not cumulative), their sum and count."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last one is the +Inf bucket:
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# name, help and buckets of the histograms per URL name:
+HISTOGRAMS = [
+    ("socialnetwork_request_duration_seconds", "Time spent handling requests.", DURATION_BUCKETS),
+    ("socialnetwork_request_queries", "Number of SQL queries per request.", QUERY_BUCKETS),
+    ("socialnetwork_request_db_seconds", "Time spent in SQL queries per request.", DURATION_BUCKETS),
+    ("socialnetwork_request_serializer_seconds", "Time spent serializing data per request.", DURATION_BUCKETS),
+    ("socialnetwork_request_template_seconds", "Time spent rendering templates per request.", DURATION_BUCKETS),
+]
+RESPONSES = "socialnetwork_responses_total"
+
+_lock = Lock()
+# maps the URL name to its histograms (in the order of HISTOGRAMS):
+_histograms = {}
+# maps (URL name, status code) to the number of responses:
+_responses = {}
+
+
+def record(view: str, status: int, duration: float, timings: Timings):
+    """Add a handled request of the view with the given URL name to the aggregated metrics."""
+    values = (
+        duration,
+        timings.queries,
+        timings.durations["db"],
+        timings.durations["serializer"],
+        timings.durations["template"],
+    )
+    with _lock:
+        histograms = _histograms.get(view)
+        if histograms is None:
+            histograms = _histograms[view] = [Histogram(buckets) for _, _, buckets in HISTOGRAMS]
+        for histogram, value in zip(histograms, values):
+            histogram.observe(value)
+        _responses[view, status] = _responses.get((view, status), 0) + 1
+
+
+def reset():
+    """Drop all aggregated metrics."""
+    with _lock:
+        _histograms.clear()
+        _responses.clear()
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def metrics() -> str:
+    """Render the aggregated metrics in the Prometheus text format."""
+    with _lock:
+        histograms = {view: [(h.counts[:], h.sum, h.count) for h in hs] for view, hs in sorted(_histograms.items())}
+        responses = sorted(_responses.items())
+    lines = []
+    for index, (name, help_text, buckets) in enumerate(HISTOGRAMS):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for view, view_histograms in histograms.items():
+            counts, total, count = view_histograms[index]
+            view = _label(view)
+            cumulative = 0
+            for bound, bucket_count in zip([*buckets, "+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{view="{view}",le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'{name}_sum{{view="{view}"}} {_number(total)}')
+            lines.append(f'{name}_count{{view="{view}"}} {count}')
+    lines += [f"# HELP {RESPONSES} Number of responses per status code.", f"# TYPE {RESPONSES} counter"]
+    for (view, status), count in responses:
+        lines.append(f'{RESPONSES}{{view="{_label(view)}",status="{status}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from fame.models import ExpertiseAreas, Fame, FameUsers
+from socialnetwork.models import BullshitterEntries
+from socialnetwork.pagination import bullshitters_after, decode_bullshitter_cursor
+
+# materialized leaderboard for api.bullshitters:
+# every fame with a negative fame level has an entry in BullshitterEntries holding a copy of the fame level and of the
+# date joined of its user. The entries are kept up to date by the save and delete signals of Fame, FameLevels and the
+# user models (see socialnetwork.signals), so that fame adjustments of api.submit_post and admin edits are covered.
+# A leaderboard page is an index range scan of (expertise_area, numeric_value, -date_joined, user), its cost does not
+# depend on the number of bullshitters.
+
+ORDERING = ["numeric_value", "-date_joined", "user_id"]
+BATCH_SIZE = 500
+
+
+@transaction.atomic
+def refresh(fames=None):
+    """Recompute the entries of the given queryset of fames (of all fames if None)."""
+    if fames is None:
+        fames = Fame.objects.all()
+    BullshitterEntries.objects.filter(fame__in=fames.values("id")).delete()
+    BullshitterEntries.objects.bulk_create(
+        [
+            BullshitterEntries(
+                fame_id=fame_id,
+                expertise_area_id=expertise_area_id,
+                user_id=user_id,
+                numeric_value=numeric_value,
+                date_joined=date_joined,
+            )
+            for fame_id, expertise_area_id, user_id, numeric_value, date_joined in fames.filter(
+                fame_level__numeric_value__lt=0
+            )
+            .order_by()
+            .values_list("id", "expertise_area_id", "user_id", "fame_level__numeric_value", "user__date_joined")
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def user_changed(user: FameUsers):
+    """Update the date joined of the entries of a user."""
+    BullshitterEntries.objects.filter(user_id=user.id).exclude(date_joined=user.date_joined).update(
+        date_joined=user.date_joined
+    )
+
+
+def top(limit: int = None) -> dict:
+    """Return a dict mapping each expertise area with bullshitters to its entries, lowest fame first and, within a
+    tie, most recently joined first. If limit is given, at most limit entries are returned per expertise area."""
+    entries = BullshitterEntries.objects.select_related("user")
+    if limit is None:
+        areas = {}
+        for entry in entries.select_related("expertise_area").order_by("expertise_area_id", *ORDERING):
+            areas.setdefault(entry.expertise_area, []).append(entry)
+        return areas
+    # one index range scan per expertise area instead of one scan of all entries:
+    return {
+        area: list(entries.filter(expertise_area=area).order_by(*ORDERING)[:limit])
+        for area in ExpertiseAreas.objects.filter(
+            Exists(BullshitterEntries.objects.filter(expertise_area=OuterRef("pk")))
+        ).order_by("id")
+    }
+
+
+def page(expertise_area: ExpertiseAreas, cursor: str = None, limit: int = None):
+    """Apply keyset pagination to the entries of an expertise area, see socialnetwork.pagination."""
+    entries = BullshitterEntries.objects.filter(expertise_area=expertise_area).select_related("user")
+    if cursor is not None:
+        entries = entries.filter(bullshitters_after(*decode_bullshitter_cursor(cursor)))
+    entries = entries.order_by(*ORDERING)
+    return entries if limit is None else entries[:limit]
@@ -1,38 +1,61 @@
 import random as rnd
+import threading
+from collections import OrderedDict
 
 from fame.models import ExpertiseAreas
 import hashlib
 
 rnd.seed(42)
 
+# maximum number of classification results kept in memory, keyed by the MD5 of the content:
+RESULT_CACHE_SIZE = 10000
 
-def classify_into_expertise_areas_and_check_for_bullshit(content: str):
-    """Classify the given content into expertise areas."""
+# in-memory snapshot of the taxonomy and the truth ratings the classifier chooses from, see _get_snapshot:
+_snapshot = None
+# LRU cache of classification results, guarded by _lock (the workers of socialnetwork.moderation and the request
+# threads classify concurrently):
+_results = OrderedDict()
+_lock = threading.Lock()
 
-    # in the absence of a real text classifier, we just randomly assign expertise areas and truth ratings:
-    # the random engine is initialized with a hash of the content to make the results deterministic for testing purposes
 
-    # it is important to note that this is not how a real classifier would work! This is just a mockup!
+def invalidate(*args, **kwargs):
+    """Drop the snapshot of the taxonomy and truth ratings together with all cached results.
+    Connected to the save and delete signals of ExpertiseAreas and TruthRatings, see socialnetwork.signals."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+        _results.clear()
 
-    # Also note that we simulate a real classifier in the sense that sometimes we only return the expertise areas
-    # without any truth ratings. This is to simulate the fact that a real classifier might not be able to classify
-    # the content into truth ratings.
 
-    # also note that in a real system, this could be improved by integrating human moderation and feedback loops
+def _get_snapshot():
+    """Return the expertise areas, the positive and the negative truth ratings, loaded once until invalidated."""
+    global _snapshot
+    from socialnetwork.models import TruthRatings
+
+    if _snapshot is None:
+        _snapshot = (
+            list(ExpertiseAreas.objects.all()),
+            list(TruthRatings.objects.filter(numeric_value__gt=0)),
+            list(TruthRatings.objects.filter(numeric_value__lt=0)),
+        )
+    return _snapshot
+
+
+def preload():
+    """Load the snapshot of the taxonomy and the truth ratings, e.g. before forking processes that must not query the
+    database."""
+    _get_snapshot()
 
-    # compute a seed based on the content:
-    seed = int(hashlib.md5(content.encode()).hexdigest(), 16)
 
+def _classify(seed: int, expertise_areas, positive_truth_ratings, negative_truth_ratings):
     # get a local random engine to make the results deterministic for testing purposes:
     lre = rnd.Random(seed)
 
     def get_truth_ratings(is_positive: bool):
-        from socialnetwork.models import TruthRatings
-
         if is_positive:
-            return lre.choice(TruthRatings.objects.filter(numeric_value__gt=0))
+            return lre.choice(positive_truth_ratings)
         else:  # is negative
-            return lre.choice(TruthRatings.objects.filter(numeric_value__lt=0))
+            return lre.choice(negative_truth_ratings)
 
     return [
         {
@@ -47,5 +70,52 @@ def classify_into_expertise_areas_and_check_for_bullshit(content: str):
                 )
             ),
         }
-        for s in lre.sample(list(ExpertiseAreas.objects.all()), 2)
+        for s in lre.sample(expertise_areas, 2)
     ]
+
+
+def classify_many(contents) -> list:
+    """Classify many contents at once, see classify_into_expertise_areas_and_check_for_bullshit.
+    Returns one list of expertise areas and truth ratings per content, in the same order as the contents.
+    All contents are classified against the same snapshot of the taxonomy and truth ratings, so that no queries are
+    issued once the snapshot is loaded."""
+    snapshot = None
+    ret = []
+    for content in contents:
+        # compute a seed based on the content:
+        digest = hashlib.md5(content.encode()).hexdigest()
+        with _lock:
+            result = _results.get(digest)
+            if result is not None:
+                _results.move_to_end(digest)
+        if result is None:
+            if snapshot is None:
+                snapshot = _get_snapshot()
+            result = _classify(int(digest, 16), *snapshot)
+            with _lock:
+                # not cached if the snapshot was invalidated meanwhile:
+                if _snapshot is snapshot:
+                    _results[digest] = result
+                    if len(_results) > RESULT_CACHE_SIZE:
+                        _results.popitem(last=False)
+        # hand out copies, callers may modify the result:
+        ret.append([dict(epa) for epa in result])
+    return ret
+
+
+def classify_into_expertise_areas_and_check_for_bullshit(content: str):
+    """Classify the given content into expertise areas."""
+
+    # in the absence of a real text classifier, we just randomly assign expertise areas and truth ratings:
+    # the random engine is initialized with a hash of the content to make the results deterministic for testing purposes
+
+    # it is important to note that this is not how a real classifier would work! This is just a mockup!
+
+    # Also note that we simulate a real classifier in the sense that sometimes we only return the expertise areas
+    # without any truth ratings. This is to simulate the fact that a real classifier might not be able to classify
+    # the content into truth ratings.
+
+    # also note that in a real system, this could be improved by integrating human moderation and feedback loops
+
+    # as the result only depends on the content, it is cached by the hash of the content
+    return classify_many([content])[0]
@@ -0,0 +1,89 @@
+import platform
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from famesocialnetwork.fakedata import create_scaled_fake_data
+from socialnetwork import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the hot paths of socialnetwork.api on a freshly seeded test database and reports the p50/p95/p99 "
+        "latencies and query counts per call, optionally as JSON and compared with a stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="number of users to seed")
+        parser.add_argument("--posts", type=int, default=5000, help="number of posts to seed")
+        parser.add_argument("--followers", type=int, default=20, help="number of users each seeded user follows")
+        parser.add_argument("--seed", type=int, default=42, help="seed of the data and of the sample")
+        parser.add_argument("--iterations", type=int, default=200, help="number of timed calls per case")
+        parser.add_argument("--warmup", type=int, default=bench.SAMPLE_SIZE, help="number of untimed calls per case")
+        parser.add_argument("--only", nargs="+", metavar="CASE", help="only run the given cases")
+        parser.add_argument("--json", metavar="PATH", help="write the report as JSON to the given file")
+        parser.add_argument("--baseline", metavar="PATH", help="compare the report with a stored JSON report")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2, help="relative p95 slowdown tolerated against the baseline"
+        )
+        parser.add_argument(
+            "--existing",
+            action="store_true",
+            help="benchmark the configured database as it is instead of seeding a test database (the write cases "
+            "write to it!)",
+        )
+
+    def progress(self, name: str, result: dict):
+        self.stdout.write(
+            f"{name:<22} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  "
+            f"p99 {result['p99_ms']:>9.3f} ms  queries {result['queries_p50']} (max {result['queries_max']})"
+        )
+
+    def handle(self, *args, **kwargs):
+        config = {
+            key: kwargs[key] for key in ("users", "posts", "followers", "seed", "iterations", "warmup", "existing")
+        }
+        if kwargs["existing"]:
+            results = self.run(kwargs)
+        else:
+            # a throwaway database, like the one of the test runner:
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                start = time.perf_counter()
+                create_scaled_fake_data(
+                    users=kwargs["users"], posts=kwargs["posts"], followers=kwargs["followers"], seed=kwargs["seed"]
+                )
+                self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f} s.")
+                results = self.run(kwargs)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "config": config,
+            "environment": {
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "machine": platform.machine(),
+            },
+            "results": results,
+        }
+        if kwargs["json"]:
+            bench.dump(report, kwargs["json"])
+            self.stdout.write(f"Report written to {kwargs['json']}.")
+        if kwargs["baseline"]:
+            regressions = bench.compare(report, bench.load(kwargs["baseline"]), kwargs["tolerance"])
+            for name, metric, expected, value in regressions:
+                self.stdout.write(self.style.ERROR(f"{name}: {metric} {expected} -> {value}"))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {kwargs['baseline']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {kwargs['baseline']}."))
+
+    def run(self, kwargs) -> dict:
+        sample = bench.Sample(seed=kwargs["seed"])
+        if kwargs["only"]:
+            unknown = set(kwargs["only"]) - set(bench.cases(sample))
+            if unknown:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+        return bench.run(sample, kwargs["iterations"], kwargs["warmup"], only=kwargs["only"], progress=self.progress)
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import similarity_table
+
+
+class Command(BaseCommand):
+    help = "Computes the stored lists of similar users of all users with a pool of processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=None, help="number of worker processes (default: number of CPUs)"
+        )
+        parser.add_argument("--stale", action="store_true", help="only recompute the lists marked as stale")
+
+    def handle(self, *args, **kwargs):
+        count = similarity_table.build(processes=kwargs["processes"], stale_only=kwargs["stale"])
+        self.stdout.write(self.style.SUCCESS(f"Similar users of {count} users computed."))
@@ -1,10 +1,43 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
-from famesocialnetwork.fakedata import create_fake_data
+from famesocialnetwork.fakedata import BATCH_SIZE, create_fake_data, create_scaled_fake_data
 
 
 class Command(BaseCommand):
-    help = "Loads meaningful fake test data for initial setup of a dev, test or staging server."
+    help = (
+        "Loads meaningful fake test data for initial setup of a dev, test or staging server. "
+        "With --users or --posts, bulk loads that many generated users and posts for load testing instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=None, help="number of users to generate")
+        parser.add_argument("--posts", type=int, default=None, help="number of posts to generate")
+        parser.add_argument(
+            "--followers", type=int, default=7, help="number of generated users each generated user follows"
+        )
+        parser.add_argument("--seed", type=int, default=42, help="seed of the random generators")
+        parser.add_argument(
+            "--processes", type=int, default=1, help="number of worker processes generating the posts"
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="number of rows per bulk insert")
+
+    def progress(self, stage: str, done: int, total: int):
+        self.stdout.write(f"{stage}: {done}/{total}")
 
     def handle(self, *args, **kwargs):
-        create_fake_data()
+        if kwargs["users"] is None and kwargs["posts"] is None:
+            create_fake_data()
+            return
+        try:
+            counts = create_scaled_fake_data(
+                users=kwargs["users"] or 0,
+                posts=kwargs["posts"] or 0,
+                followers=kwargs["followers"],
+                seed=kwargs["seed"],
+                processes=kwargs["processes"],
+                batch_size=kwargs["batch_size"],
+                progress=self.progress,
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{count} {table}" for table, count in counts.items()) + " created."))
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand, CommandError
+
+from socialnetwork import search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over the contents and authors of all posts."
+
+    def handle(self, *args, **kwargs):
+        if not search_index.is_available():
+            raise CommandError("The full-text search index is not available in this database.")
+        search_index.rebuild()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
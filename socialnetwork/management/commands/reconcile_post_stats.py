@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import post_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized citation, reply and rating counters of all posts."
+
+    def handle(self, *args, **kwargs):
+        count = post_stats.recompute()
+        self.stdout.write(self.style.SUCCESS(f"Counters of {count} posts rebuilt."))
@@ -0,0 +1,79 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.utils.module_loading import import_string
+
+from famesocialnetwork import replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a JSONL request log (one {\"method\", \"path\", \"user\", \"body\"} object per line) against the "
+        "in-process WSGI or ASGI application and reports throughput, latency histograms and errors per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("log", help="path of the JSONL request log")
+        parser.add_argument(
+            "--interface", choices=["wsgi", "asgi"], default="wsgi", help="application to replay against"
+        )
+        parser.add_argument("--concurrency", type=int, default=1, help="number of requests in flight at most")
+        parser.add_argument(
+            "--rate", type=float, default=None, help="requests per second (default: as fast as possible)"
+        )
+        parser.add_argument("--loops", type=int, default=1, help="number of times the log is replayed")
+        parser.add_argument("--host", default="localhost", help="host of the requests, must be an allowed host")
+        parser.add_argument("--json", metavar="PATH", help="write the report as JSON to the given file")
+
+    def handle(self, *args, **kwargs):
+        try:
+            with open(kwargs["log"]) as file:
+                entries = replay.read_log(file) * kwargs["loops"]
+            credentials = replay.log_in(entries)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        if kwargs["interface"] == "wsgi":
+            application, run = get_internal_wsgi_application(), replay.replay_wsgi
+        else:
+            application = import_string(getattr(settings, "ASGI_APPLICATION", "famesocialnetwork.asgi.application"))
+            run = replay.replay_asgi
+
+        start = time.perf_counter()
+        results = run(
+            application,
+            entries,
+            credentials,
+            concurrency=kwargs["concurrency"],
+            rate=kwargs["rate"],
+            host=kwargs["host"],
+        )
+        duration = time.perf_counter() - start
+        summary = replay.summarize(results, duration)
+
+        for endpoint, result in summary.items():
+            self.stdout.write(
+                f"{endpoint:<60} {result['requests']:>6} req  {result['throughput_rps']:>8.1f} req/s  "
+                f"p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  "
+                f"errors {result['errors']}"
+            )
+            self.stdout.write(
+                "    " + "  ".join(f"<={bound}ms: {count}" for bound, count in result["histogram_ms"].items())
+            )
+        errors = sum(result["errors"] for result in summary.values())
+        message = f"{len(results)} requests in {duration:.1f} s ({len(results) / duration:.1f} req/s), {errors} errors."
+        self.stdout.write(self.style.ERROR(message) if errors else self.style.SUCCESS(message))
+        if kwargs["json"]:
+            with open(kwargs["json"], "w") as file:
+                json.dump(
+                    {
+                        "config": {key: kwargs[key] for key in ("log", "interface", "concurrency", "rate", "loops")},
+                        "duration_s": round(duration, 3),
+                        "endpoints": summary,
+                    },
+                    file,
+                    indent=2,
+                )
+                file.write("\n")
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from socialnetwork import moderation
+
+
+class Command(BaseCommand):
+    help = "Runs a pool of workers moderating the posts submitted in asynchronous mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="number of worker threads")
+        parser.add_argument(
+            "--once", action="store_true", help="stop as soon as the queue is empty instead of polling forever"
+        )
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds to wait when the queue is empty")
+
+    def handle(self, *args, **kwargs):
+        moderation.run_workers(
+            workers=kwargs["workers"], stop_when_empty=kwargs["once"], poll_interval=kwargs["poll_interval"]
+        )
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from socialnetwork import slow_queries
+
+# maximum length of the printed SQL:
+MAX_SQL_LENGTH = 500
+
+
+class Command(BaseCommand):
+    help = "Summarizes the slow-query log: the queries with the most total time first, with call sites and plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=str(settings.SOCIALNETWORK_SLOW_QUERY_LOG),
+            help="path of the log (default: settings.SOCIALNETWORK_SLOW_QUERY_LOG), rotated backups are included",
+        )
+        parser.add_argument("--top", type=int, default=10, help="number of queries to show")
+        parser.add_argument(
+            "--sort", choices=["total", "max", "mean", "count"], default="total", help="order of the queries"
+        )
+
+    def handle(self, *args, **kwargs):
+        records = slow_queries.read_log(kwargs["path"])
+        if not records:
+            self.stdout.write(f"No slow queries logged in {kwargs['path']}.")
+            return
+        key = "count" if kwargs["sort"] == "count" else f"{kwargs['sort']}_ms"
+        groups = sorted(slow_queries.summarize(records), key=lambda group: group[key], reverse=True)
+        self.stdout.write(f"{len(records)} slow queries, {len(groups)} distinct:")
+        for rank, group in enumerate(groups[: kwargs["top"]], start=1):
+            self.stdout.write("")
+            self.stdout.write(
+                f"{rank}. {group['count']}x, total {group['total_ms']:.1f} ms, max {group['max_ms']:.1f} ms, "
+                f"mean {group['mean_ms']:.1f} ms" + (self.style.WARNING("  [full scan]") if group["full_scan"] else "")
+            )
+            sql = group["sql"]
+            self.stdout.write(f"   {sql[:MAX_SQL_LENGTH]}{'...' if len(sql) > MAX_SQL_LENGTH else ''}")
+            for call_site, count in group["call_sites"].most_common(3):
+                self.stdout.write(f"   from {call_site or 'unknown'} ({count}x)")
+            for line in group["plan"] or ():
+                self.stdout.write(f"   | {line}")
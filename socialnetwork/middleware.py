@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponseBadRequest
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from socialnetwork import instrumentation, profiling
+from socialnetwork.api import _get_request_user
+
+
+class SocialNetworkUserMiddleware:
+    """Sets request.social_network_user: the social network user of the authenticated user, resolved lazily on first
+    access and at most once per request together with his/her follows, communities and fame profile
+    (see api._get_request_user). Has to come after the AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.social_network_user = SimpleLazyObject(lambda: _get_request_user(request.user))
+        return self.get_response(request)
+
+
+class InstrumentationMiddleware:
+    """Measures the query count, database, serializer and template time of every request (see
+    socialnetwork.instrumentation), sends them in the Server-Timing header and aggregates them per URL name. Has to come
+    first to measure the whole request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with instrumentation.measure() as timings:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view = request.resolver_match.view_name if request.resolver_match is not None else "unresolved"
+        instrumentation.record(view, response.status_code, duration, timings)
+        response.headers["Server-Timing"] = instrumentation.server_timing(duration, timings)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profiles requests of staff users asking for it with the X-Profile header or the profile query parameter (see
+    socialnetwork.profiling) and links the stored profile in the X-Profile-Pstats and (in "sample" mode)
+    X-Profile-Collapsed headers.
+    Has to come after the AuthenticationMiddleware, is not used if settings.SOCIALNETWORK_PROFILE_DIR is None."""
+
+    def __init__(self, get_response):
+        if getattr(settings, "SOCIALNETWORK_PROFILE_DIR", None) is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            mode = profiling.requested_mode(request)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        if mode is None:
+            return self.get_response(request)
+        response, profile_id = profiling.profile(request, self.get_response, mode)
+        for suffix in profiling.DOWNLOADS[mode]:
+            response.headers[f"X-Profile-{suffix.capitalize()}"] = reverse("profile", args=[profile_id, suffix])
+        return response
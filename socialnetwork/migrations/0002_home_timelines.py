@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeTimelines',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='home_timeline', serialize=False, to='socialnetwork.socialnetworkusers')),
+                ('built', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'home_timelines',
+            },
+        ),
+        migrations.CreateModel(
+            name='HomeTimelineEntries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('submitted', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='socialnetwork.socialnetworkusers')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='home_timeline_entries', to='socialnetwork.posts')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='home_timeline_entries', to='socialnetwork.socialnetworkusers')),
+            ],
+            options={
+                'db_table': 'home_timeline_entries',
+                'indexes': [models.Index(fields=['user', '-submitted', '-post'], name='home_timeline_user_submitted'), models.Index(fields=['user', 'author'], name='home_timeline_user_author')],
+                'unique_together': {('user', 'post')},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+from django.db import migrations, OperationalError
+
+# the full-text index of socialnetwork.search_index and the triggers keeping it in sync, as of this migration:
+CREATE_STATEMENTS = [
+    """CREATE VIRTUAL TABLE posts_search USING fts5(content, author_name, author_email, tokenize='unicode61')""",
+    """CREATE TRIGGER posts_search_posts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_search(rowid, content, author_name, author_email)
+        SELECT new.id, new.content, u.first_name || ' ' || u.last_name, u.email FROM fame_users u
+        WHERE u.id = new.author_id;
+    END""",
+    """CREATE TRIGGER posts_search_posts_update AFTER UPDATE OF content, author_id ON posts
+    WHEN old.content IS NOT new.content OR old.author_id IS NOT new.author_id BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id;
+        INSERT INTO posts_search(rowid, content, author_name, author_email)
+        SELECT new.id, new.content, u.first_name || ' ' || u.last_name, u.email FROM fame_users u
+        WHERE u.id = new.author_id;
+    END""",
+    """CREATE TRIGGER posts_search_posts_delete AFTER DELETE ON posts BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER posts_search_users_update AFTER UPDATE OF first_name, last_name, email ON fame_users
+    WHEN old.first_name IS NOT new.first_name OR old.last_name IS NOT new.last_name OR old.email IS NOT new.email
+    BEGIN
+        UPDATE posts_search SET author_name = new.first_name || ' ' || new.last_name, author_email = new.email
+        WHERE rowid IN (SELECT id FROM posts WHERE author_id = new.id);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS posts_search_posts_insert",
+    "DROP TRIGGER IF EXISTS posts_search_posts_update",
+    "DROP TRIGGER IF EXISTS posts_search_posts_delete",
+    "DROP TRIGGER IF EXISTS posts_search_users_update",
+    "DROP TABLE IF EXISTS posts_search",
+]
+
+
+def create_search_index(apps, schema_editor):
+    # the full-text index requires SQLite with FTS5, other databases fall back to substring search
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for statement in CREATE_STATEMENTS:
+                cursor.execute(statement)
+        except OperationalError:
+            # FTS5 is not compiled into this SQLite
+            for statement in DROP_STATEMENTS:
+                cursor.execute(statement)
+            return
+        cursor.execute(
+            """INSERT INTO posts_search(rowid, content, author_name, author_email)
+            SELECT p.id, p.content, u.first_name || ' ' || u.last_name, u.email
+            FROM posts p JOIN fame_users u ON u.id = p.author_id"""
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0002_home_timelines'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
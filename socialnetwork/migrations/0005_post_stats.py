@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0004_moderation_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='socialnetwork.posts')),
+                ('citation_count', models.IntegerField(default=0)),
+                ('reply_count', models.IntegerField(default=0)),
+                ('approval_count', models.IntegerField(default=0)),
+                ('approval_score', models.IntegerField(default=0)),
+                ('like_count', models.IntegerField(default=0)),
+                ('like_score', models.IntegerField(default=0)),
+                ('dislike_count', models.IntegerField(default=0)),
+                ('dislike_score', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'post_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0005_post_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarUsersLists',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similar_users_list', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('computed', models.DateTimeField(auto_now=True)),
+                ('stale', models.BooleanField(default=False)),
+                ('complete', models.BooleanField(default=True)),
+            ],
+            options={
+                'db_table': 'similar_users_lists',
+                'indexes': [models.Index(fields=['stale'], name='similar_users_lists_stale')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SimilarUsers',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('similarity', models.FloatField()),
+                ('rank', models.IntegerField()),
+                ('other_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_users', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'similar_users',
+                'indexes': [models.Index(fields=['user', 'rank'], name='similar_users_user_rank')],
+                'unique_together': {('user', 'other_user')},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_leaderboard(apps, schema_editor):
+    Fame = apps.get_model("fame", "Fame")
+    BullshitterEntries = apps.get_model("socialnetwork", "BullshitterEntries")
+    BullshitterEntries.objects.bulk_create(
+        [
+            BullshitterEntries(
+                fame_id=fame_id,
+                expertise_area_id=expertise_area_id,
+                user_id=user_id,
+                numeric_value=numeric_value,
+                date_joined=date_joined,
+            )
+            for fame_id, expertise_area_id, user_id, numeric_value, date_joined in Fame.objects.filter(
+                fame_level__numeric_value__lt=0
+            ).values_list("id", "expertise_area_id", "user_id", "fame_level__numeric_value", "user__date_joined")
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0006_similar_users'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BullshitterEntries',
+            fields=[
+                ('fame', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='bullshitter_entry', serialize=False, to='fame.fame')),
+                ('numeric_value', models.IntegerField()),
+                ('date_joined', models.DateTimeField()),
+                ('expertise_area', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='fame.expertiseareas')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'bullshitters',
+                'indexes': [models.Index(fields=['expertise_area', 'numeric_value', '-date_joined', 'user'], name='bullshitters_area_rank')],
+            },
+        ),
+        migrations.RunPython(fill_leaderboard, migrations.RunPython.noop),
+    ]
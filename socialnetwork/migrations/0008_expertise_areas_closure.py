@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_closure(apps, schema_editor):
+    # the paths of all expertise areas as built by socialnetwork.taxonomy.rebuild as of this migration, at most 100 deep
+    # to guard against cycles:
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """INSERT INTO expertise_areas_closure(ancestor_id, descendant_id, depth)
+            WITH RECURSIVE paths(ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM expertise_areas
+                UNION ALL
+                SELECT p.ancestor_id, e.id, p.depth + 1 FROM paths p
+                JOIN expertise_areas e ON e.parent_expertise_area_id = p.descendant_id
+                WHERE p.depth < 100
+            )
+            SELECT ancestor_id, descendant_id, depth FROM paths"""
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0007_bullshitters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpertiseAreasClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_paths', to='fame.expertiseareas')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_paths', to='fame.expertiseareas')),
+            ],
+            options={
+                'db_table': 'expertise_areas_closure',
+                'indexes': [models.Index(fields=['descendant', 'depth'], name='expertise_areas_ancestors')],
+                'unique_together': {('ancestor', 'descendant')},
+            },
+        ),
+        migrations.RunPython(fill_closure, migrations.RunPython.noop),
+    ]
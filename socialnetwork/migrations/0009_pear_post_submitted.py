@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:29
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_post_submitted(apps, schema_editor):
+    Posts = apps.get_model("socialnetwork", "Posts")
+    PostExpertiseAreasAndRatings = apps.get_model("socialnetwork", "PostExpertiseAreasAndRatings")
+    PostExpertiseAreasAndRatings.objects.update(
+        post_submitted=Subquery(Posts.objects.filter(pk=OuterRef("post_id")).values("submitted")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fame', '0001_initial'),
+        ('socialnetwork', '0008_expertise_areas_closure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postexpertiseareasandratings',
+            name='post_submitted',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='postexpertiseareasandratings',
+            index=models.Index(fields=['expertise_area', '-post_submitted', '-post'], name='pear_area_submitted'),
+        ),
+        migrations.RunPython(fill_post_submitted, migrations.RunPython.noop),
+    ]
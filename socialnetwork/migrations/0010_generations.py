@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialnetwork', '0009_pear_post_submitted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generations',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('token', models.CharField(max_length=32)),
+            ],
+            options={
+                'db_table': 'generations',
+            },
+        ),
+    ]
@@ -3,8 +3,8 @@ import random as rnd
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
-from fame.models import ExpertiseAreas, FameUsers
-from socialnetwork.magic_AI import classify_into_expertise_areas_and_check_for_bullshit
+from fame.models import ExpertiseAreas, Fame, FameUsers
+from socialnetwork.magic_AI import classify_into_expertise_areas_and_check_for_bullshit, classify_many
 
 rnd.seed(42)
 
@@ -67,6 +67,8 @@ class Posts(models.Model):
     class Meta:
         ordering = ["-submitted"]
         unique_together = ("author", "submitted")
+        # the sort key of the keyset pagination, see socialnetwork.pagination:
+        indexes = [models.Index(fields=["-submitted", "-id"], name="posts_submitted_id")]
         db_table = "posts"
 
     def determine_expertise_areas_and_truth_ratings(self):
@@ -76,18 +78,39 @@ class Posts(models.Model):
         )
 
         # create the expertise areas and truth ratings:
-        at_least_one_expertise_area_contains_bullshit = False
+        PostExpertiseAreasAndRatings.objects.bulk_create(self._expertise_areas_and_ratings(_expertise_areas))
+
+        return self._contains_bullshit(_expertise_areas), _expertise_areas
+
+    @classmethod
+    def determine_expertise_areas_and_truth_ratings_in_bulk(cls, posts):
+        """Same as determine_expertise_areas_and_truth_ratings for many (saved) posts at once, e.g. for bulk imports.
+        Classifies all contents in one call and stores all expertise areas and truth ratings in one query.
+        Returns one tuple (at_least_one_expertise_area_contains_bullshit, _expertise_areas) per post."""
+        classifications = classify_many([post.content for post in posts])
+        PostExpertiseAreasAndRatings.objects.bulk_create(
+            [
+                pear
+                for post, _expertise_areas in zip(posts, classifications)
+                for pear in post._expertise_areas_and_ratings(_expertise_areas)
+            ]
+        )
+        return [(cls._contains_bullshit(_expertise_areas), _expertise_areas) for _expertise_areas in classifications]
 
-        for epa in _expertise_areas:
-            PostExpertiseAreasAndRatings.objects.create(
+    def _expertise_areas_and_ratings(self, _expertise_areas):
+        return [
+            PostExpertiseAreasAndRatings(
                 post=self,
                 expertise_area=epa["expertise_area"],
                 truth_rating=epa["truth_rating"],
+                post_submitted=self.submitted,
             )
-            if epa["truth_rating"] and epa["truth_rating"].numeric_value < 0:
-                at_least_one_expertise_area_contains_bullshit = True
+            for epa in _expertise_areas
+        ]
 
-        return at_least_one_expertise_area_contains_bullshit, _expertise_areas
+    @staticmethod
+    def _contains_bullshit(_expertise_areas) -> bool:
+        return any(epa["truth_rating"] and epa["truth_rating"].numeric_value < 0 for epa in _expertise_areas)
 
     def __str__(self):
         return f"{self.author} - {self.submitted} - {self.content[:10]}..."
@@ -112,6 +135,9 @@ class PostExpertiseAreasAndRatings(models.Model):
     post = models.ForeignKey(Posts, on_delete=models.CASCADE)
     expertise_area = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE)
     truth_rating = models.ForeignKey(TruthRatings, on_delete=models.CASCADE, null=True)
+    # copy of post.submitted, so that the posts of an expertise area are read in submission order from an index,
+    # filled on save (see socialnetwork.signals) and by Posts._expertise_areas_and_ratings
+    post_submitted = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         unique_together = ("post", "expertise_area")
@@ -120,6 +146,9 @@ class PostExpertiseAreasAndRatings(models.Model):
         return f"{self.post} - {self.expertise_area} - {self.truth_rating}"
 
     class Meta:
+        indexes = [
+            models.Index(fields=["expertise_area", "-post_submitted", "-post"], name="pear_area_submitted"),
+        ]
         db_table = "post_expertise_areas_and_ratings"
 
 
@@ -145,5 +174,215 @@ class UserRatings(models.Model):
     class Meta:
         unique_together = ("user", "post", "type")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored type and score to update the counters of the post by the difference on save,
+        # see socialnetwork.post_stats:
+        loaded = dict(zip(field_names, values))
+        if "type" in loaded and "score" in loaded:
+            instance._loaded_rating = (loaded["type"], loaded["score"])
+        return instance
+
     def __str__(self):
         return f"{self.user} - {self.post} - {self.type} - {self.score}"
+
+
+class PostStats(models.Model):
+    """Denormalized engagement counters of a post, maintained on writes by socialnetwork.post_stats.
+    Posts without a row (e.g. loaded from fixtures or bulk inserted) fall back to aggregating on read."""
+
+    post = models.OneToOneField(Posts, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    citation_count = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0)
+    approval_count = models.IntegerField(default=0)
+    approval_score = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+    like_score = models.IntegerField(default=0)
+    dislike_count = models.IntegerField(default=0)
+    dislike_score = models.IntegerField(default=0)
+
+    def user_ratings(self) -> dict:
+        """The summed up score per rating type that has ratings, in the format of PostsSerializer."""
+        ret = {}
+        for rating_type in sorted(RATING_COUNTERS):
+            count_field, score_field = RATING_COUNTERS[rating_type]
+            if getattr(self, count_field):
+                ret[rating_type] = getattr(self, score_field)
+        return ret
+
+    def __str__(self):
+        return f"{self.post} - {self.citation_count} - {self.reply_count}"
+
+    class Meta:
+        db_table = "post_stats"
+
+
+# counter fields of PostStats per rating type:
+RATING_COUNTERS = {
+    UserRatings.APPROVAL: ("approval_count", "approval_score"),
+    UserRatings.LIKE: ("like_count", "like_score"),
+    UserRatings.DISLIKE: ("dislike_count", "dislike_score"),
+}
+
+
+class HomeTimelines(models.Model):
+    """Marks the users whose home timeline is materialized in HomeTimelineEntries and kept up to date on writes."""
+
+    user = models.OneToOneField(
+        SocialNetworkUsers,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="home_timeline",
+    )
+    built = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.user} - {self.built}"
+
+    class Meta:
+        db_table = "home_timelines"
+
+
+class HomeTimelineEntries(models.Model):
+    """Materialized standard-mode timeline: one row per post shown on the timeline of a user.
+    author and submitted are copied from the post so that a timeline can be read and evicted without touching posts.
+    """
+
+    user = models.ForeignKey(
+        SocialNetworkUsers, on_delete=models.CASCADE, related_name="home_timeline_entries"
+    )
+    post = models.ForeignKey(
+        Posts, on_delete=models.CASCADE, related_name="home_timeline_entries"
+    )
+    author = models.ForeignKey(
+        SocialNetworkUsers, on_delete=models.CASCADE, related_name="+"
+    )
+    submitted = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user} - {self.post}"
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-submitted", "-post"], name="home_timeline_user_submitted"),
+            models.Index(fields=["user", "author"], name="home_timeline_user_author"),
+        ]
+        db_table = "home_timeline_entries"
+
+
+class ModerationJobs(models.Model):
+    """Moderation of a post submitted in asynchronous mode, processed by the workers of socialnetwork.moderation."""
+
+    PENDING = "P"
+    RUNNING = "R"
+    DONE = "D"
+    FAILED = "F"
+    STATUSES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    post = models.OneToOneField(Posts, on_delete=models.CASCADE, related_name="moderation_job")
+    status = models.CharField(max_length=1, choices=STATUSES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.post} - {self.get_status_display()}"
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created"], name="moderation_jobs_status")]
+        db_table = "moderation_jobs"
+
+
+class SimilarUsersLists(models.Model):
+    """State of the precomputed list of similar users of a user in SimilarUsers.
+    A list is stale when the fame it was computed from has changed since, it is complete when it was not capped."""
+
+    user = models.OneToOneField(
+        FameUsers, on_delete=models.CASCADE, primary_key=True, related_name="similar_users_list"
+    )
+    computed = models.DateTimeField(auto_now=True)
+    stale = models.BooleanField(default=False)
+    complete = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"{self.user} - {self.computed}"
+
+    class Meta:
+        indexes = [models.Index(fields=["stale"], name="similar_users_lists_stale")]
+        db_table = "similar_users_lists"
+
+
+class SimilarUsers(models.Model):
+    """Precomputed similarity of a user with one of his/her most similar other users, see api.similar_users.
+    rank is the position of other_user in the list of similar users of user, starting with 0."""
+
+    user = models.ForeignKey(FameUsers, on_delete=models.CASCADE, related_name="similar_users")
+    other_user = models.ForeignKey(FameUsers, on_delete=models.CASCADE, related_name="similar_to")
+    similarity = models.FloatField()
+    rank = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.user} - {self.other_user}: {self.similarity}"
+
+    class Meta:
+        unique_together = ("user", "other_user")
+        indexes = [models.Index(fields=["user", "rank"], name="similar_users_user_rank")]
+        db_table = "similar_users"
+
+
+class BullshitterEntries(models.Model):
+    """Materialized leaderboard of api.bullshitters: one row per fame with a negative fame level.
+    The fame level and the date joined of the user are copied, so that a leaderboard page is read with a single
+    index range scan, ordered by (numeric_value, -date_joined)."""
+
+    fame = models.OneToOneField(Fame, on_delete=models.CASCADE, primary_key=True, related_name="bullshitter_entry")
+    expertise_area = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE, related_name="+")
+    user = models.ForeignKey(FameUsers, on_delete=models.CASCADE, related_name="+")
+    numeric_value = models.IntegerField()
+    date_joined = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.expertise_area} - {self.user}: {self.numeric_value}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["expertise_area", "numeric_value", "-date_joined", "user"], name="bullshitters_area_rank"
+            )
+        ]
+        db_table = "bullshitters"
+
+
+class ExpertiseAreasClosure(models.Model):
+    """Closure table of the taxonomy of expertise areas: one row per pair of an expertise area and one of its
+    ancestors (including the area itself with depth 0), see socialnetwork.taxonomy."""
+
+    ancestor = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE, related_name="descendant_paths")
+    descendant = models.ForeignKey(ExpertiseAreas, on_delete=models.CASCADE, related_name="ancestor_paths")
+    depth = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.ancestor} - {self.descendant}: {self.depth}"
+
+    class Meta:
+        unique_together = ("ancestor", "descendant")
+        indexes = [models.Index(fields=["descendant", "depth"], name="expertise_areas_ancestors")]
+        db_table = "expertise_areas_closure"
+
+
+class Generations(models.Model):
+    """Shared version of an in-process snapshot of derived data, e.g. the fame matrix of socialnetwork.similarity.
+    Every change of the underlying data sets a new token, processes holding a snapshot of an older token reload it."""
+
+    name = models.CharField(max_length=64, primary_key=True)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.name}: {self.token}"
+
+    class Meta:
+        db_table = "generations"
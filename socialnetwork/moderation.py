@@ -0,0 +1,127 @@
+import logging
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from socialnetwork import home_timeline
+from socialnetwork.models import ModerationJobs, Posts, SocialNetworkUsers
+
+logger = logging.getLogger(__name__)
+
+# asynchronous moderation of submitted posts (see api.submit_post with asynchronous=True):
+# the post is stored unpublished together with a pending ModerationJobs row, the moderation (classification and fame
+# adjustments of api.moderate_post) is run later by a pool of workers polling the moderation_jobs table.
+# No external broker is needed, the database is the queue. A job is claimed by an atomic status update, so any number
+# of worker threads and processes can share the queue. Jobs of an author are never run concurrently as the fame
+# adjustments of one post depend on the ones of the previous post: the claiming update only matches if the author has
+# no running job, under a lock of the author's row (on SQLite, every write is serialized anyway).
+
+# number of attempts before a job is marked as failed:
+MAX_ATTEMPTS = 3
+# running jobs not finished after this time are considered abandoned by a crashed worker and are run again:
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue(post: Posts) -> ModerationJobs:
+    """Queue the moderation of a stored post."""
+    return ModerationJobs.objects.create(post=post)
+
+
+def _claim(job_id: int, author_id: int) -> bool:
+    # the check for running jobs of the author is part of the update, so that it sees the claims of other workers
+    with transaction.atomic():
+        list(SocialNetworkUsers.objects.select_for_update().filter(id=author_id).values_list("id", flat=True))
+        running = ModerationJobs.objects.filter(
+            status=ModerationJobs.RUNNING, post__author_id=OuterRef("post__author_id")
+        )
+        return bool(
+            ModerationJobs.objects.filter(id=job_id, status=ModerationJobs.PENDING)
+            .exclude(Exists(running))
+            .update(status=ModerationJobs.RUNNING, started=timezone.now(), attempts=F("attempts") + 1)
+        )
+
+
+def claim_next():
+    """Claim the oldest pending job whose author has no running job. Returns None if there is none."""
+    busy_authors = ModerationJobs.objects.filter(status=ModerationJobs.RUNNING).values("post__author_id")
+    candidates = (
+        ModerationJobs.objects.filter(status=ModerationJobs.PENDING)
+        .exclude(post__author_id__in=busy_authors)
+        .order_by("created", "id")
+        .values_list("id", "post__author_id")
+    )
+    for job_id, author_id in candidates[:10]:
+        if _claim(job_id, author_id):
+            return ModerationJobs.objects.select_related("post").get(id=job_id)
+        # claimed by another worker in the meantime, or another job of the author was, try the next one
+    return None
+
+
+def run(job: ModerationJobs):
+    """Moderate the post of a claimed job and publish the result."""
+    from socialnetwork import api
+
+    try:
+        with transaction.atomic():
+            post = job.post
+            user = SocialNetworkUsers.objects.get(id=post.author_id)
+            if user.is_banned:
+                # posts of banned users are never published
+                post.published = False
+            else:
+                api.moderate_post(user, post)
+            post.save()
+            home_timeline.fan_out(post)
+            job.status = ModerationJobs.DONE
+            job.finished = timezone.now()
+            job.save(update_fields=["status", "finished"])
+    except Exception:
+        logger.exception("Moderation of post %s failed", job.post_id)
+        job.status = ModerationJobs.FAILED if job.attempts >= MAX_ATTEMPTS else ModerationJobs.PENDING
+        job.error = traceback.format_exc()
+        job.save(update_fields=["status", "error"])
+
+
+def requeue_stale() -> int:
+    """Put running jobs abandoned by crashed workers back into the queue. Returns the number of requeued jobs."""
+    return ModerationJobs.objects.filter(
+        status=ModerationJobs.RUNNING, started__lt=timezone.now() - STALE_AFTER
+    ).update(status=ModerationJobs.PENDING)
+
+
+def process_pending(limit: int = None) -> int:
+    """Run pending jobs in the current thread until the queue is empty or limit jobs were run.
+    Returns the number of jobs run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+
+def _work(stop_when_empty: bool, poll_interval: float):
+    try:
+        while True:
+            if process_pending() == 0 and stop_when_empty:
+                return
+            time.sleep(poll_interval)
+    finally:
+        # every worker thread uses its own database connection
+        connection.close()
+
+
+def run_workers(workers: int = 4, stop_when_empty: bool = False, poll_interval: float = 1.0):
+    """Run a pool of worker threads processing the queue. Returns when the queue is empty if stop_when_empty is
+    set, otherwise runs forever."""
+    requeue_stale()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="moderation") as pool:
+        for future in [pool.submit(_work, stop_when_empty, poll_interval) for _ in range(workers)]:
+            future.result()
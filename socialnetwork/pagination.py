@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# keyset (cursor) pagination for the listing functions of socialnetwork.api:
+# posts are ordered by (submitted, id) descending, users by id ascending, bullshitters by fame level ascending, date
+# joined descending and user id ascending. A cursor encodes the sort key of the last
+# item of a page, the next page starts right after it. In contrast to offset slicing, fetching a page deep down a
+# listing costs the same as fetching the first one as the database seeks directly to the sort key.
+
+
+def parse_limit(limit, default: int = DEFAULT_PAGE_SIZE) -> int:
+    """Parse a page size given as request parameter. Raises ValueError if it is not a positive integer."""
+    if limit is None:
+        return default
+    limit = int(limit)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(key: dict) -> str:
+    """Encode a sort key into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode an opaque cursor into a sort key. Raises ValueError if the cursor is malformed."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def post_cursor(post) -> str:
+    """Cursor pointing right after the given post."""
+    return encode_cursor({"submitted": post.submitted.isoformat(), "id": post.id})
+
+
+def user_cursor(user) -> str:
+    """Cursor pointing right after the given user."""
+    return encode_cursor({"id": user.id})
+
+
+def bullshitter_cursor(entry) -> str:
+    """Cursor pointing right after the given entry of the bullshitters leaderboard."""
+    return encode_cursor(
+        {"numeric_value": entry.numeric_value, "date_joined": entry.date_joined.isoformat(), "user": entry.user_id}
+    )
+
+
+def decode_post_cursor(cursor: str):
+    """Return the (submitted, id) sort key of a post cursor."""
+    key = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(key["submitted"]), int(key["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def decode_user_cursor(cursor: str) -> int:
+    """Return the id sort key of a user cursor."""
+    key = decode_cursor(cursor)
+    try:
+        return int(key["id"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def decode_bullshitter_cursor(cursor: str):
+    """Return the (numeric_value, date_joined, user id) sort key of a bullshitter cursor."""
+    key = decode_cursor(cursor)
+    try:
+        return int(key["numeric_value"]), datetime.fromisoformat(key["date_joined"]), int(key["user"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def posts_after(submitted, post_id, submitted_field: str = "submitted", id_field: str = "id") -> Q:
+    """Q object selecting the posts after the sort key (submitted, post_id) in descending order.
+    The field names can be overridden to paginate on a denormalized copy of the sort key."""
+    # the redundant leading range lets the database seek to the sort key in an index on (submitted, id)
+    return Q(**{f"{submitted_field}__lte": submitted}) & (
+        Q(**{f"{submitted_field}__lt": submitted}) | Q(**{f"{id_field}__lt": post_id})
+    )
+
+
+def bullshitters_after(numeric_value, date_joined, user_id) -> Q:
+    """Q object selecting the leaderboard entries after the sort key (numeric_value, date_joined, user_id)."""
+    return (
+        Q(numeric_value__gt=numeric_value)
+        | Q(numeric_value=numeric_value, date_joined__lt=date_joined)
+        | Q(numeric_value=numeric_value, date_joined=date_joined, user_id__gt=user_id)
+    )
+
+
+def paginate_posts(posts, cursor: str = None, limit: int = None):
+    """Apply keyset pagination to a queryset of posts."""
+    posts = posts.order_by("-submitted", "-id")
+    if cursor is not None:
+        posts = posts.filter(posts_after(*decode_post_cursor(cursor)))
+    return posts if limit is None else posts[:limit]
+
+
+def paginate_users(users, cursor: str = None, limit: int = None):
+    """Apply keyset pagination to a queryset of users."""
+    users = users.order_by("id")
+    if cursor is not None:
+        users = users.filter(id__gt=decode_user_cursor(cursor))
+    return users if limit is None else users[:limit]
+
+
+def next_cursor(page, limit: int = None, cursor_for=post_cursor):
+    """Return the cursor of the page following the given one, or None if this is the last page."""
+    page = list(page)
+    if not page or limit is None or len(page) < limit:
+        return None
+    return cursor_for(page[-1])
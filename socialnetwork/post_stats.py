@@ -0,0 +1,108 @@
+from django.db.models import Count, F, Sum
+
+from socialnetwork.models import RATING_COUNTERS, Posts, PostStats, UserRatings
+
+# denormalized engagement counters of posts (citations, replies and ratings per type), see PostStats:
+# the counters are created together with a post and updated with F() expressions whenever a post citing or replying
+# to it or a rating is created, changed or deleted (wired up in socialnetwork.signals). Posts without counters are
+# aggregated on read, recompute/the reconcile_post_stats command (re)builds counters from the source tables.
+# Rows loaded from fixtures (raw saves) rebuild the existing counters of the posts they refer to, see rows_loaded.
+
+BATCH_SIZE = 500
+
+
+def post_created(post: Posts):
+    """Create the counters of a new post and count it as citation/reply of the posts it refers to."""
+    PostStats.objects.create(post=post)
+    if post.cites_id is not None:
+        PostStats.objects.filter(post_id=post.cites_id).update(citation_count=F("citation_count") + 1)
+    if post.replies_to_id is not None:
+        PostStats.objects.filter(post_id=post.replies_to_id).update(reply_count=F("reply_count") + 1)
+
+
+def post_deleted(post: Posts):
+    """Uncount a deleted post as citation/reply of the posts it referred to."""
+    if post.cites_id is not None:
+        PostStats.objects.filter(post_id=post.cites_id).update(citation_count=F("citation_count") - 1)
+    if post.replies_to_id is not None:
+        PostStats.objects.filter(post_id=post.replies_to_id).update(reply_count=F("reply_count") - 1)
+
+
+def add_rating(post_id: int, rating_type: str, score: int, count: int = 1):
+    """Add a rating to (or, with count=-1 and a negated score, remove it from) the counters of a post."""
+    count_field, score_field = RATING_COUNTERS[rating_type]
+    PostStats.objects.filter(post_id=post_id).update(
+        **{count_field: F(count_field) + count, score_field: F(score_field) + score}
+    )
+
+
+def rating_saved(rating: UserRatings, created: bool):
+    """Update the counters of the rated post after a rating was created or changed."""
+    if created:
+        add_rating(rating.post_id, rating.type, rating.score)
+    elif hasattr(rating, "_loaded_rating"):
+        old_type, old_score = rating._loaded_rating
+        if old_type == rating.type:
+            add_rating(rating.post_id, rating.type, rating.score - old_score, count=0)
+        else:
+            add_rating(rating.post_id, old_type, -old_score, count=-1)
+            add_rating(rating.post_id, rating.type, rating.score)
+    else:
+        # the previous values are unknown
+        recompute([rating.post_id])
+    rating._loaded_rating = (rating.type, rating.score)
+
+
+def rating_deleted(rating: UserRatings):
+    add_rating(rating.post_id, rating.type, -rating.score, count=-1)
+
+
+def rows_loaded(post_ids):
+    """Rebuild the counters of the given posts after posts or ratings referring to them were loaded from a fixture, as
+    far as they have counters. The previous values of overwritten rows are unknown, so the counters cannot be updated
+    by the difference."""
+    existing = list(
+        PostStats.objects.filter(post_id__in=[post_id for post_id in post_ids if post_id is not None]).values_list(
+            "post_id", flat=True
+        )
+    )
+    if existing:
+        recompute(existing)
+
+
+def recompute(post_ids=None):
+    """Rebuild the counters of the given posts (of all posts if None) from the posts and ratings tables."""
+    posts = Posts.objects.order_by("id")
+    if post_ids is not None:
+        posts = posts.filter(id__in=post_ids)
+    # aggregate the ratings separately, joining them with citations and replies would multiply the rows:
+    ratings = {}
+    rating_filter = {} if post_ids is None else {"post_id__in": post_ids}
+    for row in (
+        UserRatings.objects.filter(**rating_filter)
+        .values("post_id", "type")
+        .annotate(count=Count("*"), score=Sum("score"))
+        .order_by()
+    ):
+        count_field, score_field = RATING_COUNTERS[row["type"]]
+        ratings.setdefault(row["post_id"], {}).update({count_field: row["count"], score_field: row["score"]})
+
+    posts = posts.annotate(
+        citations=Count("cited_by", distinct=True), replies=Count("replied_to", distinct=True)
+    ).values_list("id", "citations", "replies")
+    fields = ["citation_count", "reply_count"] + [field for fields in RATING_COUNTERS.values() for field in fields]
+    stats = []
+    count = 0
+    for post_id, citations, replies in posts.iterator(chunk_size=BATCH_SIZE):
+        stats.append(
+            PostStats(post_id=post_id, citation_count=citations, reply_count=replies, **ratings.get(post_id, {}))
+        )
+        if len(stats) == BATCH_SIZE:
+            count += _upsert(stats, fields)
+            stats = []
+    return count + _upsert(stats, fields)
+
+
+def _upsert(stats: list, fields: list) -> int:
+    PostStats.objects.bulk_create(stats, update_conflicts=True, unique_fields=["post"], update_fields=fields)
+    return len(stats)
@@ -0,0 +1,204 @@
+import cProfile
+import json
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+# on-demand profiling of single requests (see socialnetwork.middleware.ProfilingMiddleware):
+# staff users request a profile with the X-Profile header or the profile query parameter, the value being the mode:
+# "cprofile" (the default) runs the view under cProfile, "sample" only samples the stack of the thread handling the
+# request every settings.SOCIALNETWORK_PROFILE_INTERVAL_MS milliseconds (far less overhead, but statistical). The
+# sampler yields the collapsed stacks ("root;...;leaf <microseconds>" lines, the input of flamegraph.pl, speedscope
+# and the like) and approximates the pstats from them. It does not run under cProfile, whose times it would distort,
+# so profiles in "cprofile" mode have pstats only and no collapsed stacks (cProfile only records the callers of a
+# function, not whole stacks). The files are stored with a JSON description of the request in
+# settings.SOCIALNETWORK_PROFILE_DIR (the newest settings.SOCIALNETWORK_PROFILE_KEEP profiles are kept) and can be
+# downloaded at /profiles/. Requests without the flag only pay for checking it, the middleware is not loaded at all if
+# the directory is None.
+
+MODES = ("cprofile", "sample")
+SUFFIXES = ("pstats", "collapsed", "json")
+
+# the downloadable files of the profiles of a mode:
+DOWNLOADS = {"cprofile": ("pstats",), "sample": ("pstats", "collapsed")}
+
+_profile_id = re.compile(r"[0-9]{8}T[0-9]{12}-[0-9a-f]{8}")
+
+
+def requested_mode(request) -> str:
+    """Return the profiling mode requested by a staff user, None if the request is not to be profiled. Raises a
+    ValueError for unknown modes."""
+    mode = request.META.get("HTTP_X_PROFILE")
+    if mode is None:
+        if "profile" not in request.META.get("QUERY_STRING", "") or "profile" not in request.GET:
+            return None
+        mode = request.GET["profile"]
+    if not request.user.is_staff:
+        return None
+    mode = mode.strip().lower() or MODES[0]
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode {mode!r}, expected one of {', '.join(MODES)}.")
+    return mode
+
+
+def _label(code) -> str:
+    # name and location of a function, relative to the project or to site-packages
+    path = code.co_filename
+    root = str(settings.BASE_DIR) + os.sep
+    if path.startswith(root):
+        path = path[len(root) :]
+    elif "site-packages" + os.sep in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Samples the stack of a thread in a background thread while it runs (as context manager). samples maps the
+    stacks (tuples of code objects, outermost first) to the time attributed to them in seconds: the time since the
+    previous sample."""
+
+    def __init__(self, interval: float, thread_id: int = None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="socialnetwork-profiling-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        previous = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+            self.samples[stack] = self.samples.get(stack, 0.0) + now - previous
+            previous = now
+
+    def collapsed(self) -> str:
+        """The samples as collapsed stacks, weighted in microseconds."""
+        lines = {}
+        for stack, duration in self.samples.items():
+            key = ";".join(_label(code) for code in stack)
+            lines[key] = lines.get(key, 0.0) + duration
+        return "".join(
+            f"{stack} {round(duration * 1e6)}\n" for stack, duration in sorted(lines.items()) if round(duration * 1e6)
+        )
+
+    def create_stats(self):
+        """Approximate the statistics of cProfile from the samples, for pstats.Stats: the number of calls is the
+        number of samples (so only relative), the times are the sampled ones."""
+        self.stats = {}
+
+        def entry(code):
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if key not in self.stats:
+                # calls, primitive calls, own time, cumulative time, callers
+                self.stats[key] = [0, 0, 0.0, 0.0, {}]
+            return key, self.stats[key]
+
+        for stack, duration in self.samples.items():
+            seen = set()
+            caller = None
+            for index, code in enumerate(stack):
+                key, stats = entry(code)
+                own = duration if index == len(stack) - 1 else 0.0
+                # recursive functions count once per sample:
+                if key not in seen:
+                    seen.add(key)
+                    stats[0] += 1
+                    stats[1] += 1
+                    stats[3] += duration
+                stats[2] += own
+                if caller is not None:
+                    nc, cc, tt, ct = stats[4].get(caller, (0, 0, 0.0, 0.0))
+                    stats[4][caller] = (nc + 1, cc + 1, tt + own, ct + duration)
+                caller = key
+        self.stats = {key: tuple(stats) for key, stats in self.stats.items()}
+
+
+def profile(request, get_response, mode: str):
+    """Handle the request with get_response under the profiler of the mode and store the profile, returns the response
+    and the id of the profile."""
+    started = timezone.now()
+    start = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    else:
+        with Sampler(settings.SOCIALNETWORK_PROFILE_INTERVAL_MS / 1000) as profiler:
+            response = get_response(request)
+    duration = time.perf_counter() - start
+    profiler.create_stats()
+    description = {
+        "method": request.method,
+        "path": request.get_full_path(),
+        "user": request.user.email,
+        "mode": mode,
+        "time": started.isoformat(),
+        "duration_ms": round(duration * 1000, 3),
+        "status": response.status_code,
+    }
+    if mode == "sample":
+        description["samples"] = len(profiler.samples)
+    return response, store(profiler, profiler.collapsed() if mode == "sample" else None, description)
+
+
+def store(stats, collapsed: str, description: dict) -> str:
+    """Store a profile (stats of cProfile or a Sampler, collapsed stacks if there are any and a description of the
+    request), returns its id. Drops the oldest profiles beyond settings.SOCIALNETWORK_PROFILE_KEEP."""
+    directory = Path(settings.SOCIALNETWORK_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    # sortable by time:
+    profile_id = f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    (directory / f"{profile_id}.pstats").write_bytes(marshal.dumps(stats.stats))
+    if collapsed is not None:
+        (directory / f"{profile_id}.collapsed").write_text(collapsed)
+    (directory / f"{profile_id}.json").write_text(json.dumps(description))
+    for old in list_profiles()[settings.SOCIALNETWORK_PROFILE_KEEP :]:
+        for suffix in SUFFIXES:
+            (directory / f"{old['id']}.{suffix}").unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles() -> list:
+    """The descriptions (with their id) of the stored profiles, newest first."""
+    directory = Path(settings.SOCIALNETWORK_PROFILE_DIR)
+    profiles = []
+    for path in sorted(directory.glob("*.json"), reverse=True) if directory.is_dir() else ():
+        if _profile_id.fullmatch(path.stem):
+            try:
+                profiles.append({"id": path.stem, **json.loads(path.read_text())})
+            except (OSError, ValueError):
+                pass
+    return profiles
+
+
+def profile_path(profile_id: str, suffix: str) -> Path:
+    """The file of a stored profile, None if there is none."""
+    if not _profile_id.fullmatch(profile_id) or suffix not in SUFFIXES:
+        return None
+    path = Path(settings.SOCIALNETWORK_PROFILE_DIR) / f"{profile_id}.{suffix}"
+    return path if path.is_file() else None
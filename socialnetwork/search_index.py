@@ -0,0 +1,67 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+# full-text index over the content and the author of posts, backed by an SQLite FTS5 virtual table:
+# the rowid of an entry is the id of the post. The index is kept in sync by triggers on posts and fame_users
+# (see migration 0003_posts_search_index), so that every way of creating posts (api, bulk_create, fixtures) is covered.
+# On databases without FTS5 the index does not exist and api.search falls back to substring matching.
+
+TABLE = "posts_search"
+
+_available = {}
+
+
+def is_available() -> bool:
+    """Check whether the full-text index exists in the current database."""
+    name = connection.settings_dict["NAME"]
+    if name not in _available:
+        _available[name] = connection.vendor == "sqlite" and TABLE in connection.introspection.table_names()
+    return _available[name]
+
+
+def rebuild():
+    """Rebuild the full-text index from scratch."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"""INSERT INTO {TABLE}(rowid, content, author_name, author_email)
+            SELECT p.id, p.content, u.first_name || ' ' || u.last_name, u.email
+            FROM posts p JOIN fame_users u ON u.id = p.author_id"""
+        )
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+
+
+def match_expression(keyword: str):
+    """Translate a search keyword into an FTS5 query: all words of the keyword have to occur as a word prefix.
+    Returns None if the keyword does not contain any word."""
+    words = re.findall(r"\w+", keyword)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def filter_matching(posts, keyword: str):
+    """Restrict a queryset of posts to the posts matching the keyword."""
+    expression = match_expression(keyword)
+    if expression is None:
+        return posts.none()
+    return posts.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expression])
+    )
+
+
+def rank_matching(posts, keyword: str):
+    """Restrict a queryset of posts to the posts matching the keyword, best matches first.
+    The relevance is annotated as search_rank (bm25, lower is better)."""
+    expression = match_expression(keyword)
+    if expression is None:
+        return posts.none()
+    return posts.extra(
+        tables=[TABLE],
+        where=[f"{TABLE}.rowid = posts.id", f"{TABLE} MATCH %s"],
+        params=[expression],
+        select={"search_rank": f"bm25({TABLE})"},
+        order_by=["search_rank", "-submitted"],
+    )
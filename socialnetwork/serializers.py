@@ -1,8 +1,37 @@
-from django.db.models import Sum
+from django.db.models import Count, F, IntegerField, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
-from .models import Posts, SocialNetworkUsers
+from socialnetwork import instrumentation
+
+from .models import RATING_COUNTERS, Posts, PostExpertiseAreasAndRatings, PostStats, SocialNetworkUsers, UserRatings
+
+
+def _count_referencing(field: str, counter: str) -> Coalesce:
+    """The counter of the outer post if it has PostStats, otherwise a correlated subquery counting the posts
+    referencing it through the given field, e.g. cites."""
+    referencing = Posts.objects.filter(**{field: OuterRef("pk")}).order_by().values(field)
+    return Coalesce(
+        F(f"stats__{counter}"),
+        Subquery(referencing.annotate(count=Count("*")).values("count")),
+        0,
+        output_field=IntegerField(),
+    )
+
+
+def _is_prefetched(post: Posts, name: str) -> bool:
+    return name in getattr(post, "_prefetched_objects_cache", {})
+
+
+def _stats_of(post: Posts):
+    """The counters of the post if they were loaded along with it and exist, None otherwise."""
+    if not Posts.stats.is_cached(post):
+        return None
+    try:
+        return post.stats
+    except PostStats.DoesNotExist:
+        return None
 
 
 class SocialNetworkUsersSerializer(serializers.ModelSerializer):
@@ -32,6 +61,36 @@ class PostsSerializer(serializers.ModelSerializer):
             "published",
         ]
 
+    @staticmethod
+    def setup_eager_loading(posts):
+        """Load everything the serializer needs for a queryset of posts in a constant number of queries:
+        the author and the engagement counters are joined and the expertise areas and truth ratings of all posts are
+        prefetched. For posts without counters, the citation and reply counts are annotated and the user ratings are
+        prefetched. The serialized data is the same as without eager loading."""
+        return (
+            posts.select_related("author", "stats")
+            .annotate(
+                citations_count=_count_referencing("cites", "citation_count"),
+                replies_count=_count_referencing("replies_to", "reply_count"),
+            )
+            .prefetch_related(
+                Prefetch(
+                    "postexpertiseareasandratings_set",
+                    queryset=PostExpertiseAreasAndRatings.objects.select_related(
+                        "expertise_area", "truth_rating"
+                    ).order_by("id"),
+                ),
+                Prefetch(
+                    "userratings_set",
+                    queryset=UserRatings.objects.filter(post__stats__isnull=True).only("post_id", "type", "score"),
+                ),
+            )
+        )
+
+    @instrumentation.timed("serializer")
+    def to_representation(self, instance):
+        return super().to_representation(instance)
+
     def get_expertise_area_and_truth_ratings(self, post: Posts):
         ret = {}
         for pear in post.postexpertiseareasandratings_set.all():
@@ -48,16 +107,28 @@ class PostsSerializer(serializers.ModelSerializer):
         return ret
 
     def get_citations(self, post: Posts):
+        if hasattr(post, "citations_count"):
+            return post.citations_count
         return Posts.objects.filter(cites=post).count()
 
     def get_replies(self, post: Posts):
+        if hasattr(post, "replies_count"):
+            return post.replies_count
         return Posts.objects.filter(replies_to=post).count()
 
     def get_date_submitted(self, post: Posts):
         return post.submitted.strftime("%Y-%m-%d %H:%M")
 
     def get_user_ratings(self, post: Posts):
+        stats = _stats_of(post)
+        if stats is not None:
+            return stats.user_ratings()
         ret = {}
+        if _is_prefetched(post, "userratings_set"):
+            # sum up the prefetched ratings, ordered by type as the grouped query below
+            for rating in sorted(post.userratings_set.all(), key=lambda rating: rating.type):
+                ret[rating.type] = ret.get(rating.type, 0) + rating.score
+            return ret
         for pur in post.userratings_set.values("type").annotate(score=Sum("score")):
             ret[pur["type"]] = pur["score"]
         return ret
@@ -68,3 +139,95 @@ class PostsSerializer(serializers.ModelSerializer):
             "email": post.author.email,
             "name": post.author.first_name + " " + post.author.last_name,
         }
+
+
+# fast path of PostsSerializer for read-only endpoints:
+# the posts are read as .values() rows and turned into the serialized data by plain Python code, instead of going
+# through model instances and the serializer fields of DRF for every post. The data is the same as the one of
+# PostsSerializer with setup_eager_loading.
+
+_STATS_FIELDS = [field for fields in RATING_COUNTERS.values() for field in fields]
+
+
+class PostRow:
+    """A serialized post: its data in the format of PostsSerializer and its sort key, so that it can be passed to
+    pagination.next_cursor like a post."""
+
+    __slots__ = ("id", "submitted", "data")
+
+    def __init__(self, id: int, submitted, data: dict):
+        self.id = id
+        self.submitted = submitted
+        self.data = data
+
+
+@instrumentation.timed("serializer")
+def serialize_posts(posts) -> list:
+    """Serialize a queryset of posts with a constant number of queries, returns a list of PostRow."""
+    rows = list(
+        posts.values(
+            "id",
+            "content",
+            "submitted",
+            "published",
+            "author_id",
+            "author__email",
+            "author__first_name",
+            "author__last_name",
+            "stats__post_id",
+            *[f"stats__{field}" for field in _STATS_FIELDS],
+            citations_count=_count_referencing("cites", "citation_count"),
+            replies_count=_count_referencing("replies_to", "reply_count"),
+        )
+    )
+    post_ids = [row["id"] for row in rows]
+
+    expertise_areas = {}
+    for post_id, label, truth_rating_id, name, numeric_value in (
+        PostExpertiseAreasAndRatings.objects.filter(post_id__in=post_ids)
+        .order_by("id")
+        .values_list(
+            "post_id", "expertise_area__label", "truth_rating_id", "truth_rating__name", "truth_rating__numeric_value"
+        )
+    ):
+        expertise_areas.setdefault(post_id, {})[label] = (
+            {"name": "unknown", "numeric_value": 0}
+            if truth_rating_id is None
+            else {"name": name, "numeric_value": numeric_value}
+        )
+
+    # the ratings of posts without counters are summed up, ordered by type as in PostsSerializer.get_user_ratings:
+    ratings = {}
+    for post_id, rating_type, score in UserRatings.objects.filter(
+        post_id__in=[row["id"] for row in rows if row["stats__post_id"] is None]
+    ).values_list("post_id", "type", "score"):
+        ratings.setdefault(post_id, []).append((rating_type, score))
+
+    ret = []
+    for row in rows:
+        if row["stats__post_id"] is not None:
+            user_ratings = {}
+            for rating_type in sorted(RATING_COUNTERS):
+                count_field, score_field = RATING_COUNTERS[rating_type]
+                if row[f"stats__{count_field}"]:
+                    user_ratings[rating_type] = row[f"stats__{score_field}"]
+        else:
+            user_ratings = {}
+            for rating_type, score in sorted(ratings.get(row["id"], []), key=lambda rating: rating[0]):
+                user_ratings[rating_type] = user_ratings.get(rating_type, 0) + score
+        data = {
+            "content": row["content"],
+            "author": {
+                "id": row["author_id"],
+                "email": row["author__email"],
+                "name": row["author__first_name"] + " " + row["author__last_name"],
+            },
+            "expertise_area_and_truth_ratings": expertise_areas.get(row["id"], {}),
+            "date_submitted": row["submitted"].strftime("%Y-%m-%d %H:%M"),
+            "user_ratings": user_ratings,
+            "citations": row["citations_count"],
+            "replies": row["replies_count"],
+            "published": row["published"],
+        }
+        ret.append(PostRow(row["id"], row["submitted"], data))
+    return ret
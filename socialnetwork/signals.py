@@ -0,0 +1,190 @@
+from django.db.backends.signals import connection_created
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from fame.models import ExpertiseAreas, Fame, FameLevels, FameUsers
+from socialnetwork import (
+    follow_graph,
+    leaderboard,
+    magic_AI,
+    post_stats,
+    similarity,
+    similarity_table,
+    slow_queries,
+    taxonomy,
+)
+from socialnetwork.models import PostExpertiseAreasAndRatings, Posts, SocialNetworkUsers, TruthRatings, UserRatings
+
+
+# the classifier works on a snapshot of the taxonomy and the truth ratings, drop it whenever one of them changes:
+@receiver(post_save, sender=ExpertiseAreas, dispatch_uid="magic_AI_expertise_areas_saved")
+@receiver(post_delete, sender=ExpertiseAreas, dispatch_uid="magic_AI_expertise_areas_deleted")
+@receiver(post_save, sender=TruthRatings, dispatch_uid="magic_AI_truth_ratings_saved")
+@receiver(post_delete, sender=TruthRatings, dispatch_uid="magic_AI_truth_ratings_deleted")
+def invalidate_classifier_snapshot(sender, **kwargs):
+    magic_AI.invalidate()
+
+
+# closure table of the taxonomy, new leaves are added incrementally, the table is only rebuilt if the parent of an
+# area changed or a fixture row (raw) was loaded out of order, see taxonomy.update:
+@receiver(post_save, sender=ExpertiseAreas, dispatch_uid="taxonomy_expertise_areas_saved")
+def update_taxonomy(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        taxonomy.add_leaf(instance)
+    else:
+        taxonomy.update(instance)
+
+
+# the similarity engine works on a snapshot of the fame levels and join dates of all users, the precomputed lists of
+# similar users depend on the same data:
+@receiver(post_save, sender=Fame, dispatch_uid="similarity_fame_saved")
+@receiver(post_delete, sender=Fame, dispatch_uid="similarity_fame_deleted")
+def invalidate_similarities_of_fame(sender, instance, **kwargs):
+    similarity.invalidate()
+    similarity_table.fame_changed(instance)
+
+
+@receiver(post_save, sender=FameLevels, dispatch_uid="similarity_fame_levels_saved")
+@receiver(post_delete, sender=FameLevels, dispatch_uid="similarity_fame_levels_deleted")
+def invalidate_all_similarities(sender, **kwargs):
+    similarity.invalidate()
+    similarity_table.mark_stale()
+
+
+@receiver(post_delete, sender=FameUsers, dispatch_uid="similarity_users_deleted")
+def invalidate_fame_matrix(sender, **kwargs):
+    # the stored lists containing the user are cleaned up by the cascade
+    similarity.invalidate()
+
+
+# the similarities and the bullshitters leaderboard only depend on the join date of users, saves that keep it (e.g. of
+# last_login on every login, of the user by api.moderate_post on every submission) do not affect them. Users not
+# loaded from the database (new ones, fixture rows) count as changed:
+@receiver(pre_save, sender=FameUsers, dispatch_uid="date_joined_users_saving")
+@receiver(pre_save, sender=SocialNetworkUsers, dispatch_uid="date_joined_social_network_users_saving")
+def detect_date_joined_change(sender, instance, update_fields, **kwargs):
+    instance._date_joined_changed = (update_fields is None or "date_joined" in update_fields) and (
+        getattr(instance, "_loaded_date_joined", None) != instance.date_joined
+    )
+    instance._loaded_date_joined = instance.date_joined
+
+
+@receiver(post_save, sender=FameUsers, dispatch_uid="similarity_users_saved")
+@receiver(post_save, sender=SocialNetworkUsers, dispatch_uid="similarity_social_network_users_saved")
+def invalidate_similarities_of_user(sender, instance, **kwargs):
+    if instance._date_joined_changed:
+        similarity.invalidate()
+        similarity_table.user_changed(instance)
+
+
+# the bullshitters leaderboard copies the fame levels and join dates of users with negative fame, entries of deleted
+# fames are removed by the cascade. Fixture rows (raw) are included, the users and fame levels are loaded before them:
+@receiver(post_save, sender=Fame, dispatch_uid="leaderboard_fame_saved")
+def update_leaderboard_of_fame(sender, instance, **kwargs):
+    leaderboard.refresh(Fame.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=FameLevels, dispatch_uid="leaderboard_fame_levels_saved")
+def update_leaderboard_of_fame_level(sender, instance, **kwargs):
+    leaderboard.refresh(Fame.objects.filter(fame_level=instance))
+
+
+@receiver(post_save, sender=FameUsers, dispatch_uid="leaderboard_users_saved")
+@receiver(post_save, sender=SocialNetworkUsers, dispatch_uid="leaderboard_social_network_users_saved")
+def update_leaderboard_of_user(sender, instance, **kwargs):
+    if instance._date_joined_changed:
+        leaderboard.user_changed(instance)
+
+
+# engagement counters of posts, see socialnetwork.post_stats.
+# Rows loaded from fixtures (raw) rebuild the existing counters of the posts they refer to, posts loaded from fixtures
+# get no counters of their own (they are aggregated on read until the reconcile_post_stats command is run):
+@receiver(post_save, sender=Posts, dispatch_uid="post_stats_post_saved")
+def count_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        post_stats.rows_loaded([instance.pk, instance.cites_id, instance.replies_to_id])
+    elif created:
+        post_stats.post_created(instance)
+
+
+@receiver(post_delete, sender=Posts, dispatch_uid="post_stats_post_deleted")
+def uncount_post(sender, instance, **kwargs):
+    post_stats.post_deleted(instance)
+
+
+@receiver(post_save, sender=UserRatings, dispatch_uid="post_stats_rating_saved")
+def count_rating(sender, instance, created, raw, **kwargs):
+    if raw:
+        post_stats.rows_loaded([instance.post_id])
+    else:
+        post_stats.rating_saved(instance, created)
+
+
+@receiver(post_delete, sender=UserRatings, dispatch_uid="post_stats_rating_deleted")
+def uncount_rating(sender, instance, **kwargs):
+    post_stats.rating_deleted(instance)
+
+
+@receiver(m2m_changed, sender=Posts.user_ratings.through, dispatch_uid="post_stats_ratings_changed")
+def recount_ratings(sender, instance, action, reverse, pk_set, **kwargs):
+    # ratings added or removed through the related managers, e.g. post.user_ratings.add(user, through_defaults=...)
+    if action == "pre_clear" and reverse:
+        instance._cleared_rated_post_ids = list(instance.userratings_set.values_list("post_id", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        if not reverse:
+            post_stats.recompute([instance.pk])
+        elif action == "post_clear":
+            post_stats.recompute(instance.__dict__.pop("_cleared_rated_post_ids", []))
+        else:
+            post_stats.recompute(pk_set)
+
+
+# copy of the submission date of the post in its expertise areas and truth ratings, see api.expertise_area_feed.
+# Rows created by Posts.determine_expertise_areas_and_truth_ratings set it themselves:
+@receiver(pre_save, sender=PostExpertiseAreasAndRatings, dispatch_uid="pear_post_submitted_saved")
+def copy_post_submitted(sender, instance, **kwargs):
+    if instance.post_submitted is None:
+        instance.post_submitted = Posts.objects.filter(pk=instance.post_id).values_list("submitted", flat=True).first()
+
+
+@receiver(m2m_changed, sender=Posts.expertise_area_and_truth_ratings.through, dispatch_uid="pear_post_submitted_added")
+def copy_post_submitted_of_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # rows added through the related managers, e.g. post.expertise_area_and_truth_ratings.add(area)
+    if action != "post_add":
+        return
+    if reverse:
+        added = PostExpertiseAreasAndRatings.objects.filter(expertise_area=instance, post_id__in=pk_set)
+    else:
+        added = PostExpertiseAreasAndRatings.objects.filter(post=instance, expertise_area_id__in=pk_set)
+    added.filter(post_submitted__isnull=True).update(
+        post_submitted=Subquery(Posts.objects.filter(pk=OuterRef("post_id")).values("submitted")[:1])
+    )
+
+
+# cached follows and communities of users, see socialnetwork.follow_graph. Writes of api.follow, api.unfollow,
+# api.join_community and api.leave_community drop the sets themselves:
+@receiver(m2m_changed, sender=SocialNetworkUsers.follows.through, dispatch_uid="follow_graph_follows_changed")
+def invalidate_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    follow_graph.relation_changed(follow_graph.FOLLOWS, instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=SocialNetworkUsers.communities.through, dispatch_uid="follow_graph_communities_changed")
+def invalidate_communities(sender, instance, action, reverse, pk_set, **kwargs):
+    follow_graph.relation_changed(follow_graph.COMMUNITIES, instance, action, reverse, pk_set)
+
+
+@receiver(pre_delete, sender=SocialNetworkUsers, dispatch_uid="follow_graph_users_deleted")
+def invalidate_follows_of_followers(sender, instance, **kwargs):
+    follow_graph.deleted(follow_graph.FOLLOWS, instance.pk)
+
+
+@receiver(pre_delete, sender=ExpertiseAreas, dispatch_uid="follow_graph_communities_deleted")
+def invalidate_communities_of_members(sender, instance, **kwargs):
+    follow_graph.deleted(follow_graph.COMMUNITIES, instance.pk)
+
+
+# slow-query log, see socialnetwork.slow_queries:
+@receiver(connection_created, dispatch_uid="slow_queries_connection_created")
+def install_slow_query_hook(sender, connection, **kwargs):
+    slow_queries.install(connection)
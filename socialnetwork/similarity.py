@@ -0,0 +1,141 @@
+import json
+import uuid
+
+import numpy as np
+from django.db import connection
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from fame.models import Fame, FameUsers
+from socialnetwork.models import Generations
+
+# vectorized engine for api.similar_users:
+# the fame of all users is kept in memory as a dense user x expertise area matrix of FameLevels.numeric_value (NaN where
+# a user has no fame in an area), so that the similarity of one user with all other users is computed in a single
+# vectorized pass instead of a Python loop over all users. The save and delete signals of Fame, FameLevels and
+# FameUsers invalidate it (see socialnetwork.signals): the matrix of the process is dropped and a new token is stored
+# as the generation of the fame data in the database. Other processes (web workers, the moderation workers) compare
+# the generation of their matrix with the stored one on every use and reload it when they differ. Random tokens
+# instead of a counter, so that a generation set in a transaction that is rolled back is never reused.
+
+# two fame levels agree if they differ by at most this value:
+AGREEMENT_DISTANCE = 100
+
+# name of the generation of the fame data in Generations:
+GENERATION = "fame"
+
+# in-memory snapshot of the fame of all users, see get_matrix:
+_matrix = None
+
+
+class FameMatrix:
+    """Fame levels of all users having fame in at least one expertise area."""
+
+    def __init__(self, user_ids, date_joined, area_ids, levels):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        # timestamps of date_joined, used to break ties like the original Python implementation
+        self.date_joined = np.asarray(date_joined, dtype=np.float64)
+        self.levels = levels
+        self.row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+        self.column_of = {area_id: column for column, area_id in enumerate(area_ids)}
+        # generation of the fame data the matrix was loaded from, see get_matrix
+        self.generation = None
+
+    @classmethod
+    def load(cls):
+        """Load the matrix from the fame and users tables with two queries."""
+        fame = list(Fame.objects.order_by().values_list("user_id", "expertise_area_id", "fame_level__numeric_value"))
+        user_ids = sorted({user_id for user_id, _, _ in fame})
+        area_ids = sorted({area_id for _, area_id, _ in fame})
+        row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+        column_of = {area_id: column for column, area_id in enumerate(area_ids)}
+        levels = np.full((len(user_ids), len(area_ids)), np.nan)
+        for user_id, area_id, value in fame:
+            levels[row_of[user_id], column_of[area_id]] = value
+        joined = dict(FameUsers.objects.values_list("id", "date_joined"))
+        return cls(user_ids, [joined[user_id].timestamp() for user_id in user_ids], area_ids, levels)
+
+    def similarities(self, user_id: int, limit: int = None) -> list:
+        """Compute the similarity of the user with all other users: the share of the expertise areas of the user in
+        which the other user has a fame level that agrees with the one of the user.
+        Returns (user id, similarity) pairs of the users with a non-zero similarity, sorted by similarity and then
+        date_joined, both descending. At most limit pairs are returned if limit is given."""
+        row = self.row_of.get(user_id)
+        if row is None:
+            return []
+        columns = np.flatnonzero(~np.isnan(self.levels[row]))
+        # comparisons with NaN are false, i.e. areas in which the other user has no fame never agree:
+        with np.errstate(invalid="ignore"):
+            agreements = (
+                np.abs(self.levels[:, columns] - self.levels[row, columns]) <= AGREEMENT_DISTANCE
+            ).sum(axis=1)
+        agreements[row] = 0
+        candidates = np.flatnonzero(agreements)
+        similarities = agreements[candidates] / len(columns)
+        # the last key is the primary one:
+        order = np.lexsort((-self.date_joined[candidates], -similarities))[:limit]
+        return [
+            (int(user_id), float(similarity))
+            for user_id, similarity in zip(self.user_ids[candidates[order]], similarities[order])
+        ]
+
+
+def generation() -> str:
+    """Return the current generation of the fame data, None if it was never invalidated."""
+    return Generations.objects.filter(name=GENERATION).values_list("token", flat=True).first()
+
+
+def invalidate(*args, **kwargs):
+    """Drop the fame matrix of this process and start a new generation of the fame data, so that all processes reload
+    their matrix on the next use."""
+    global _matrix
+    _matrix = None
+    token = uuid.uuid4().hex
+    if not Generations.objects.filter(name=GENERATION).update(token=token):
+        Generations.objects.bulk_create([Generations(name=GENERATION, token=token)], ignore_conflicts=True)
+        Generations.objects.filter(name=GENERATION).update(token=token)
+
+
+def get_matrix(check: bool = True) -> FameMatrix:
+    """Return the fame matrix, reloaded if its generation is not the current one. Without check, the matrix of the
+    process is returned as it is (loaded if there is none), e.g. in forked workers that must not use the database."""
+    global _matrix
+    if _matrix is not None and not check:
+        return _matrix
+    # read before loading, a change while loading gives a newer matrix under the older generation, reloaded next time:
+    current = generation()
+    if _matrix is None or _matrix.generation != current:
+        matrix = FameMatrix.load()
+        matrix.generation = current
+        _matrix = matrix
+    return _matrix
+
+
+def similarities(user_id: int, limit: int = None) -> list:
+    """See FameMatrix.similarities."""
+    return get_matrix().similarities(user_id, limit)
+
+
+def annotate_similarities(pairs: list):
+    """Return the users of the given (user id, similarity) pairs as a queryset of FameUsers annotated with
+    'similarity', sorted by similarity and then date_joined, both descending."""
+    if not pairs:
+        return FameUsers.objects.none()
+    if connection.vendor == "sqlite":
+        # pass all similarities as a single JSON parameter instead of one CASE branch per user:
+        similarity_of = json.dumps({str(user_id): similarity for user_id, similarity in pairs})
+        users = FameUsers.objects.filter(
+            id__in=RawSQL("SELECT CAST(key AS INTEGER) FROM json_each(%s)", [similarity_of])
+        ).annotate(
+            similarity=RawSQL(
+                "json_extract(%s, '$.\"' || fame_users.id || '\"')", [similarity_of], output_field=FloatField()
+            )
+        )
+    else:
+        users = FameUsers.objects.filter(id__in=[user_id for user_id, _ in pairs]).annotate(
+            similarity=Case(
+                *[When(id=user_id, then=Value(similarity)) for user_id, similarity in pairs],
+                output_field=FloatField(),
+            )
+        )
+    return users.order_by("-similarity", "-date_joined")
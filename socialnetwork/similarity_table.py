@@ -0,0 +1,122 @@
+import multiprocessing
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from fame.models import Fame, FameUsers
+from socialnetwork import similarity
+from socialnetwork.models import SimilarUsers, SimilarUsersLists
+
+# precomputed lists of similar users for api.similar_users:
+# the most similar users of every user are stored in SimilarUsers (capped to LIST_SIZE per user) and read back with an
+# indexed lookup. A list is marked stale when a fame it depends on changes (wired up in socialnetwork.signals) and
+# recomputed on its next read, so that only the lists of affected users are refreshed. The build_similarity_table
+# command computes all (or all stale) lists in bulk across a process pool.
+# Lists are only computed from a fame matrix of the current generation (see socialnetwork.similarity). A list computed
+# while the fame changed (i.e. the generation moved on before it was stored) is stored as stale, so that it is never
+# taken for up to date.
+
+# maximum number of similar users stored per user:
+LIST_SIZE = 100
+# number of users computed per task of the process pool:
+CHUNK_SIZE = 500
+BATCH_SIZE = 500
+
+
+def _compute(user_ids: list) -> list:
+    # on the matrix loaded before, also in the forked processes of build. One more than stored to find out whether the
+    # list is complete
+    matrix = similarity.get_matrix(check=False)
+    return [(user_id, matrix.similarities(user_id, LIST_SIZE + 1)) for user_id in user_ids]
+
+
+@transaction.atomic
+def store(lists: list, generation: str):
+    """Replace the stored lists of the given (user id, [(user id, similarity), ...]) pairs, computed from the fame
+    matrix of the given generation."""
+    user_ids = [user_id for user_id, _ in lists]
+    SimilarUsers.objects.filter(user_id__in=user_ids).delete()
+    SimilarUsers.objects.bulk_create(
+        [
+            SimilarUsers(user_id=user_id, other_user_id=other_user_id, similarity=value, rank=rank)
+            for user_id, pairs in lists
+            for rank, (other_user_id, value) in enumerate(pairs[:LIST_SIZE])
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    SimilarUsersLists.objects.bulk_create(
+        [SimilarUsersLists(user_id=user_id, stale=False, complete=len(pairs) <= LIST_SIZE) for user_id, pairs in lists],
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["computed", "stale", "complete"],
+    )
+    # checked after writing: changes committed before are seen here, later ones mark the lists stale themselves
+    if similarity.generation() != generation:
+        SimilarUsersLists.objects.filter(user_id__in=user_ids).update(stale=True)
+
+
+def refresh(user_ids: list):
+    """Recompute the stored lists of the given users."""
+    generation = similarity.get_matrix().generation
+    store(_compute(user_ids), generation)
+
+
+def build(processes: int = None, stale_only: bool = False) -> int:
+    """Compute the stored lists of all users (only the stale ones if stale_only is set) with a pool of processes.
+    Returns the number of computed lists."""
+    if stale_only:
+        user_ids = list(SimilarUsersLists.objects.filter(stale=True).values_list("user_id", flat=True))
+    else:
+        user_ids = list(FameUsers.objects.order_by("id").values_list("id", flat=True))
+    chunks = [user_ids[i : i + CHUNK_SIZE] for i in range(0, len(user_ids), CHUNK_SIZE)]
+    # the matrix is loaded before the processes are forked, so that they share it and never touch the database:
+    generation = similarity.get_matrix().generation
+    if processes == 1 or len(chunks) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        for chunk in chunks:
+            store(_compute(chunk), generation)
+    else:
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            for lists in pool.imap_unordered(_compute, chunks):
+                store(lists, generation)
+    return len(user_ids)
+
+
+def mark_stale(condition: Q = None):
+    """Mark the lists of the users matching the condition on SimilarUsersLists (all lists if None) as stale."""
+    lists = SimilarUsersLists.objects.filter(stale=False)
+    if condition is not None:
+        lists = lists.filter(condition)
+    lists.update(stale=True)
+
+
+def fame_changed(fame: Fame):
+    """Mark the lists affected by a created, changed or deleted fame as stale: the list of its user and the lists of
+    all users having fame in its expertise area."""
+    mark_stale(
+        Q(user_id=fame.user_id)
+        | Q(user_id__in=Fame.objects.filter(expertise_area_id=fame.expertise_area_id).values("user_id"))
+    )
+
+
+def user_changed(user: FameUsers):
+    """Mark the list of a user and the lists containing the user as stale, e.g. after the date joined changed."""
+    mark_stale(Q(user_id=user.id) | Q(user_id__in=SimilarUsers.objects.filter(other_user=user).values("user_id")))
+
+
+def lookup(user_id: int, limit: int = None):
+    """Return the similar users of a user from the stored list, refreshing the list first if it is stale or missing.
+    Returns None if the stored list is capped below the requested number of users."""
+    state = SimilarUsersLists.objects.filter(user_id=user_id).first()
+    if state is None or state.stale:
+        refresh([user_id])
+        state = SimilarUsersLists.objects.get(user_id=user_id)
+    if not state.complete and (limit is None or limit > LIST_SIZE):
+        return None
+    # the filter and the annotation use the same join, i.e. the same SimilarUsers row:
+    users = (
+        FameUsers.objects.filter(similar_to__user_id=user_id)
+        .annotate(similarity=F("similar_to__similarity"))
+        .order_by("similar_to__rank")
+    )
+    return users if limit is None else users[:limit]
@@ -0,0 +1,152 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# slow-query log:
+# every connection runs its queries through hook (installed as execute wrapper when the connection is created, see
+# socialnetwork.signals). Queries taking at least settings.SOCIALNETWORK_SLOW_QUERY_MS milliseconds (None disables the
+# log) are logged to the logger socialnetwork.slow_queries as one JSON object per line: the SQL, its parameters, the
+# duration, the innermost call site in the code of the project and, for reads, the query plan (EXPLAIN QUERY PLAN on
+# SQLite). The settings route the logger to a rotating file, the slow_queries command summarizes it.
+
+# maximum length of logged string parameters:
+MAX_PARAM_LENGTH = 200
+
+# set while the plan of a slow query is queried, which must not be logged itself:
+_local = threading.local()
+# lists of parameters of IN lookups, which are folded to group the queries of different list lengths:
+_in_list = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+def install(connection):
+    """Run the queries of the connection through hook."""
+    if hook not in connection.execute_wrappers:
+        # as outermost wrapper: execute_wrapper() blocks that are open remove the last wrapper when they exit
+        connection.execute_wrappers.insert(0, hook)
+
+
+def hook(execute, sql, params, many, context):
+    threshold = getattr(settings, "SOCIALNETWORK_SLOW_QUERY_MS", None)
+    if threshold is None or getattr(_local, "explaining", False):
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    ret = execute(sql, params, many, context)
+    duration = (time.perf_counter() - start) * 1000
+    if duration >= threshold:
+        log(context["connection"], sql, params, many, duration)
+    return ret
+
+
+def log(connection, sql: str, params, many: bool, duration: float):
+    """Log a slow query, see the module description."""
+    record = {
+        "time": timezone.now().isoformat(),
+        "duration_ms": round(duration, 3),
+        "sql": sql,
+        # of executemany, only the number of parameter sets:
+        "params": len(params) if many else [_param(param) for param in params or ()],
+        "call_site": call_site(),
+        "plan": None if many else explain(connection, sql, params),
+    }
+    logger.warning(json.dumps(record, default=str))
+
+
+def _param(param):
+    if isinstance(param, (bytes, memoryview)):
+        return f"<{len(param)} bytes>"
+    if isinstance(param, str) and len(param) > MAX_PARAM_LENGTH:
+        return param[:MAX_PARAM_LENGTH] + "..."
+    return param
+
+
+def call_site() -> str:
+    """Return the innermost frame of the current stack in the code of the project as path:line in function."""
+    root = str(settings.BASE_DIR) + os.sep
+    for frame in reversed(traceback.extract_stack()):
+        if (
+            frame.filename.startswith(root)
+            and frame.filename != __file__
+            and "site-packages" not in frame.filename
+        ):
+            return f"{os.path.relpath(frame.filename, root)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+def explain(connection, sql: str, params) -> list:
+    """Return the query plan of a read as a list of lines, None for writes."""
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    _local.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            rows = cursor.fetchall()
+    except DatabaseError as e:
+        return [f"EXPLAIN failed: {e}"]
+    finally:
+        _local.explaining = False
+    if connection.vendor != "sqlite":
+        return [str(row[0]) for row in rows]
+    # (id, parent, notused, detail) rows of a tree, indented by depth:
+    depths = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depths[node_id] = depths.get(parent, -1) + 1
+        lines.append("  " * depths[node_id] + detail)
+    return lines
+
+
+def is_full_scan(plan: list) -> bool:
+    """Whether a SQLite query plan scans a whole table instead of searching an index."""
+    return any(line.strip().startswith("SCAN ") and " USING " not in line for line in plan or ())
+
+
+def read_log(path: str) -> list:
+    """Read the records of a slow-query log and of its rotated backups (path.1, path.2, ...), invalid lines are
+    skipped."""
+    records = []
+    for file_path in [path, *sorted(glob.glob(glob.escape(path) + ".*"))]:
+        if not os.path.isfile(file_path):
+            continue
+        with open(file_path) as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    pass
+    return records
+
+
+def summarize(records: list) -> list:
+    """Group the records by their SQL (with IN lists of any length folded) and return one dict per query: count,
+    total, max and mean duration, the call sites with their counts, the plan of its slowest run and whether it is a
+    full scan."""
+    groups = {}
+    for record in records:
+        key = _in_list.sub("IN (...)", record["sql"])
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {"sql": key, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "call_sites": Counter()}
+        group["count"] += 1
+        group["total_ms"] += record["duration_ms"]
+        group["call_sites"][record.get("call_site")] += 1
+        if record["duration_ms"] >= group["max_ms"]:
+            group["max_ms"] = record["duration_ms"]
+            group["plan"] = record.get("plan")
+            group["params"] = record.get("params")
+    for group in groups.values():
+        group["mean_ms"] = group["total_ms"] / group["count"]
+        group["full_scan"] = is_full_scan(group["plan"])
+    return list(groups.values())
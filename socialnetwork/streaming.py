@@ -0,0 +1,62 @@
+import re
+
+from django.http import StreamingHttpResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from socialnetwork.renderers import FastJSONRenderer
+
+# streaming mode of the list endpoints (?stream=1):
+# instead of serializing the whole queryset into one list before the first byte is sent, the queryset is iterated in
+# chunks with .iterator(chunk_size=...) (prefetches are done per chunk) and the JSON array is written chunk by chunk,
+# so that memory stays flat for large exports. Each chunk is rendered with the renderer of the regular responses, the
+# streamed bytes are the same as the ones of the regular response. If the client accepts it, the stream is
+# gzip-compressed on the fly.
+
+CHUNK_SIZE = 500
+
+_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def wants_stream(request) -> bool:
+    """Check whether the streaming mode was requested with the query parameter stream."""
+    return request.GET.get("stream", "").lower() in ("1", "true")
+
+
+def json_array(queryset, serialize, chunk_size: int = None):
+    """Yield the JSON array of the serialized objects of a queryset piece by piece, serialize maps a list of objects
+    to their serialized data, e.g. lambda posts: PostsSerializer(posts, many=True).data."""
+    chunk_size = chunk_size or CHUNK_SIZE
+    renderer = FastJSONRenderer()
+    separator = b""
+    chunk = []
+
+    def render(chunk):
+        # the rendered list without its brackets
+        return renderer.render(serialize(chunk))[1:-1]
+
+    yield b"["
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield separator + render(chunk)
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + render(chunk)
+    yield b"]"
+
+
+def streaming_response(request, content) -> StreamingHttpResponse:
+    """Wrap the streamed JSON content (see json_array) in a response, gzip-compressed if the client accepts it."""
+    if _accepts_gzip.search(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+        response = StreamingHttpResponse(
+            compress_sequence(content, max_random_bytes=GZipMiddleware.max_random_bytes),
+            content_type="application/json",
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(content, content_type="application/json")
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
@@ -0,0 +1,111 @@
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from fame.models import ExpertiseAreas
+from socialnetwork.models import ExpertiseAreasClosure
+
+# closure table of the taxonomy of expertise areas:
+# ExpertiseAreasClosure holds one row per expertise area and each of its ancestors (and the area itself with depth 0),
+# so that all ancestors or all descendants of an area are found with a single indexed query instead of walking
+# parent_expertise_area level by level. The table is kept in sync by the save signals of ExpertiseAreas (see
+# socialnetwork.signals), rows of deleted areas are removed by the cascade.
+
+TABLE = "expertise_areas_closure"
+# guard against cycles in parent_expertise_area:
+MAX_DEPTH = 100
+
+
+def rebuild():
+    """Rebuild the closure table from parent_expertise_area."""
+    # other connections never see the table emptied or half filled:
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        cursor.execute(
+            f"""INSERT INTO {TABLE}(ancestor_id, descendant_id, depth)
+            WITH RECURSIVE paths(ancestor_id, descendant_id, depth) AS (
+                SELECT id, id, 0 FROM expertise_areas
+                UNION ALL
+                SELECT p.ancestor_id, e.id, p.depth + 1 FROM paths p
+                JOIN expertise_areas e ON e.parent_expertise_area_id = p.descendant_id
+                WHERE p.depth < %s
+            )
+            SELECT ancestor_id, descendant_id, depth FROM paths""",
+            [MAX_DEPTH],
+        )
+
+
+def add_leaf(area):
+    """Add the paths of a new expertise area without children: to itself and to all ancestors of its parent."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""INSERT INTO {TABLE}(ancestor_id, descendant_id, depth)
+            SELECT %s, %s, 0
+            UNION ALL
+            SELECT ancestor_id, %s, depth + 1 FROM {TABLE} WHERE descendant_id = %s""",
+            [area.id, area.id, area.id, area.parent_expertise_area_id],
+        )
+
+
+def update(area):
+    """Bring the closure table in line with a saved expertise area: nothing is done if its parent is the one in the
+    table, a new area without children below a parent in the table is added as leaf, anything else rebuilds the
+    table. Also used for fixture rows, which may be loaded before their parents."""
+    # the area itself (depth 0) and its parent (depth 1) as stored in the table:
+    paths = dict(
+        ExpertiseAreasClosure.objects.filter(descendant_id=area.id, depth__lte=1).values_list("depth", "ancestor_id")
+    )
+    if 0 in paths:
+        if paths.get(1) != area.parent_expertise_area_id:
+            rebuild()
+        return
+    parent_known = area.parent_expertise_area_id is None or ExpertiseAreasClosure.objects.filter(
+        descendant_id=area.parent_expertise_area_id, depth=0
+    ).exists()
+    if parent_known and not ExpertiseAreas.objects.filter(parent_expertise_area_id=area.id).exists():
+        add_leaf(area)
+    else:
+        rebuild()
+
+
+def ancestors(area, include_self: bool = False):
+    """Return the ancestors of an expertise area, the parent first."""
+    return ExpertiseAreas.objects.filter(
+        descendant_paths__descendant=area, descendant_paths__depth__gte=0 if include_self else 1
+    ).order_by("descendant_paths__depth")
+
+
+def descendants(area, include_self: bool = True):
+    """Return the descendants of an expertise area (the whole subtree), in no particular order."""
+    return ExpertiseAreas.objects.filter(
+        ancestor_paths__ancestor=area, ancestor_paths__depth__gte=0 if include_self else 1
+    )
+
+
+def prefetch_ancestors(lookup: str = "ancestor_paths") -> Prefetch:
+    """Prefetch the paths to the ancestors of expertise areas (lookup leads to ancestor_paths of the areas) with the
+    ancestors joined, the parent first. They are stored in the attribute ancestor_chain, see ancestor_chain."""
+    return Prefetch(
+        lookup,
+        queryset=ExpertiseAreasClosure.objects.filter(depth__gt=0).select_related("ancestor").order_by("depth"),
+        to_attr="ancestor_chain",
+    )
+
+
+def ancestor_chain(area) -> list:
+    """Return the ancestors of an expertise area, the parent first. Uses prefetched ancestors if present."""
+    if hasattr(area, "ancestor_chain"):
+        return [path.ancestor for path in area.ancestor_chain]
+    return list(ancestors(area))
+
+
+def ancestor_labels(area_ids) -> dict:
+    """Map the ids of the given expertise areas to the labels of their ancestors, the parent first, with a single
+    query. Areas without ancestors are left out."""
+    labels = {}
+    for area_id, label in (
+        ExpertiseAreasClosure.objects.filter(descendant_id__in=area_ids, depth__gt=0)
+        .order_by("depth")
+        .values_list("descendant_id", "ancestor__label")
+    ):
+        labels.setdefault(area_id, []).append(label)
+    return labels
@@ -1,6 +1,43 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
 
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from fame import ladder
+from fame.models import ExpertiseAreas, Fame, FameLevels, FameUsers
+from fame.serializers import ExpertiseAreasSerializer, FameSerializer
 from famesocialnetwork.library import test_paths_for_allowed_and_forbidden_users
+from socialnetwork import api, bench, follow_graph, home_timeline, instrumentation, magic_AI, moderation, pagination, post_stats, profiling, search_index, similarity, similarity_table, slow_queries, streaming, taxonomy
+from socialnetwork.models import (
+    ExpertiseAreasClosure,
+    Generations,
+    ModerationJobs,
+    PostExpertiseAreasAndRatings,
+    Posts,
+    PostStats,
+    SimilarUsers,
+    SimilarUsersLists,
+    SocialNetworkUsers,
+    TruthRatings,
+    UserRatings,
+)
+from socialnetwork.renderers import FastJSONRenderer
+from socialnetwork.serializers import PostsSerializer, serialize_posts
 
 
 class ViewExistsTests(TestCase):
@@ -16,7 +53,1365 @@ class ViewExistsTests(TestCase):
                 "/sn/api/posts",
                 "/sn/html/timeline",
                 "/sn/html/timeline?userid=13",
+                "/sn/html/timeline?search=tree&mode=ranked",
             ],
             users_allowed="P",
             users_forbidden="N",
         )
+
+
+class HomeTimelineTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _computed_timeline(self, user):
+        return list(
+            Posts.objects.filter((Q(author__in=user.follows.all()) & Q(published=True)) | Q(author=user))
+            .order_by("-submitted", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def _materialized_timeline(self, user):
+        return list(api.timeline(user).values_list("id", flat=True))
+
+    def test_materialized_timeline_matches_query(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.assertFalse(home_timeline.is_materialized(user))
+        self.assertEqual(self._materialized_timeline(user), self._computed_timeline(user))
+        self.assertTrue(home_timeline.is_materialized(user))
+
+    def test_follow_and_unfollow_update_timeline(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        other = SocialNetworkUsers.objects.exclude(id=user.id).exclude(followed_by=user).first()
+        self._materialized_timeline(user)
+
+        api.follow(user, other)
+        self.assertEqual(self._materialized_timeline(user), self._computed_timeline(user))
+        self.assertTrue(Posts.objects.filter(author=other, published=True, home_timeline_entries__user=user).exists())
+
+        api.unfollow(user, other)
+        self.assertEqual(self._materialized_timeline(user), self._computed_timeline(user))
+        self.assertFalse(Posts.objects.filter(author=other, home_timeline_entries__user=user).exists())
+
+    def test_submit_post_fans_out_to_followers(self):
+        author = SocialNetworkUsers.objects.filter(followed_by__isnull=False).first()
+        followers = list(author.followed_by.all())
+        for follower in followers:
+            self._materialized_timeline(follower)
+
+        # submit posts until one gets published:
+        for i in range(20):
+            ret, _, _ = api.submit_post(author, f"fan out test post number {i}")
+            if ret["published"]:
+                break
+        self.assertTrue(ret["published"])
+
+        for follower in followers:
+            self.assertEqual(self._materialized_timeline(follower)[0], ret["id"])
+
+
+class KeysetPaginationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _collect(self, listing, cursor_for=pagination.post_cursor, limit=7):
+        ids, cursor = [], None
+        while True:
+            page = list(listing(cursor=cursor, limit=limit))
+            ids += [item.id for item in page]
+            cursor = pagination.next_cursor(page, limit, cursor_for)
+            if cursor is None:
+                return ids
+
+    def test_timeline_pages_cover_timeline(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        expected = list(api.timeline(user).values_list("id", flat=True))
+        self.assertEqual(self._collect(lambda **kw: api.timeline(user, **kw)), expected)
+
+        expected = list(api.timeline(user, published=False).values_list("id", flat=True))
+        self.assertEqual(self._collect(lambda **kw: api.timeline(user, published=False, **kw)), expected)
+
+    def test_search_pages_cover_search(self):
+        expected = list(api.search("a").order_by("-submitted", "-id").values_list("id", flat=True))
+        self.assertEqual(self._collect(lambda **kw: api.search("a", **kw), limit=50), expected)
+
+    def test_search_pages_seek_in_the_index(self):
+        post = Posts.objects.order_by("-submitted", "-id")[200]
+        # neither the first nor a deep page sorts the matching posts:
+        for cursor in (None, pagination.post_cursor(post)):
+            plan = api.search("the", cursor=cursor, limit=20).explain()
+            self.assertIn("USING INDEX posts_submitted_id", plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+        self.assertIn("SEARCH posts USING INDEX posts_submitted_id (submitted<?)", plan)
+
+    def test_follows_and_followers_pages(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        for listing, related in ((api.follows, user.follows), (api.followers, user.followed_by)):
+            expected = sorted(related.values_list("id", flat=True))
+            self.assertEqual(
+                self._collect(lambda **kw: listing(user, **kw), pagination.user_cursor, limit=3), expected
+            )
+
+    def test_invalid_cursor(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        with self.assertRaises(ValueError):
+            list(api.timeline(user, cursor="not a cursor", limit=10))
+
+        self.client.login(email=user.email, password="test")
+        self.assertEqual(self.client.get("/sn/api/posts?cursor=bla").status_code, 400)
+        self.assertEqual(self.client.get("/sn/html/timeline?cursor=bla").status_code, 400)
+
+    def test_rest_api_pages(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.client.login(email=user.email, password="test")
+        first = self.client.get("/sn/api/posts?limit=5").json()
+        self.assertEqual(len(first["results"]), 5)
+        second = self.client.get(f"/sn/api/posts?limit=5&cursor={first['next_cursor']}").json()
+        everything = self.client.get("/sn/api/posts").json()
+        self.assertEqual(first["results"] + second["results"], everything[:10])
+
+
+class SearchIndexTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_index_is_filled_by_fixture(self):
+        self.assertTrue(search_index.is_available())
+        self.assertEqual(
+            list(api.search("society", mode="fulltext").values_list("id", flat=True)),
+            list(api.search("society").values_list("id", flat=True)),
+        )
+
+    def test_fulltext_search_matches_author(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        expected = set(Posts.objects.filter(author=user, published=True).values_list("id", flat=True))
+        self.assertEqual(set(api.search("Petersson", mode="fulltext").values_list("id", flat=True)), expected)
+
+        # renaming the author updates the index:
+        user.last_name = "Zyxwvuts"
+        user.save()
+        self.assertFalse(api.search("Petersson", mode="fulltext").exists())
+        self.assertEqual(set(api.search("zyxwv", mode="fulltext").values_list("id", flat=True)), expected)
+
+    def test_new_posts_are_indexed(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        ret, _, _ = api.submit_post(user, "Quokkas are the happiest marsupials")
+        self.assertEqual(
+            list(api.search("quokka", published=ret["published"], mode="ranked").values_list("id", flat=True)),
+            [ret["id"]],
+        )
+
+    def test_ranked_search_orders_by_relevance(self):
+        posts = list(api.search("tree", mode="ranked", limit=10))
+        self.assertTrue(posts)
+        ranks = [post.search_rank for post in posts]
+        self.assertEqual(ranks, sorted(ranks))
+        with self.assertRaises(ValueError):
+            api.search("tree", mode="ranked", cursor="x")
+
+    def test_rebuild(self):
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(
+            set(api.search("society", mode="fulltext").values_list("id", flat=True)),
+            set(api.search("society").values_list("id", flat=True)),
+        )
+
+
+class ClassifierTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        magic_AI.invalidate()
+        self.addCleanup(magic_AI.invalidate)
+
+    def test_batch_matches_single_classification(self):
+        contents = list(Posts.objects.values_list("content", flat=True)[:50])
+        single = [magic_AI.classify_into_expertise_areas_and_check_for_bullshit(c) for c in contents]
+        magic_AI.invalidate()
+        self.assertEqual(magic_AI.classify_many(contents), single)
+
+    def test_classification_matches_stored_ratings(self):
+        for post in Posts.objects.all()[:50]:
+            stored = {
+                (pear.expertise_area_id, pear.truth_rating_id) for pear in post.postexpertiseareasandratings_set.all()
+            }
+            classified = magic_AI.classify_into_expertise_areas_and_check_for_bullshit(post.content)
+            self.assertEqual(
+                {(epa["expertise_area"].id, epa["truth_rating"] and epa["truth_rating"].id) for epa in classified},
+                stored,
+            )
+
+    def test_snapshot_is_reused_until_invalidated(self):
+        contents = [f"snapshot test {i}" for i in range(20)]
+        with self.assertNumQueries(3):
+            magic_AI.classify_many(contents)
+        with self.assertNumQueries(0):
+            magic_AI.classify_many([f"another snapshot test {i}" for i in range(20)])
+
+        TruthRatings.objects.create(name="Brand new", numeric_value=5)
+        with self.assertNumQueries(3):
+            magic_AI.classify_into_expertise_areas_and_check_for_bullshit("snapshot test 0")
+
+    @patch.object(magic_AI, "RESULT_CACHE_SIZE", 50)
+    def test_concurrent_classification(self):
+        contents = [f"concurrent classification {i}" for i in range(200)]
+        expected = magic_AI.classify_many(contents)
+        magic_AI.invalidate()
+        # loaded beforehand, the threads must not query the database of the test:
+        magic_AI.preload()
+        results, errors = [], []
+
+        def classify(offset):
+            try:
+                for _ in range(5):
+                    results.append((offset, magic_AI.classify_many(contents[offset:] + contents[:offset])))
+            except Exception as e:
+                errors.append(e)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=classify, args=(offset,)) for offset in range(0, 200, 25)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 40)
+        for offset, result in results:
+            self.assertEqual(result, expected[offset:] + expected[:offset])
+        self.assertLessEqual(len(magic_AI._results), 50)
+
+    def test_bulk_determination(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        posts = [Posts.objects.create(author=user, content=f"bulk classification {i}") for i in range(10)]
+        magic_AI.classify_many(["warm up"])
+        with self.assertNumQueries(1):
+            results = Posts.determine_expertise_areas_and_truth_ratings_in_bulk(posts)
+        for post, (contains_bullshit, _expertise_areas) in zip(posts, results):
+            self.assertEqual(post.postexpertiseareasandratings_set.count(), 2)
+            self.assertEqual(
+                contains_bullshit,
+                any(epa["truth_rating"] and epa["truth_rating"].numeric_value < 0 for epa in _expertise_areas),
+            )
+
+
+class AsynchronousModerationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_pending_post_is_moderated_like_synchronous_post(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        content = Posts.objects.filter(published=True).exclude(author=user).first().content
+
+        ret, _expertise_areas, redirect_to_logout = api.submit_post(user, content, asynchronous=True)
+        self.assertTrue(ret["pending"])
+        self.assertFalse(ret["published"])
+        self.assertEqual(_expertise_areas, [])
+        self.assertFalse(redirect_to_logout)
+        post = Posts.objects.get(id=ret["id"])
+        self.assertFalse(post.published)
+        self.assertFalse(post.postexpertiseareasandratings_set.exists())
+
+        self.assertEqual(moderation.process_pending(), 1)
+        self.assertEqual(moderation.process_pending(), 0)
+        post.refresh_from_db()
+        job = ModerationJobs.objects.get(post=post)
+        self.assertEqual(job.status, ModerationJobs.DONE)
+        self.assertEqual(post.postexpertiseareasandratings_set.count(), 2)
+
+        expected, _, _ = api.submit_post(user, content)
+        self.assertEqual(post.published, expected["published"])
+
+    def test_pending_post_of_banned_user_stays_unpublished(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        content = Posts.objects.filter(published=True).exclude(author=user).first().content
+        ret, _, _ = api.submit_post(user, content, asynchronous=True)
+        SocialNetworkUsers.objects.filter(id=user.id).update(is_banned=True, is_active=False)
+
+        moderation.process_pending()
+        self.assertFalse(Posts.objects.get(id=ret["id"]).published)
+
+    def test_jobs_of_one_author_are_not_run_concurrently(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        api.submit_post(user, "first pending post", asynchronous=True)
+        api.submit_post(user, "second pending post", asynchronous=True)
+
+        self.assertIsNotNone(moderation.claim_next())
+        self.assertIsNone(moderation.claim_next())
+
+    def test_interleaved_claims_of_one_author(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        api.submit_post(user, "first pending post", asynchronous=True)
+        api.submit_post(user, "second pending post", asynchronous=True)
+        claim = moderation._claim
+        claimed = []
+
+        def interleaved(job_id, author_id):
+            if not claimed:
+                # another worker claims the first job after this one read the candidates
+                claimed.append(claim(job_id, author_id))
+            return claim(job_id, author_id)
+
+        with patch.object(moderation, "_claim", interleaved):
+            # neither the first job (claimed by the other worker) nor the second one (of the same author):
+            self.assertIsNone(moderation.claim_next())
+        self.assertEqual(claimed, [True])
+        self.assertEqual(ModerationJobs.objects.filter(status=ModerationJobs.RUNNING).count(), 1)
+
+    def test_post_is_not_stored_without_its_job(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        count = Posts.objects.count()
+        with patch.object(moderation, "enqueue", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                api.submit_post(user, "pending post", asynchronous=True)
+        self.assertEqual(Posts.objects.count(), count)
+
+
+class PostsSerializerTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_eager_loading_returns_same_data(self):
+        posts = Posts.objects.all()
+        self.assertEqual(
+            PostsSerializer(PostsSerializer.setup_eager_loading(posts), many=True).data,
+            PostsSerializer(posts, many=True).data,
+        )
+
+    def test_eager_loading_uses_constant_number_of_queries(self):
+        posts = PostsSerializer.setup_eager_loading(Posts.objects.all())
+        with self.assertNumQueries(3):
+            data = PostsSerializer(posts, many=True).data
+        self.assertEqual(len(data), Posts.objects.count())
+
+        # also for a page of the timeline:
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        list(api.timeline(user))
+        with self.assertNumQueries(4):
+            PostsSerializer(PostsSerializer.setup_eager_loading(api.timeline(user, limit=20)), many=True).data
+
+
+class PostStatsTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _serialize(self, post_ids, eager=True):
+        posts = Posts.objects.filter(id__in=post_ids).order_by("id")
+        if eager:
+            posts = PostsSerializer.setup_eager_loading(posts)
+        return PostsSerializer(posts, many=True).data
+
+    def test_counters_follow_fixtures(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        other = SocialNetworkUsers.objects.exclude(id=user.id).first()
+        ret, _, _ = api.submit_post(user, "a post that is replied to and rated by a fixture")
+        post = Posts.objects.get(id=ret["id"])
+        fixture = [
+            {
+                "model": "socialnetwork.posts",
+                "pk": 100000,
+                "fields": {
+                    "content": "a reply from a fixture",
+                    "author": other.id,
+                    "submitted": "2001-01-01T00:00:00Z",
+                    "replies_to": post.id,
+                    "published": True,
+                },
+            },
+            {
+                "model": "socialnetwork.userratings",
+                "pk": 100000,
+                "fields": {
+                    "user": other.id,
+                    "post": post.id,
+                    "score": 4,
+                    "type": UserRatings.APPROVAL,
+                    "created": "2001-01-01T00:00:00Z",
+                },
+            },
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fixture.json")
+            with open(path, "w") as file:
+                json.dump(fixture, file)
+            call_command("loaddata", path, verbosity=0)
+
+        stats = PostStats.objects.get(post=post)
+        self.assertEqual((stats.citation_count, stats.reply_count), (0, 1))
+        self.assertEqual(stats.user_ratings(), {"A": 4})
+        self.assertEqual(self._serialize([post.id]), self._serialize([post.id], eager=False))
+
+    def test_counters_follow_writes(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        others = list(SocialNetworkUsers.objects.exclude(id=user.id)[:4])
+        ret, _, _ = api.submit_post(user, "a post to be cited, replied to and rated")
+        post = Posts.objects.get(id=ret["id"])
+        self.assertTrue(PostStats.objects.filter(post=post).exists())
+
+        api.submit_post(others[0], "citing", cites=post)
+        api.submit_post(others[1], "replying", replies_to=post)
+        api.rate_post(others[0], post, UserRatings.LIKE, 5)
+        api.rate_post(others[1], post, UserRatings.LIKE, 3)
+        api.rate_post(others[2], post, UserRatings.DISLIKE, 0)
+        self.assertEqual(api.rate_post(others[0], post, UserRatings.LIKE, 7)["type"], "update")
+        post.user_ratings.add(others[3], through_defaults={"type": UserRatings.APPROVAL, "score": 2})
+        UserRatings.objects.get(post=post, user=others[1]).delete()
+
+        stats = PostStats.objects.get(post=post)
+        self.assertEqual((stats.citation_count, stats.reply_count), (1, 1))
+        self.assertEqual(stats.user_ratings(), {"A": 2, "D": 0, "L": 7})
+        self.assertEqual(self._serialize([post.id]), self._serialize([post.id], eager=False))
+
+        with self.assertRaises(PermissionError):
+            api.rate_post(user, post, UserRatings.LIKE, 1)
+
+    def test_reconcile(self):
+        post_ids = list(Posts.objects.values_list("id", flat=True)[:100])
+        expected = self._serialize(post_ids, eager=False)
+        self.assertFalse(PostStats.objects.exists())
+
+        call_command("reconcile_post_stats", stdout=StringIO())
+        self.assertEqual(PostStats.objects.count(), Posts.objects.count())
+        self.assertEqual(self._serialize(post_ids), expected)
+        # the user ratings are only prefetched for posts without counters, i.e. none here:
+        with self.assertNumQueries(3):
+            self._serialize(post_ids)
+
+
+class SimilarityTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        self.addCleanup(similarity.invalidate)
+
+    def _reference_similarities(self, user):
+        # straightforward computation of the similarities, sorted like api.similar_users
+        fame_of = {}
+        for user_id, area_id, value in Fame.objects.values_list(
+            "user_id", "expertise_area_id", "fame_level__numeric_value"
+        ):
+            fame_of.setdefault(user_id, {})[area_id] = value
+        areas = fame_of.get(user.id, {})
+        ret = []
+        for other in FameUsers.objects.exclude(id=user.id):
+            agreements = sum(
+                1
+                for area_id, value in fame_of.get(other.id, {}).items()
+                if area_id in areas and abs(areas[area_id] - value) <= 100
+            )
+            if agreements:
+                ret.append((other, agreements / len(areas)))
+        ret.sort(key=lambda x: (-x[1], -x[0].date_joined.timestamp()))
+        return [(other.id, similarity) for other, similarity in ret]
+
+    def test_matches_reference(self):
+        for user in SocialNetworkUsers.objects.all():
+            expected = self._reference_similarities(user)
+            self.assertEqual(similarity.similarities(user.id), expected)
+            self.assertEqual(
+                [(u.id, u.similarity) for u in api.similar_users(user)],
+                expected,
+            )
+            self.assertEqual([u.id for u in api.similar_users(user, limit=3)], [i for i, _ in expected[:3]])
+
+    def test_fame_changes_invalidate_the_matrix(self):
+        user = SocialNetworkUsers.objects.get(id=21)
+        api.similar_users(user)
+        fame = Fame.objects.filter(user=user).first()
+        fame.fame_level = FameLevels.objects.exclude(id=fame.fame_level_id).order_by("-numeric_value").first()
+        fame.save()
+        self.assertEqual(
+            [(u.id, u.similarity) for u in api.similar_users(user)], self._reference_similarities(user)
+        )
+        Fame.objects.filter(user=user).delete()
+        self.assertFalse(api.similar_users(user).exists())
+
+    def test_changes_of_other_processes(self):
+        user = SocialNetworkUsers.objects.get(id=21)
+        similarity.similarities(user.id)
+        # the matrix is only reloaded when the generation changed:
+        with self.assertNumQueries(1):
+            similarity.similarities(user.id)
+        # another process changing a fame, its signals only invalidate the matrix of that process:
+        fame = Fame.objects.filter(user=user).first()
+        Fame.objects.filter(pk=fame.pk).update(
+            fame_level=FameLevels.objects.exclude(id=fame.fame_level_id).order_by("-numeric_value").first()
+        )
+        self.assertNotEqual(similarity.similarities(user.id), self._reference_similarities(user))
+        Generations.objects.update_or_create(name=similarity.GENERATION, defaults={"token": "other process"})
+        self.assertEqual(similarity.similarities(user.id), self._reference_similarities(user))
+
+    def _stored_similarities(self, user_id):
+        return list(
+            SimilarUsers.objects.filter(user_id=user_id).order_by("rank").values_list("other_user_id", "similarity")
+        )
+
+    def test_table(self):
+        with patch.object(similarity_table, "CHUNK_SIZE", 4):
+            call_command("build_similarity_table", "--processes", "2", stdout=StringIO())
+        self.assertFalse(SimilarUsersLists.objects.filter(stale=True).exists())
+        for user in FameUsers.objects.all():
+            self.assertEqual(self._stored_similarities(user.id), similarity.similarities(user.id))
+
+        user = SocialNetworkUsers.objects.get(id=21)
+        expected = self._reference_similarities(user)
+        with self.assertNumQueries(2):
+            self.assertEqual([(u.id, u.similarity) for u in api.similar_users(user)], expected)
+
+        # changing a fame marks the lists of its user and of the users with fame in its area as stale:
+        fame = Fame.objects.filter(user=user).first()
+        affected = {fame.user_id} | set(
+            Fame.objects.filter(expertise_area=fame.expertise_area).values_list("user_id", flat=True)
+        )
+        fame.fame_level = FameLevels.objects.exclude(id=fame.fame_level_id).order_by("numeric_value").first()
+        fame.save()
+        self.assertEqual(
+            set(SimilarUsersLists.objects.filter(stale=True).values_list("user_id", flat=True)), affected
+        )
+        self.assertEqual(
+            [(u.id, u.similarity) for u in api.similar_users(user)], self._reference_similarities(user)
+        )
+        self.assertFalse(SimilarUsersLists.objects.get(user=user).stale)
+
+        call_command("build_similarity_table", "--stale", stdout=StringIO())
+        self.assertFalse(SimilarUsersLists.objects.filter(stale=True).exists())
+        for user_id in affected:
+            self.assertEqual(self._stored_similarities(user_id), similarity.similarities(user_id))
+
+    def test_user_saves(self):
+        user = SocialNetworkUsers.objects.get(id=21)
+        call_command("build_similarity_table", stdout=StringIO())
+        matrix = similarity.get_matrix()
+        # e.g. api.moderate_post saves the author on every submission:
+        user.last_name = "Changed"
+        user.save()
+        self.assertIs(similarity.get_matrix(), matrix)
+        self.assertFalse(SimilarUsersLists.objects.filter(stale=True).exists())
+
+        user.date_joined -= datetime.timedelta(days=1)
+        user.save()
+        self.assertIsNot(similarity.get_matrix(), matrix)
+        self.assertTrue(SimilarUsersLists.objects.get(user=user).stale)
+        self.assertEqual(
+            [(u.id, u.similarity) for u in api.similar_users(user)], self._reference_similarities(user)
+        )
+
+    def test_lists_of_outdated_matrices(self):
+        user = SocialNetworkUsers.objects.get(id=21)
+        matrix = similarity.get_matrix()
+        # another process changes a fame while the list is computed from the matrix loaded before:
+        lists = similarity_table._compute([user.id])
+        fame = Fame.objects.filter(user=user).first()
+        Fame.objects.filter(pk=fame.pk).update(
+            fame_level=FameLevels.objects.exclude(id=fame.fame_level_id).order_by("-numeric_value").first()
+        )
+        Generations.objects.update_or_create(name=similarity.GENERATION, defaults={"token": "other process"})
+        similarity_table.fame_changed(fame)
+        similarity_table.store(lists, matrix.generation)
+        self.assertTrue(SimilarUsersLists.objects.get(user=user).stale)
+        # refreshed from the current fame on the next read:
+        self.assertEqual(
+            [(u.id, u.similarity) for u in api.similar_users(user)], self._reference_similarities(user)
+        )
+        self.assertFalse(SimilarUsersLists.objects.get(user=user).stale)
+
+    def test_capped_lists(self):
+        user = SocialNetworkUsers.objects.get(id=21)
+        expected = self._reference_similarities(user)
+        with patch.object(similarity_table, "LIST_SIZE", 5):
+            self.assertEqual([(u.id, u.similarity) for u in api.similar_users(user, limit=5)], expected[:5])
+            self.assertEqual(len(self._stored_similarities(user.id)), 5)
+            self.assertFalse(SimilarUsersLists.objects.get(user=user).complete)
+            # more users than stored are computed on the fly:
+            self.assertEqual([(u.id, u.similarity) for u in api.similar_users(user)], expected)
+
+
+class BullshittersLeaderboardTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _computed_leaderboard(self):
+        # the ranking of api.bullshitters computed from the fame table, ties of date_joined broken by user id
+        leaderboard = {}
+        for fame in Fame.objects.filter(fame_level__numeric_value__lt=0).select_related("user", "fame_level"):
+            leaderboard.setdefault(fame.expertise_area_id, []).append(
+                (fame.fame_level.numeric_value, -fame.user.date_joined.timestamp(), fame.user_id)
+            )
+        return {area_id: [user_id for _, _, user_id in sorted(entries)] for area_id, entries in leaderboard.items()}
+
+    def _leaderboard(self, **kwargs):
+        return {
+            area.id: [entry["user"].id for entry in entries] for area, entries in api.bullshitters(**kwargs).items()
+        }
+
+    def test_follows_fame_changes(self):
+        # fame levels are changed below, the cached ladder must not survive the rollback:
+        self.addCleanup(ladder.invalidate)
+        self.assertEqual(self._leaderboard(), self._computed_leaderboard())
+
+        # fame adjustments of submit_post:
+        negative_ratings = PostExpertiseAreasAndRatings.objects.filter(truth_rating__numeric_value__lt=0)
+        for user, rating in zip(SocialNetworkUsers.objects.order_by("id")[:5], negative_ratings[:5]):
+            api.submit_post(user, rating.post.content)
+        self.assertEqual(self._leaderboard(), self._computed_leaderboard())
+
+        # edits as in the admin:
+        fame = Fame.objects.filter(fame_level__numeric_value__lt=0).first()
+        fame.fame_level = FameLevels.objects.filter(numeric_value__gt=0).first()
+        fame.save()
+        Fame.objects.filter(fame_level__numeric_value__lt=0).last().delete()
+        level = FameLevels.objects.filter(numeric_value__lt=0).first()
+        level.numeric_value = 1
+        level.save()
+        user = FameUsers.objects.filter(fame__fame_level__numeric_value__lt=0).first()
+        user.date_joined = user.date_joined.replace(year=1990)
+        user.save()
+        self.assertEqual(self._leaderboard(), self._computed_leaderboard())
+
+    def test_pagination(self):
+        expected = self._computed_leaderboard()
+        self.assertEqual(self._leaderboard(limit=2), {area_id: users[:2] for area_id, users in expected.items()})
+
+        for area_id, users in expected.items():
+            area = ExpertiseAreas.objects.get(id=area_id)
+            paged, cursor = [], None
+            while True:
+                entries, cursor = api.bullshitters_in(area, cursor=cursor, limit=2)
+                paged.extend(entry["user"].id for entry in entries)
+                if cursor is None:
+                    break
+            self.assertEqual(paged, users)
+
+    def test_page_costs(self):
+        self.client.login(email="a@b.de", password="test")
+        # session, user and expertise areas plus one query per expertise area (the social network user is not needed):
+        areas = len(self._computed_leaderboard())
+        with self.assertNumQueries(3 + areas):
+            self.assertEqual(self.client.get("/sn/html/bullshitters/").status_code, 200)
+        area_id = next(iter(self._computed_leaderboard()))
+        response = self.client.get(f"/sn/html/bullshitters/?expertise_area={area_id}&limit=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["bullshitters"][0]["entries"]), 1)
+        self.assertEqual(self.client.get("/sn/html/bullshitters/?expertise_area=x").status_code, 400)
+
+
+class TaxonomyTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _walked_ancestors(self, area):
+        # ancestors found by walking parent_expertise_area, the parent first
+        ret = []
+        while area.parent_expertise_area is not None:
+            area = area.parent_expertise_area
+            ret.append(area.id)
+        return ret
+
+    def _assert_closure_matches_adjacency(self):
+        for area in ExpertiseAreas.objects.all():
+            self.assertEqual([a.id for a in taxonomy.ancestors(area)], self._walked_ancestors(area))
+            self.assertEqual(
+                set(taxonomy.descendants(area).values_list("id", flat=True)),
+                {d.id for d in ExpertiseAreas.objects.all() if d == area or area.id in self._walked_ancestors(d)},
+            )
+
+    def test_closure_follows_changes(self):
+        self._assert_closure_matches_adjacency()
+
+        root = ExpertiseAreas.objects.create(label="Science")
+        child = ExpertiseAreas.objects.create(label="Natural Science", parent_expertise_area=root)
+        leaf = ExpertiseAreas.objects.create(label="Physics", parent_expertise_area=child)
+        self.assertEqual(list(taxonomy.ancestors(leaf)), [child, root])
+        self._assert_closure_matches_adjacency()
+
+        # move a subtree:
+        child.parent_expertise_area = ExpertiseAreas.objects.get(id=13)
+        child.save()
+        self._assert_closure_matches_adjacency()
+
+        child.delete()
+        self.assertFalse(ExpertiseAreasClosure.objects.filter(descendant_id=leaf.id).exists())
+        self._assert_closure_matches_adjacency()
+
+    def test_rebuilt_only_for_new_parents(self):
+        area = ExpertiseAreas.objects.get(id=13)
+        with patch.object(taxonomy, "rebuild", wraps=taxonomy.rebuild) as rebuild:
+            area.label = "Renamed"
+            area.save()
+            self.assertEqual(rebuild.call_count, 0)
+            area.parent_expertise_area = ExpertiseAreas.objects.get(id=1)
+            area.save()
+            self.assertEqual(rebuild.call_count, 1)
+        self._assert_closure_matches_adjacency()
+
+    def test_fixtures(self):
+        areas = [
+            {
+                "model": "fame.expertiseareas",
+                "pk": area.id,
+                "fields": {"label": area.label, "parent_expertise_area": area.parent_expertise_area_id},
+            }
+            for area in ExpertiseAreas.objects.all()
+        ]
+        # a child before its parent, a child after it:
+        areas += [
+            {"model": "fame.expertiseareas", "pk": 100, "fields": {"label": "Physics", "parent_expertise_area": 101}},
+            {"model": "fame.expertiseareas", "pk": 101, "fields": {"label": "Science", "parent_expertise_area": 3}},
+            {"model": "fame.expertiseareas", "pk": 102, "fields": {"label": "Chemistry", "parent_expertise_area": 101}},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "areas.json")
+            with open(path, "w") as file:
+                json.dump(areas, file)
+            with patch.object(taxonomy, "rebuild", wraps=taxonomy.rebuild) as rebuild:
+                call_command("loaddata", path, verbosity=0)
+        # not once per row, only for the two rows out of order:
+        self.assertEqual(rebuild.call_count, 2)
+        self.assertEqual([a.id for a in taxonomy.ancestors(ExpertiseAreas.objects.get(id=100))], [101, 3])
+        self._assert_closure_matches_adjacency()
+
+    def test_failed_rebuild_keeps_the_table(self):
+        before = set(ExpertiseAreasClosure.objects.values_list("ancestor_id", "descendant_id", "depth"))
+        # a cycle (area 4 is a child of area 3) gives duplicate paths:
+        ExpertiseAreas.objects.filter(id=3).update(parent_expertise_area_id=4)
+        with self.assertRaises(IntegrityError):
+            taxonomy.rebuild()
+        self.assertEqual(set(ExpertiseAreasClosure.objects.values_list("ancestor_id", "descendant_id", "depth")), before)
+
+    def test_serializers(self):
+        def nested(area):
+            # the format of the former recursive serialization
+            if area.parent_expertise_area is None:
+                return None
+            parent = area.parent_expertise_area
+            return {"label": parent.label, "parent_expertise_area": nested(parent)}
+
+        expected = [{"label": area.label, "parent_expertise_area": nested(area)} for area in ExpertiseAreas.objects.all()]
+        with self.assertNumQueries(2):
+            data = ExpertiseAreasSerializer(
+                ExpertiseAreasSerializer.setup_eager_loading(ExpertiseAreas.objects.all()), many=True
+            ).data
+        self.assertEqual(data, expected)
+
+        fame = Fame.objects.filter(expertise_area__parent_expertise_area__isnull=False)
+        with self.assertNumQueries(2):
+            data = FameSerializer(FameSerializer.setup_eager_loading(fame), many=True).data
+        self.assertTrue(data)
+        self.assertEqual([f["expertise_area"] for f in data], [
+            {"label": f.expertise_area.label, "parent_expertise_area": nested(f.expertise_area)} for f in fame
+        ])
+
+
+class ExpertiseAreaFeedTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _computed_feed(self, area):
+        subtree = [a.id for a in ExpertiseAreas.objects.all() if a == area or area in taxonomy.ancestors(a)]
+        return list(
+            Posts.objects.filter(published=True, expertise_area_and_truth_ratings__in=subtree)
+            .distinct()
+            .order_by("-submitted", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def test_feed_contains_subtree(self):
+        self.assertFalse(PostExpertiseAreasAndRatings.objects.filter(post_submitted__isnull=True).exists())
+        root = ExpertiseAreas.objects.create(label="Science")
+        child = ExpertiseAreas.objects.create(label="Natural Science", parent_expertise_area=root)
+        leaf = ExpertiseAreas.objects.create(label="Physics", parent_expertise_area=child)
+        posts = list(Posts.objects.filter(published=True).order_by("id")[:3])
+        posts[0].expertise_area_and_truth_ratings.add(leaf)
+        posts[1].expertise_area_and_truth_ratings.add(child, leaf)
+        PostExpertiseAreasAndRatings.objects.create(post=posts[2], expertise_area=root)
+        self.assertFalse(PostExpertiseAreasAndRatings.objects.filter(post_submitted__isnull=True).exists())
+
+        self.assertEqual(list(api.expertise_area_feed(root).values_list("id", flat=True)), self._computed_feed(root))
+        self.assertEqual(len(self._computed_feed(root)), 3)
+        self.assertEqual(list(api.expertise_area_feed(leaf).values_list("id", flat=True)), self._computed_feed(leaf))
+
+    def test_pagination(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        ret, _, _ = api.submit_post(user, "a new post for the feed of its expertise areas")
+        for area in ExpertiseAreas.objects.filter(parent_expertise_area__isnull=True):
+            expected = self._computed_feed(area)
+            paged, cursor = [], None
+            while True:
+                page = list(api.expertise_area_feed(area, cursor=cursor, limit=3))
+                paged.extend(post.id for post in page)
+                cursor = pagination.next_cursor(page, 3)
+                if cursor is None:
+                    break
+            self.assertEqual(paged, expected)
+
+    def test_pages_seek_in_the_index(self):
+        area = ExpertiseAreas.objects.get(id=2)
+        self.assertGreater(taxonomy.descendants(area).count(), 1)
+        post = Posts.objects.order_by("-submitted", "-id")[100]
+        # neither the first nor a deep page sorts the posts of an area:
+        for cursor in (None, pagination.post_cursor(post)):
+            for area_id in taxonomy.descendants(area).values_list("id", flat=True):
+                plan = api._feed_page(area_id, cursor, 20).explain()
+                self.assertIn("USING COVERING INDEX pear_area_submitted", plan)
+                self.assertNotIn("TEMP B-TREE", plan)
+        self.assertIn("(expertise_area_id=? AND post_submitted<?)", plan)
+
+    def test_endpoints(self):
+        area = ExpertiseAreas.objects.get(id=2)
+        # the serialized posts do not contain the id:
+        expected = [Posts.objects.get(id=post_id).content for post_id in self._computed_feed(area)]
+        self.client.login(email="a@b.de", password="test")
+        response = self.client.get(f"/sn/api/expertise_areas/{area.id}/posts?limit=2").json()
+        self.assertEqual([post["content"] for post in response["results"]], expected[:2])
+        response = self.client.get(
+            f"/sn/api/expertise_areas/{area.id}/posts", {"limit": 2, "cursor": response["next_cursor"]}
+        ).json()
+        self.assertEqual([post["content"] for post in response["results"]], expected[2:4])
+        self.assertEqual(self.client.get("/sn/api/expertise_areas/0/posts").status_code, 404)
+        self.assertEqual(self.client.get(f"/sn/api/expertise_areas/{area.id}/posts?cursor=x").status_code, 400)
+
+        response = self.client.get(f"/sn/html/timeline?expertise_area={area.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [post["content"] for post in response.context["posts"]], expected[: pagination.DEFAULT_PAGE_SIZE]
+        )
+
+
+class RequestUserTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_resolved_once_per_request(self):
+        self.client.login(email="a@b.de", password="test")
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        response = self.client.get("/sn/html/timeline")
+        self.assertEqual(response.status_code, 200)
+        request_user = response.wsgi_request.social_network_user
+        self.assertEqual(request_user.id, user.id)
+        self.assertEqual(request_user.followed_ids, set(user.follows.values_list("id", flat=True)))
+        self.assertEqual(
+            set(request_user.fame_profile), set(Fame.objects.filter(user=user).values_list("expertise_area_id", flat=True))
+        )
+        # the prefetched data is used, no further queries:
+        with self.assertNumQueries(0):
+            list(request_user.communities.all())
+            [fame.fame_level.numeric_value for fame in request_user.fame_profile.values()]
+
+    def test_timeline_costs(self):
+        self.client.login(email="a@b.de", password="test")
+        self.client.get("/sn/html/timeline")
+        # session, user, social network user with communities, fame profile and follows, the timeline check and the
+        # posts with their expertise areas and ratings:
+        with self.assertNumQueries(10):
+            self.assertEqual(self.client.get("/sn/html/timeline").status_code, 200)
+
+    def test_follow_updates_followed_ids(self):
+        user = api._get_request_user(SocialNetworkUsers.objects.get(email="a@b.de"))
+        other = SocialNetworkUsers.objects.exclude(id__in=user.followed_ids).exclude(id=user.id).first()
+        self.assertTrue(api.follow(user, other)["followed"])
+        self.assertIn(other.id, user.followed_ids)
+        self.assertFalse(api.follow(user, other)["followed"])
+        self.assertTrue(api.unfollow(user, other)["unfollowed"])
+        self.assertNotIn(other.id, user.followed_ids)
+        self.assertEqual(api._get_request_user(user).followed_ids, set(user.follows.values_list("id", flat=True)))
+
+    def test_missing_user(self):
+        with self.assertRaises(PermissionError):
+            api._get_request_user(FameUsers(id=0))
+
+
+class FollowGraphTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.other = SocialNetworkUsers.objects.exclude(followed_by=self.user).exclude(id=self.user.id).first()
+        self.community = ExpertiseAreas.objects.exclude(community_members=self.user).first()
+
+    def _load(self, ids_of):
+        # loaded sets are cached when the transaction is committed, i.e. never within the transaction of a test
+        with self.captureOnCommitCallbacks(execute=True):
+            return ids_of(self.user.id)
+
+    def test_membership_cached(self):
+        followed_ids = set(self.user.follows.values_list("id", flat=True))
+        community_ids = set(self.user.communities.values_list("id", flat=True))
+        with self.assertNumQueries(2):
+            self.assertEqual(self._load(follow_graph.followed_ids), followed_ids)
+            self.assertEqual(self._load(follow_graph.community_ids), community_ids)
+        with self.assertNumQueries(0):
+            follow_graph.followed_ids(self.user.id).add(0)
+            self.assertEqual(follow_graph.followed_ids(self.user.id), followed_ids)
+            self.assertEqual(follow_graph.community_ids(self.user.id), community_ids)
+
+    def test_single_statement_writes(self):
+        self._load(follow_graph.followed_ids)
+        for write, expected in [
+            (follow_graph.follow, True),
+            (follow_graph.follow, False),
+            (follow_graph.unfollow, True),
+            (follow_graph.unfollow, False),
+        ]:
+            with self.assertNumQueries(1):
+                self.assertEqual(write(self.user.id, self.other.id), expected)
+            self.assertEqual(
+                self._load(follow_graph.followed_ids), set(self.user.follows.values_list("id", flat=True))
+            )
+        self._load(follow_graph.community_ids)
+        self.assertTrue(api.join_community(self.user, self.community))
+        self.assertFalse(api.join_community(self.user, self.community))
+        self.assertIn(self.community.id, self._load(follow_graph.community_ids))
+        self.assertTrue(api.leave_community(self.user, self.community))
+        self.assertFalse(api.leave_community(self.user, self.community))
+        self.assertNotIn(self.community.id, self._load(follow_graph.community_ids))
+
+    def test_related_managers_invalidate(self):
+        self._load(follow_graph.followed_ids)
+        self.other.followed_by.add(self.user)
+        self.assertIn(self.other.id, self._load(follow_graph.followed_ids))
+        self.other.followed_by.clear()
+        self.assertNotIn(self.other.id, self._load(follow_graph.followed_ids))
+        self.user.follows.add(self.other)
+        self.assertIn(self.other.id, self._load(follow_graph.followed_ids))
+        other_id = self.other.id
+        self.other.delete()
+        self.assertNotIn(other_id, self._load(follow_graph.followed_ids))
+
+        self._load(follow_graph.community_ids)
+        self.community.community_members.add(self.user)
+        self.assertIn(self.community.id, self._load(follow_graph.community_ids))
+        self.user.communities.remove(self.community)
+        self.assertNotIn(self.community.id, self._load(follow_graph.community_ids))
+        self.community.community_members.add(self.user)
+        community_id = self.community.id
+        self.community.delete()
+        self.assertNotIn(community_id, self._load(follow_graph.community_ids))
+
+
+class BulkMembershipTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        self.user = SocialNetworkUsers.objects.get(email="a@b.de")
+        self.followed = list(self.user.follows.values_list("id", flat=True))
+        self.others = list(
+            SocialNetworkUsers.objects.exclude(id__in=self.followed).exclude(id=self.user.id).values_list("id", flat=True)
+        )
+
+    def test_follow_many(self):
+        home_timeline.build(self.user)
+        user_ids = self.others[:5] + self.followed[:2] + [0, self.others[0]]
+        # savepoint, users, existing rows, insert, timeline check, posts of the followed users, backfill, release:
+        with self.assertNumQueries(8):
+            outcomes = api.follow_many(self.user, user_ids)
+        self.assertEqual(list(outcomes), self.others[:5] + self.followed[:2] + [0])
+        self.assertEqual(
+            list(outcomes.values()), ["followed"] * 5 + ["already_followed"] * 2 + ["not_found"]
+        )
+        self.assertEqual(
+            set(self.user.follows.values_list("id", flat=True)), set(self.followed) | set(self.others[:5])
+        )
+        self.assertEqual(
+            set(home_timeline.posts(self.user).values_list("id", flat=True)),
+            set(api.timeline(self.user).values_list("id", flat=True)),
+        )
+
+        outcomes = api.unfollow_many(self.user, self.others[:2] + self.others[5:6] + [0])
+        self.assertEqual(list(outcomes.values()), ["unfollowed"] * 2 + ["not_followed", "not_found"])
+        self.assertEqual(
+            set(self.user.follows.values_list("id", flat=True)), set(self.followed) | set(self.others[2:5])
+        )
+        self.assertEqual(
+            set(home_timeline.posts(self.user).values_list("id", flat=True)),
+            set(api.timeline(self.user).values_list("id", flat=True)),
+        )
+
+    def test_constant_number_of_queries(self):
+        users = [SocialNetworkUsers.objects.create(email=f"bulk{i}@b.de") for i in range(50)]
+        home_timeline.build(self.user)
+        # as in test_follow_many, the new users have no posts to backfill:
+        with self.assertNumQueries(7):
+            outcomes = api.follow_many(self.user, [user.id for user in users])
+        self.assertEqual(set(outcomes.values()), {"followed"})
+
+    def test_community_members(self):
+        community = ExpertiseAreas.objects.first()
+        members = list(community.community_members.values_list("id", flat=True))
+        self.others = [user_id for user_id in self.others if user_id not in members]
+        user_ids = self.others[:3] + members[:1] + [0]
+        outcomes = api.add_community_members(community, user_ids)
+        self.assertEqual(
+            [outcomes[user_id] for user_id in user_ids],
+            ["joined"] * 3 + ["already_member", "not_found"],
+        )
+        self.assertTrue(set(self.others[:3]) <= set(community.community_members.values_list("id", flat=True)))
+        outcomes = api.remove_community_members(community, self.others[:3] + [0])
+        self.assertEqual(list(outcomes.values()), ["left"] * 3 + ["not_found"])
+        self.assertEqual(set(community.community_members.values_list("id", flat=True)), set(members))
+
+    def test_endpoints(self):
+        self.client.login(email="a@b.de", password="test")
+        response = self.client.post(
+            "/sn/api/follow/bulk", {"user_ids": self.others[:2] + [0]}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {"user_id": self.others[0], "outcome": "followed"},
+                {"user_id": self.others[1], "outcome": "followed"},
+                {"user_id": 0, "outcome": "not_found"},
+            ],
+        )
+        response = self.client.post(
+            "/sn/api/unfollow/bulk", {"user_ids": self.others[:1]}, content_type="application/json"
+        )
+        self.assertEqual(response.json()["results"], [{"user_id": self.others[0], "outcome": "unfollowed"}])
+        for data in [{}, {"user_ids": "1"}, {"user_ids": [1, "2"]}, {"user_ids": [True]}, {"user_ids": [1] * 1001}]:
+            response = self.client.post("/sn/api/follow/bulk", data, content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+        community = ExpertiseAreas.objects.first()
+        url = f"/sn/api/communities/{community.id}/members"
+        data = {"user_ids": self.others[:2]}
+        self.assertEqual(self.client.post(url, data, content_type="application/json").status_code, 403)
+        FameUsers.objects.filter(id=self.user.id).update(is_staff=True)
+        response = self.client.post(url, data, content_type="application/json")
+        self.assertEqual([result["outcome"] for result in response.json()["results"]], ["joined", "joined"])
+        response = self.client.delete(url, data, content_type="application/json")
+        self.assertEqual([result["outcome"] for result in response.json()["results"]], ["left", "left"])
+        response = self.client.post("/sn/api/communities/0/members", data, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+
+class StreamingTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_streamed_posts_equal_regular_response(self):
+        self.client.login(email="a@b.de", password="test")
+        expected = self.client.get("/sn/api/posts").content
+        self.assertGreater(len(json.loads(expected)), 5)
+        for chunk_size in [1, 5, streaming.CHUNK_SIZE]:
+            with patch.object(streaming, "CHUNK_SIZE", chunk_size):
+                response = self.client.get("/sn/api/posts?stream=1")
+                self.assertTrue(response.streaming)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(b"".join(response.streaming_content), expected)
+
+        response = self.client.get("/sn/api/posts?stream=1", headers={"accept-encoding": "gzip, deflate"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), expected)
+
+    def test_empty_stream(self):
+        self.assertEqual(b"".join(streaming.json_array(Posts.objects.none(), lambda chunk: [])), b"[]")
+
+
+class FastSerializationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_posts_same_bytes(self):
+        # half of the posts with counters, half without:
+        post_stats.recompute(Posts.objects.order_by("id").values_list("id", flat=True)[::2])
+        Posts.objects.filter(id=Posts.objects.order_by("id").first().id).update(content="line\u2028separator ä")
+        posts = Posts.objects.order_by("-submitted", "-id")
+        expected = JSONRenderer().render(PostsSerializer(PostsSerializer.setup_eager_loading(posts), many=True).data)
+        rows = serialize_posts(posts)
+        self.assertEqual(FastJSONRenderer().render([post.data for post in rows]), expected)
+        self.assertEqual([post.id for post in rows], list(posts.values_list("id", flat=True)))
+        with self.assertNumQueries(3):
+            serialize_posts(posts)
+
+    def test_endpoints_same_bytes(self):
+        self.client.login(email="a@b.de", password="test")
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        posts = PostsSerializer.setup_eager_loading(api.timeline(user))
+        self.assertEqual(
+            self.client.get("/sn/api/posts").content,
+            JSONRenderer().render(PostsSerializer(posts, many=True).data),
+        )
+        page = self.client.get("/sn/api/posts?limit=3").json()
+        self.assertEqual(page["results"], PostsSerializer(list(posts[:3]), many=True).data)
+        self.assertEqual(page["next_cursor"], pagination.post_cursor(list(posts[:3])[-1]))
+
+    def test_renderer_fallback(self):
+        renderer = FastJSONRenderer()
+        self.assertEqual(renderer.render({1: "a"}), JSONRenderer().render({1: "a"}))
+        self.assertEqual(renderer.render(None), b"")
+        self.assertEqual(
+            renderer.render([{"a": 1}], "application/json; indent=2"),
+            JSONRenderer().render([{"a": 1}], "application/json; indent=2"),
+        )
+
+
+class BenchTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            call_command("bench", existing=True, iterations=3, warmup=1, json=path, stdout=StringIO())
+            report = bench.load(path)
+            self.assertEqual(set(report["results"]), set(bench.cases(bench.Sample())))
+            for result in report["results"].values():
+                self.assertEqual(result["iterations"], 3)
+                self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+                self.assertLessEqual(result["p95_ms"], result["p99_ms"])
+                self.assertLessEqual(result["queries_p50"], result["queries_max"])
+
+            # same report, no regressions:
+            out = StringIO()
+            call_command(
+                "bench", existing=True, iterations=3, only=["search_fulltext"], baseline=path, tolerance=100, stdout=out
+            )
+            self.assertIn("No regressions", out.getvalue())
+
+            # a baseline with fewer queries:
+            report["results"]["search_fulltext"]["queries_max"] = 0
+            bench.dump(report, path)
+            with self.assertRaises(CommandError):
+                call_command(
+                    "bench", existing=True, iterations=3, only=["search_fulltext"], baseline=path, stdout=StringIO()
+                )
+
+    def test_unknown_case(self):
+        with self.assertRaises(CommandError):
+            call_command("bench", existing=True, only=["nothing"], stdout=StringIO())
+
+    def test_compare(self):
+        baseline = {"results": {"a": {"p95_ms": 10.0, "queries_p50": 2, "queries_max": 3}}}
+        report = {
+            "results": {
+                "a": {"p95_ms": 11.0, "queries_p50": 2, "queries_max": 3},
+                "b": {"p95_ms": 1.0, "queries_p50": 1, "queries_max": 1},
+            }
+        }
+        self.assertEqual(bench.compare(report, baseline), [])
+        report["results"]["a"].update(p95_ms=13.0, queries_p50=3)
+        self.assertEqual(bench.compare(report, baseline), [("a", "p95_ms", 10.0, 13.0), ("a", "queries_p50", 2, 3)])
+
+
+class InstrumentationTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+        self.client.login(email="a@b.de", password="test")
+
+    def _server_timing(self, response) -> dict:
+        timing = {}
+        for metric in response.headers["Server-Timing"].split(", "):
+            name, *params = metric.split(";")
+            timing[name] = dict(param.split("=", 1) for param in params)
+        return timing
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/sn/api/posts")
+        timing = self._server_timing(response)
+        self.assertEqual(timing["db"]["desc"], f'"{len(queries)} queries"')
+        self.assertGreater(float(timing["serializer"]["dur"]), 0)
+        self.assertEqual(float(timing["template"]["dur"]), 0)
+        self.assertGreaterEqual(float(timing["total"]["dur"]), float(timing["db"]["dur"]))
+
+        timing = self._server_timing(self.client.get("/sn/html/timeline"))
+        self.assertGreater(float(timing["template"]["dur"]), 0)
+
+    def test_metrics(self):
+        self.client.get("/sn/api/posts")
+        self.client.get("/sn/api/posts")
+        self.client.get("/does/not/exist")
+        SocialNetworkUsers.objects.filter(email="a@b.de").update(is_staff=True)
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn('socialnetwork_request_duration_seconds_count{view="sn:posts_fulllist"} 2', metrics)
+        self.assertIn('socialnetwork_request_queries_bucket{view="sn:posts_fulllist",le="+Inf"} 2', metrics)
+        self.assertIn('socialnetwork_responses_total{view="sn:posts_fulllist",status="200"} 2', metrics)
+        self.assertIn('socialnetwork_responses_total{view="unresolved",status="404"} 1', metrics)
+        self.assertIn("# TYPE socialnetwork_request_template_seconds histogram", metrics)
+        # the buckets are cumulative:
+        buckets = [
+            int(line.rsplit(" ", 1)[1])
+            for line in metrics.splitlines()
+            if line.startswith('socialnetwork_request_db_seconds_bucket{view="sn:posts_fulllist"')
+        ]
+        self.assertEqual(len(buckets), len(instrumentation.DURATION_BUCKETS) + 1)
+        self.assertEqual(buckets, sorted(buckets))
+
+    def test_metrics_access(self):
+        # also from the local host, e.g. behind a reverse proxy:
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        SocialNetworkUsers.objects.filter(email="a@b.de").update(is_staff=True)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+        self.client.logout()
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 403)
+        with override_settings(SOCIALNETWORK_METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+            self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer other").status_code, 403)
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    def test_timed_nested(self):
+        timings = instrumentation.Timings()
+        with timings.timed("serializer"):
+            with timings.timed("serializer"):
+                time.sleep(0.01)
+            time.sleep(0.01)
+        self.assertGreaterEqual(timings.durations["serializer"], 0.02)
+        self.assertLess(timings.durations["serializer"], 0.04)
+        # no current request:
+        with instrumentation.timed("serializer"):
+            pass
+
+
+class SlowQueryLogTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def _log(self, run) -> list:
+        with override_settings(SOCIALNETWORK_SLOW_QUERY_MS=0):
+            with self.assertLogs("socialnetwork.slow_queries", "WARNING") as logs:
+                run()
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def _matching(self, keyword: str) -> list:
+        # unordered, i.e. scanning the whole posts table
+        return list(Posts.objects.filter(content__icontains=keyword).order_by())
+
+    def test_record(self):
+        records = self._log(lambda: self._matching("sheep"))
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertIn("LIKE", record["sql"])
+        self.assertEqual(record["params"], ["%sheep%"])
+        self.assertGreaterEqual(record["duration_ms"], 0)
+        self.assertTrue(record["call_site"].startswith("socialnetwork/tests.py:"))
+        self.assertIn("SCAN posts", record["plan"])
+        self.assertTrue(slow_queries.is_full_scan(record["plan"]))
+
+        # writes are not explained:
+        records = self._log(lambda: Posts.objects.filter(id=1).update(content="x"))
+        self.assertEqual([record["plan"] for record in records], [None])
+
+    def test_threshold(self):
+        with override_settings(SOCIALNETWORK_SLOW_QUERY_MS=10000):
+            with self.assertNoLogs("socialnetwork.slow_queries"):
+                self._matching("sheep")
+        with override_settings(SOCIALNETWORK_SLOW_QUERY_MS=None):
+            with self.assertNoLogs("socialnetwork.slow_queries"):
+                self._matching("sheep")
+
+    def test_summary(self):
+        user = SocialNetworkUsers.objects.get(email="a@b.de")
+        records = self._log(lambda: [self._matching(keyword) for keyword in ("sheep", "the", "wine")])
+        records += self._log(lambda: [list(Posts.objects.filter(id__in=ids)) for ids in ([1, 2, 3], [4])])
+        records += self._log(lambda: list(api.timeline(user, community_mode=True)))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "slow_queries.log")
+            # the rotated backup is read as well:
+            for file_path, part in ((path, records[:2]), (path + ".1", records[2:])):
+                with open(file_path, "w") as file:
+                    file.writelines(json.dumps(record) + "\n" for record in part)
+                    file.write("not json\n")
+            groups = {group["sql"]: group for group in slow_queries.summarize(slow_queries.read_log(path))}
+            self.assertEqual(sum(group["count"] for group in groups.values()), len(records))
+            search = next(group for sql, group in groups.items() if "LIKE" in sql)
+            self.assertEqual(search["count"], 3)
+            self.assertTrue(search["full_scan"])
+            # IN lists of different lengths are one query:
+            self.assertEqual(next(group for sql, group in groups.items() if "IN (...)" in sql)["count"], 2)
+
+            out = StringIO()
+            call_command("slow_queries", path=path, top=1, stdout=out)
+            self.assertIn(f"{len(records)} slow queries", out.getvalue())
+            self.assertIn("3x", out.getvalue())
+            self.assertIn("[full scan]", out.getvalue())
+            self.assertIn("| SCAN posts", out.getvalue())
+
+            out = StringIO()
+            call_command("slow_queries", path=os.path.join(directory, "missing.log"), stdout=out)
+            self.assertIn("No slow queries", out.getvalue())
+
+
+class ProfilingTests(TestCase):
+    fixtures = ["database_dump.json"]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SOCIALNETWORK_PROFILE_DIR=directory.name, SOCIALNETWORK_PROFILE_KEEP=3)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.directory = directory.name
+        SocialNetworkUsers.objects.filter(email="a@b.de").update(is_staff=True)
+        self.client.login(email="a@b.de", password="test")
+
+    def test_cprofile(self):
+        # the sampler would distort the times measured by cProfile:
+        with patch.object(profiling, "Sampler") as sampler:
+            response = self.client.get("/sn/html/timeline?profile")
+        sampler.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        stats = pstats.Stats(self._download(response["X-Profile-Pstats"]))
+        # the view and the template rendering are in the profile:
+        functions = {name for _, _, name in stats.stats}
+        self.assertIn("timeline", functions)
+        self.assertIn("render", functions)
+        # without samples there are no collapsed stacks:
+        self.assertNotIn("X-Profile-Collapsed", response)
+
+        [description] = self.client.get("/profiles/").json()
+        self.assertEqual(description["path"], "/sn/html/timeline?profile")
+        self.assertEqual(description["mode"], "cprofile")
+        self.assertEqual(description["pstats"], response["X-Profile-Pstats"])
+        self.assertNotIn("collapsed", description)
+        self.assertEqual(self.client.get(response["X-Profile-Pstats"].replace(".pstats", ".collapsed")).status_code, 404)
+
+    def test_sample(self):
+        def timeline(*args, **kwargs):
+            time.sleep(0.05)
+            return Posts.objects.none()
+
+        with patch("socialnetwork.views.rest.timeline", timeline):
+            response = self.client.get("/sn/api/posts", HTTP_X_PROFILE="sample")
+        self.assertEqual(response.status_code, 200)
+        collapsed = self.client.get(response["X-Profile-Collapsed"])
+        self.assertEqual(collapsed["Content-Type"], "text/plain; charset=utf-8")
+        collapsed = collapsed.getvalue().decode()
+        stacks = {}
+        for line in collapsed.splitlines():
+            stack, duration = line.rsplit(" ", 1)
+            stacks[stack] = int(duration)
+        # most of the sampled time is spent sleeping in the view:
+        sleeping = sum(duration for stack, duration in stacks.items() if "timeline (socialnetwork/tests.py:" in stack)
+        self.assertGreater(sleeping, 30000)
+        self.assertGreater(sleeping, sum(stacks.values()) / 2)
+
+        # the pstats approximated from the samples:
+        stats = pstats.Stats(self._download(response["X-Profile-Pstats"]))
+        [(key, (_, _, own, cumulative, callers))] = [
+            (key, value) for key, value in stats.stats.items() if key[2] == "timeline" and "tests.py" in key[0]
+        ]
+        self.assertAlmostEqual(cumulative, sleeping / 1e6, delta=0.005)
+        self.assertLessEqual(own, cumulative)
+        self.assertTrue(callers)
+
+    def _download(self, url: str) -> str:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.directory, "download.pstats")
+        with open(path, "wb") as file:
+            file.write(response.getvalue())
+        return path
+
+    def test_not_profiled(self):
+        # no flag, a non-staff user, an unknown mode:
+        self.assertNotIn("X-Profile-Pstats", self.client.get("/sn/api/posts"))
+        self.assertEqual(self.client.get("/sn/api/posts?profile=strace").status_code, 400)
+        SocialNetworkUsers.objects.filter(email="a@b.de").update(is_staff=False)
+        self.assertNotIn("X-Profile-Pstats", self.client.get("/sn/api/posts?profile"))
+        self.assertEqual(self.client.get("/profiles/").status_code, 403)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_keep(self):
+        urls = [self.client.get("/sn/api/posts", HTTP_X_PROFILE="sample")["X-Profile-Collapsed"] for _ in range(4)]
+        self.assertEqual(len(os.listdir(self.directory)), 3 * len(profiling.SUFFIXES))
+        self.assertEqual(self.client.get(urls[0]).status_code, 404)
+        self.assertEqual(
+            [description["collapsed"] for description in self.client.get("/profiles/").json()], urls[:0:-1]
+        )
+        self.assertEqual(self.client.get("/profiles/../settings.py").status_code, 404)
@@ -3,15 +3,33 @@ from django.urls import path
 from socialnetwork.views.html import bullshitters, timeline, toggle_community_mode,join_community,leave_community, similar_users
 from socialnetwork.views.html import follow
 from socialnetwork.views.html import unfollow
-from socialnetwork.views.rest import PostsListApiView
+from socialnetwork.views.rest import (
+    BulkFollowApiView,
+    BulkUnfollowApiView,
+    CommunityMembersApiView,
+    ExpertiseAreaPostsApiView,
+    PostsListApiView,
+)
 
 app_name = "socialnetwork"
 
 urlpatterns = [
     path("api/posts", PostsListApiView.as_view(), name="posts_fulllist"),
+    path(
+        "api/expertise_areas/<int:expertise_area_id>/posts",
+        ExpertiseAreaPostsApiView.as_view(),
+        name="expertise_area_posts",
+    ),
     path("html/timeline", timeline, name="timeline"),
     path("api/follow", follow, name="follow"),
     path("api/unfollow", unfollow, name="unfollow"),
+    path("api/follow/bulk", BulkFollowApiView.as_view(), name="follow_bulk"),
+    path("api/unfollow/bulk", BulkUnfollowApiView.as_view(), name="unfollow_bulk"),
+    path(
+        "api/communities/<int:community_id>/members",
+        CommunityMembersApiView.as_view(),
+        name="community_members",
+    ),
 
       # Routes added for Task 6–8
     # T6
@@ -1,15 +1,20 @@
 from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest
 from django.shortcuts import render, redirect
 from django.urls import reverse
+from django.utils.http import urlencode
 from django.views.decorators.http import require_http_methods
 
 from fame.models import ExpertiseAreas, Fame, FameLevels
-from socialnetwork import api
-from socialnetwork.api import _get_social_network_user
+from socialnetwork import api, pagination, similarity_table
 from socialnetwork.models import SocialNetworkUsers
 from socialnetwork.serializers import PostsSerializer
 
 
+# number of users shown per expertise area on the overview of the bullshitters page:
+BULLSHITTERS_PER_AREA = 10
+
+
 @require_http_methods(["GET"])
 @login_required
 def timeline(request):
@@ -19,31 +24,63 @@ def timeline(request):
 
     # get extra URL parameters
     keyword = request.GET.get("search", "")
+    search_mode = request.GET.get("mode", "substring")
     published = request.GET.get("published", True)
     error = request.GET.get("error", None)
+    cursor = request.GET.get("cursor", None)
+    expertise_area_id = request.GET.get("expertise_area", None)
+    limit = pagination.DEFAULT_PAGE_SIZE
 
-    user = _get_social_network_user(request.user)
+    user = request.social_network_user
     community_mode = request.session['community_mode']
 
-    # determine post queryset
-    if keyword and keyword != "":
-        posts = api.search(keyword, published=published)
-    else:
-        posts = api.timeline(user, published=published)
-        if community_mode:
+    # determine post queryset, one page at a time
+    expertise_area = None
+    try:
+        if keyword and keyword != "":
+            posts = api.search(keyword, published=published, cursor=cursor, limit=limit, mode=search_mode)
+        elif expertise_area_id is not None:
+            # the posts of an expertise area including its descendant areas
+            expertise_area = ExpertiseAreas.objects.get(id=int(expertise_area_id))
+            posts = api.expertise_area_feed(expertise_area, cursor=cursor, limit=limit)
+        elif community_mode:
             # filter to only include posts from users who share at least one community
-            community_ids = user.communities.values_list("id", flat=True)
-            posts = posts.filter(author__communities__id__in=community_ids).distinct()
+            community_ids = [community.id for community in user.communities.all()]
+            posts = api.timeline(user, published=published).filter(author__communities__id__in=community_ids).distinct()
+            posts = pagination.paginate_posts(posts, cursor, limit)
+        else:
+            posts = api.timeline(user, published=published, cursor=cursor, limit=limit)
+        posts = list(PostsSerializer.setup_eager_loading(posts))
+    except (ValueError, ExpertiseAreas.DoesNotExist) as e:
+        return HttpResponseBadRequest(str(e))
+
+    # link to the next page keeps all other parameters,
+    # ranked search results are ordered by relevance and only show the best matches:
+    next_page_url = None
+    next_cursor = pagination.next_cursor(posts, limit)
+    if next_cursor is not None and not (keyword and search_mode == "ranked"):
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_page_url = reverse("sn:timeline") + "?" + params.urlencode()
 
     context = {
         "posts": PostsSerializer(posts, many=True).data,
+        "next_page_url": next_page_url,
         "searchkeyword": keyword,
+        "search_mode": search_mode,
+        "expertise_area": expertise_area,
         "error": error,
-        "followers": list(api.follows(user).values_list('id', flat=True)),
+        "followers": list(user.followed_ids),
         "community_mode": community_mode,
         "joined_communities": user.communities.all(),
-        "eligible_communities": ExpertiseAreas.objects.exclude(id__in=user.communities.all()).filter(
-            id__in=api.fame(user)[1].filter(fame_level__numeric_value__gte=100).values_list('expertise_area_id', flat=True)
+        # the communities and the fame profile are loaded along with the user, see api._get_request_user
+        "eligible_communities": sorted(
+            (
+                fame.expertise_area
+                for fame in user.fame_profile.values()
+                if fame.fame_level.numeric_value >= 100 and fame.expertise_area not in user.communities.all()
+            ),
+            key=lambda expertise_area: expertise_area.id,
         ),
     }
 
@@ -53,7 +90,7 @@ def timeline(request):
 @require_http_methods(["POST"])
 @login_required
 def follow(request):
-    user = _get_social_network_user(request.user)
+    user = request.social_network_user
     user_to_follow = SocialNetworkUsers.objects.get(id=request.POST.get("user_id"))
     api.follow(user, user_to_follow)
     return redirect(reverse("sn:timeline"))
@@ -62,7 +99,7 @@ def follow(request):
 @require_http_methods(["POST"])
 @login_required
 def unfollow(request):
-    user = _get_social_network_user(request.user)
+    user = request.social_network_user
     user_to_unfollow = SocialNetworkUsers.objects.get(id=request.POST.get("user_id"))
     api.unfollow(user, user_to_unfollow)
     return redirect(reverse("sn:timeline"))
@@ -71,21 +108,34 @@ def unfollow(request):
 @require_http_methods(["GET"])
 @login_required
 def bullshitters(request):
-    user = _get_social_network_user(request.user)
-
-    # we call the bullshitters function in the api to get the bullshitters dictionary
-    bs_dict = api.bullshitters()
-
-    # now we transform the dictionary into a list of 
-    bs_list = [
-        {
-            "expertise_area": expertise_area_label,
-            "entries": entries
-        }
-        for expertise_area_label, entries in bs_dict.items()
-    ]
-
-    
+    user = request.social_network_user
+
+    # without an expertise area, the lowest ranked users of every expertise area are shown,
+    # with an expertise area, all of its users are shown one page at a time
+    expertise_area_id = request.GET.get("expertise_area", None)
+    cursor = request.GET.get("cursor", None)
+    try:
+        if expertise_area_id is None:
+            limit = pagination.parse_limit(request.GET.get("limit", None), default=BULLSHITTERS_PER_AREA)
+            pages = [(area, entries, None) for area, entries in api.bullshitters(limit=limit).items()]
+        else:
+            limit = pagination.parse_limit(request.GET.get("limit", None))
+            expertise_area = ExpertiseAreas.objects.get(id=int(expertise_area_id))
+            pages = [(expertise_area, *api.bullshitters_in(expertise_area, cursor=cursor, limit=limit))]
+    except (ValueError, ExpertiseAreas.DoesNotExist) as e:
+        return HttpResponseBadRequest(str(e))
+
+    # now we transform the pages into a list, each with a link to the (next) page of the expertise area
+    bs_list = []
+    for expertise_area, entries, next_cursor in pages:
+        more_url = None
+        if expertise_area_id is None and len(entries) == limit:
+            more_url = reverse("sn:bullshitters") + "?" + urlencode({"expertise_area": expertise_area.id})
+        elif next_cursor is not None:
+            params = request.GET.copy()
+            params["cursor"] = next_cursor
+            more_url = reverse("sn:bullshitters") + "?" + params.urlencode()
+        bs_list.append({"expertise_area": expertise_area, "entries": entries, "more_url": more_url})
 
     # we render the bullshitters html file..
 
@@ -103,7 +153,7 @@ def toggle_community_mode(request):
 @login_required
 def join_community(request):
     # get the currently logged-in social network user
-    user = _get_social_network_user(request.user)
+    user = request.social_network_user
 
     # extract the community id from the form data (submitted via POST)
     community_id = request.POST.get("community_id")
@@ -112,10 +162,10 @@ def join_community(request):
     community = ExpertiseAreas.objects.get(id=community_id)
 
     # check if user has fame level of at least 100 (super pro or higher) in this area
-    fame_qs = api.fame(user)[1].filter(expertise_area=community, fame_level__numeric_value__gte=100)
+    fame = user.fame_profile.get(community.id)
 
     # if the user is eligible (fame level >= 100), allow them to join the community
-    if fame_qs.exists():
+    if fame is not None and fame.fame_level.numeric_value >= 100:
         api.join_community(user, community)
 
     # redirect back to the timeline regardless of result
@@ -126,11 +176,10 @@ def join_community(request):
 @require_http_methods(["POST"])
 @login_required
 def leave_community(request):
-    user = _get_social_network_user(request.user)
+    user = request.social_network_user
     community_id = request.POST.get("community_id")
     community = ExpertiseAreas.objects.get(id=community_id)
-    if community in user.communities.all():
-        api.leave_community(user, community)
+    api.leave_community(user, community)
     return redirect(reverse("sn:timeline"))
 
 # displays users similar to the current user.
@@ -138,6 +187,6 @@ def leave_community(request):
 @require_http_methods(["GET"])
 @login_required
 def similar_users(request):
-    user = _get_social_network_user(request.user)
-    similar = api.similar_users(user) 
+    user = request.social_network_user
+    similar = api.similar_users(user, limit=similarity_table.LIST_SIZE)
     return render(request, "similar_users.html", {"similar_users": similar})
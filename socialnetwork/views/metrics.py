@@ -0,0 +1,25 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from socialnetwork import instrumentation
+
+
+def _has_token(request) -> bool:
+    token = getattr(settings, "SOCIALNETWORK_METRICS_TOKEN", None)
+    if not token:
+        return False
+    scheme, _, credentials = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """The aggregated request metrics of this process in the Prometheus text format, for staff users and scrapers
+    sending settings.SOCIALNETWORK_METRICS_TOKEN as bearer token."""
+    if not request.user.is_staff and not _has_token(request):
+        raise PermissionDenied
+    return HttpResponse(instrumentation.metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
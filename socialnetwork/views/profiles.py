@@ -0,0 +1,49 @@
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from socialnetwork import profiling
+
+CONTENT_TYPES = {
+    "pstats": "application/octet-stream",
+    "collapsed": "text/plain; charset=utf-8",
+    "json": "application/json",
+}
+
+
+@require_http_methods(["GET"])
+def profiles(request):
+    """The stored request profiles (see socialnetwork.profiling), newest first, with their download URLs. For staff users."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(
+        [
+            {
+                **description,
+                **{
+                    suffix: reverse("profile", args=[description["id"], suffix])
+                    for suffix in profiling.DOWNLOADS[description["mode"]]
+                },
+            }
+            for description in profiling.list_profiles()
+        ],
+        safe=False,
+    )
+
+
+@require_http_methods(["GET"])
+def profile(request, profile_id, suffix):
+    """Download a file of a stored profile: its pstats (load with pstats.Stats), collapsed stacks ("sample" mode only,
+    render with flamegraph.pl or speedscope) or description. For staff users."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    path = profiling.profile_path(profile_id, suffix)
+    if path is None:
+        raise Http404
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=suffix != "json",
+        filename=path.name,
+        content_type=CONTENT_TYPES[suffix],
+    )
@@ -1,32 +1,56 @@
 from django.contrib.auth import logout
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from rest_framework import status, permissions
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from socialnetwork import api
-from socialnetwork.api import timeline, _get_social_network_user
-from socialnetwork.serializers import PostsSerializer
+from fame.models import ExpertiseAreas
+from socialnetwork import api, pagination, streaming
+from socialnetwork.api import timeline
+from socialnetwork.renderers import FastJSONRenderer
+from socialnetwork.serializers import PostsSerializer, serialize_posts
 
 
 class PostsListApiView(APIView):
     # check permission if user is authenticated
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
 
     # 1. List all social network posts through a GET call
     def get(self, request, *args, **kwargs):
         """
-        List all posts items
+        List all posts items. If the query parameter cursor or limit is given, a single page is returned as
+        {"results": [...], "next_cursor": ...}, pass next_cursor as cursor to get the next page.
+        With the query parameter stream=1, the list of all posts items is streamed, see socialnetwork.streaming.
         """
-        posts = timeline(_get_social_network_user(request.user))
-        serializer = PostsSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        user = request.social_network_user
+        cursor = request.query_params.get("cursor", None)
+        limit = request.query_params.get("limit", None)
+        if cursor is None and limit is None:
+            if streaming.wants_stream(request):
+                posts = PostsSerializer.setup_eager_loading(timeline(user))
+                return streaming.streaming_response(
+                    request, streaming.json_array(posts, lambda chunk: PostsSerializer(chunk, many=True).data)
+                )
+            # read-only, use the fast path of PostsSerializer
+            return Response([post.data for post in serialize_posts(timeline(user))], status=status.HTTP_200_OK)
+
+        try:
+            limit = pagination.parse_limit(limit)
+            posts = serialize_posts(timeline(user, cursor=cursor, limit=limit))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"results": [post.data for post in posts], "next_cursor": pagination.next_cursor(posts, limit)},
+            status=status.HTTP_200_OK,
+        )
 
     # 2. Create a post in the social network through a POST call
     def post(self, request, *args, **kwargs):
         ret, _expertise_areas, redirect_to_logout = api.submit_post(
-            user=_get_social_network_user(request.user),
+            user=request.social_network_user,
             content=request.data.get("text"),
         )
         if redirect_to_logout:
@@ -36,3 +60,111 @@ class PostsListApiView(APIView):
 
         assert request.user.is_authenticated is True
         return redirect(reverse("sn:timeline"))
+
+
+class ExpertiseAreaPostsApiView(APIView):
+    # check permission if user is authenticated
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, expertise_area_id, *args, **kwargs):
+        """
+        List the published posts of an expertise area including its descendant areas, one page at a time as
+        {"results": [...], "next_cursor": ...}, pass next_cursor as cursor to get the next page.
+        """
+        expertise_area = get_object_or_404(ExpertiseAreas, id=expertise_area_id)
+        try:
+            limit = pagination.parse_limit(request.query_params.get("limit", None))
+            posts = api.expertise_area_feed(
+                expertise_area, cursor=request.query_params.get("cursor", None), limit=limit
+            )
+            posts = serialize_posts(posts)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"results": [post.data for post in posts], "next_cursor": pagination.next_cursor(posts, limit)},
+            status=status.HTTP_200_OK,
+        )
+
+
+# maximum number of ids per bulk request:
+MAX_BULK_SIZE = 1000
+
+
+def _parse_user_ids(data) -> list:
+    user_ids = data.get("user_ids", None)
+    if not isinstance(user_ids, list) or not all(
+        isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids
+    ):
+        raise ValueError("user_ids has to be a list of user ids")
+    if len(user_ids) > MAX_BULK_SIZE:
+        raise ValueError(f"At most {MAX_BULK_SIZE} user ids are allowed per request")
+    return user_ids
+
+
+def _bulk_response(outcomes: dict) -> Response:
+    return Response(
+        {"results": [{"user_id": user_id, "outcome": outcome} for user_id, outcome in outcomes.items()]},
+        status=status.HTTP_200_OK,
+    )
+
+
+class BulkFollowApiView(APIView):
+    # check permission if user is authenticated
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Follow the users given as {"user_ids": [...]} in a single transaction. Returns the outcome per user as
+        {"results": [{"user_id": ..., "outcome": ...}, ...]}, see api.follow_many.
+        """
+        try:
+            user_ids = _parse_user_ids(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _bulk_response(api.follow_many(request.social_network_user, user_ids))
+
+
+class BulkUnfollowApiView(APIView):
+    # check permission if user is authenticated
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Unfollow the users given as {"user_ids": [...]} in a single transaction, see BulkFollowApiView and
+        api.unfollow_many.
+        """
+        try:
+            user_ids = _parse_user_ids(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _bulk_response(api.unfollow_many(request.social_network_user, user_ids))
+
+
+class CommunityMembersApiView(APIView):
+    # enrolling other users is restricted to staff, e.g. for onboarding and data migrations
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, community_id, *args, **kwargs):
+        """
+        Add the users given as {"user_ids": [...]} to the community in a single transaction. Returns the outcome per
+        user as {"results": [{"user_id": ..., "outcome": ...}, ...]}, see api.add_community_members.
+        """
+        community = get_object_or_404(ExpertiseAreas, id=community_id)
+        try:
+            user_ids = _parse_user_ids(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _bulk_response(api.add_community_members(community, user_ids))
+
+    def delete(self, request, community_id, *args, **kwargs):
+        """
+        Remove the users given as {"user_ids": [...]} from the community in a single transaction, see post and
+        api.remove_community_members.
+        """
+        community = get_object_or_404(ExpertiseAreas, id=community_id)
+        try:
+            user_ids = _parse_user_ids(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return _bulk_response(api.remove_community_members(community, user_ids))